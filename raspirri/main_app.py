@@ -27,14 +27,15 @@ THE SOFTWARE.
 # pylint: disable=too-few-public-methods,redefined-outer-name
 
 import argparse
-import subprocess
+import json
 import os
 import sys
 import time
 from threading import Thread
+from datetime import datetime, timezone
 
 from distutils.util import strtobool
-from typing import Optional
+from typing import List, Optional, Union
 
 import uvicorn
 
@@ -49,11 +50,11 @@ from loguru import logger
 from raspirri.server.helpers import Helpers
 from raspirri.server.services import Services
 from raspirri.server.mqtt import Mqtt
-from raspirri.server.const import ARCH, get_machine_architecture, RPI_SERVER_INIT_FILE
+from raspirri.server.simulator import ScheduleSimulator
+from raspirri.server.const import ARCH, get_machine_architecture, RPI_SERVER_INIT_FILE, UPCOMING_EVENTS
 
 if ARCH == "arm":
     from raspirri.ble.wifi import init_ble
-    from RPi import GPIO as GPIO  # pylint: disable=import-error,useless-import-alias
 
 INVALID_DATA = "Invalid data: Unable to process the provided data"
 
@@ -90,6 +91,28 @@ class ValveData(BaseModel):
     valve: str = None
 
 
+class PauseData(BaseModel):
+    """Pause data model"""
+
+    until: Optional[Union[str, int, float]] = None
+
+
+class RunItem(BaseModel):
+    """Manual run data model"""
+
+    out: Union[int, str]
+    min: int
+
+
+class RunData(BaseModel):
+    """Manual runs data model"""
+
+    runs: Optional[List[RunItem]] = None
+    out: Optional[Union[List[Union[int, str]], int, str]] = None
+    min: Optional[int] = None
+    cancel: Optional[bool] = None
+
+
 class BleData(BaseModel):
     """Ble data model"""
 
@@ -200,6 +223,57 @@ async def turn(data: ValveData):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)) from ex
 
 
+@app.get("/api/schedule")
+async def schedule(count: int = UPCOMING_EVENTS, valve: str = None):
+    """Upcoming scheduled events API call."""
+    try:
+        if count < 0:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=INVALID_DATA)
+        return JSONResponse(status_code=status.HTTP_200_OK, content=services.get_schedule(count, valve))
+    except HTTPException:
+        raise
+    except Exception as ex:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)) from ex
+
+
+@app.get("/api/pause")
+async def get_pause():
+    """Programs pause status API call."""
+    try:
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"paused_until": services.get_paused_until()})
+    except Exception as ex:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)) from ex
+
+
+@app.post("/api/pause")
+async def pause(data: PauseData):
+    """Pause programs until a moment, or resume them without a moment, API call."""
+    try:
+        if data.until:
+            paused_until = services.pause_programs(data.until)
+        else:
+            services.resume_programs()
+            paused_until = None
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"paused_until": paused_until})
+    except (ValueError, TypeError, PydanticValidationError) as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=INVALID_DATA) from exc
+    except Exception as ex:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)) from ex
+
+
+@app.post("/api/run")
+async def run(data: RunData):
+    """Timed manual runs API call."""
+    try:
+        runs = [{"out": item.out, "min": item.min} for item in data.runs] if data.runs is not None else None
+        json_data = {"runs": runs, "out": data.out, "min": data.min, "cancel": data.cancel}
+        return JSONResponse(status_code=status.HTTP_200_OK, content=services.run_valves(json_data))
+    except (KeyError, ValueError, TypeError, PydanticValidationError) as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=INVALID_DATA) from exc
+    except Exception as ex:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)) from ex
+
+
 @app.get("/api/check_mqtt")
 async def check_mqtt():
     """Save Check MQTT API call."""
@@ -229,14 +303,8 @@ def web_server():
 
 
 def setup_gpio():
-    """Setup GPIO."""
-    if ARCH == "arm":
-        GPIO.setwarnings(False)
-        # Use physical pin numbers
-        GPIO.cleanup()
-        GPIO.setmode(GPIO.BOARD)
-        # Set up header pin 11 (GPIO17) as an output
-        GPIO.setup(11, GPIO.OUT)
+    """Setup the GPIO pins of the valves as outputs."""
+    Helpers().gpio.setup(Helpers().pin_map.values())
 
 
 def parse_arguments():
@@ -248,10 +316,34 @@ def parse_arguments():
         with the value of the "command" argument accessible through the `command` attribute.
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("command", choices=["ble", "mqtt"], help="The command to execute")
+    parser.add_argument("command", choices=["ble", "mqtt", "simulate"], help="The command to execute")
+    parser.add_argument("--programs", help="JSON file with the programs to simulate")
+    parser.add_argument("--weeks", type=int, default=1, help="The number of weeks to simulate")
     return parser.parse_args()
 
 
+def simulate(programs_file, weeks):
+    """
+    Simulate programs against a virtual clock and write their per-valve timeline and totals to the standard output as JSON.
+
+    Parameters:
+        programs_file (str): A JSON file with a program or a list of programs.
+        weeks (int): The number of weeks to simulate.
+
+    Returns:
+        dict: The simulation result.
+    """
+    with open(programs_file, encoding="utf-8") as json_file:
+        programs = json.load(json_file)
+    if isinstance(programs, dict):
+        programs = [programs]
+    simulator = ScheduleSimulator(programs)
+    result = simulator.run(datetime.now(timezone.utc), weeks)
+    result["weeks_per_second"] = simulator.benchmark(weeks)
+    sys.stdout.write(json.dumps(result, indent=2) + "\n")
+    return result
+
+
 def main():
     """
     The main function is the entry point of the program.
@@ -272,28 +364,31 @@ def main():
 
     try:
         logger.info("Initializing main...")
-        logger.debug("Setting timezone to UTC")
-        subprocess.run(["/usr/bin/timedatectl", "set-timezone", "UTC"], check=True)
 
+        args = parse_arguments()
         # Remove the default handler
         logger.remove()
         # Assuming 'LOGLEVEL' is set in the environment variables
         log_level = os.environ.get("LOGLEVEL", "DEBUG")
-        # Only add the logger once
+        # Only add the logger once, to the standard error when the simulation writes its JSON result to the standard output
         logger.add(
-            sys.stdout,
+            sys.stderr if args.command == "simulate" else sys.stdout,
             colorize=True,
             format="<green>{time:YYYY-MM-DDTHH:mm:ss.SSS}</green> | <level>{level}</level> \
                 | <yellow>{module}:{function}:{line}</yellow> | <level>{message}</level>",
             level=log_level,
         )
 
-        args = parse_arguments()
         if args.command == "ble":
             init_ble()
         elif args.command == "mqtt":
             Helpers().load_toggle_statuses_from_file()
             setup_gpio()
+            # schedule the local stored programs before connecting to the MQTT broker
+            try:
+                services.bootstrap_schedule()
+            except Exception as exception:
+                logger.error(f"Error bootstrapping schedule: {exception}")
             mqtt_instance = Mqtt()
             mqtt_instance.start_mqtt_thread()
             logger.debug(f"Waiting to initialize MQTT client..........{mqtt_instance.client}")
@@ -305,6 +400,8 @@ def main():
             # signal.signal(signal.SIGINT, Mqtt.on_shutdown(Mqtt.client, None, None))
             web_thread = Thread(target=web_server(), daemon=True, name="Web_Main_Thread")
             web_thread.start()
+        elif args.command == "simulate":
+            simulate(args.programs, args.weeks)
         elif args.command == "arch":
             logger.debug(f"CPU Architecture: {get_machine_architecture()}")
             return
@@ -0,0 +1,650 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# pylint: disable=too-many-locals
+
+import json
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from loguru import logger
+from raspirri.server.exceptions import DayValueException, LocationValueException, TimezoneValueException
+from raspirri.server.const import DAYS, RECURRENCE_FIELDS, LATITUDE, LONGITUDE
+from raspirri.server.schedule import (
+    ON,
+    OFF,
+    MINUTES_PER_WEEK,
+    EventTable,
+    CompiledProgram,
+    RunCalendar,
+    find_overlaps,
+    format_minute_of_week,
+    minute_of_week,
+)
+from raspirri.server.solar import parse_solar_start, solar_table
+
+
+class ProgramCompiler:
+    """
+    The `ProgramCompiler` class compiles the JSON data of programs into their scheduled
+    events and validates them. It keeps no state and touches neither the scheduler nor
+    the stores, so programs can be compiled without scheduling them, e.g. to simulate them.
+    """
+
+    def get_budget_percent(self, valve, month):  # pylint: disable=unused-argument
+        """
+        Get the water budget percentage that scales the cycles of a valve in a month.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - month (int): The month, 1 to 12.
+
+        Returns:
+        int: The water budget percentage, always 100 as programs are compiled without a budget.
+        """
+        return 100
+
+    def convert_12h_to_24h(self, time_12h):
+        """
+        Convert a 12-hour time string to a 24-hour time string if 'am' or 'pm' is present.
+
+        Parameters:
+        - time_12h (str): A string representing the time in 12-hour format (e.g., '03:45 PM').
+
+        Returns:
+        - str or None: If 'am' or 'pm' is present, returns a string representing the time in 24-hour format (e.g., '15:45').
+                    If 'am' or 'pm' is not present, returns None.
+
+        Example:
+        >>> convert_12h_to_24h('03:45 PM')
+        '15:45'
+        >>> convert_12h_to_24h('10:30 am')
+        '10:30'
+        >>> convert_12h_to_24h('08:15')
+        None
+        """
+        logger.info(f"Checking whether start_hour should change: {time_12h}")
+        # Convert the input string to lowercase for case-insensitive check
+        time_12h = time_12h.lower()
+        time_24h = time_12h
+        if "am" in time_12h or "pm" in time_12h:
+            # Parse the 12-hour time string
+            time_obj = datetime.strptime(time_12h, "%I:%M %p")
+            # Format the time object as a 24-hour time string
+            time_24h = time_obj.strftime("%H:%M")
+        logger.info(f"Checking whether start_hour changed: {time_24h}")
+        return time_24h
+
+    def convert_to_utc(self, start_hour, tz_offset):
+        """
+        Converts a given start hour in a specific time zone to Coordinated Universal Time (UTC).
+
+        Args:
+            start_hour (int): The starting hour in the local time zone.
+            tz_offset (int): The time zone offset in hours. Positive values for time zones ahead of UTC,
+                            negative values for time zones behind UTC.
+
+        Returns:
+            Tuple[int, int]: A tuple containing the adjusted hour in UTC and the number of days passed.
+                            The adjusted hour is in the range [0, 23], and the days_passed is -1, 0, or 1
+                            indicating whether the adjusted hour falls before, within, or after the current day.
+
+        Example:
+            For a local start_hour of 10 and tz_offset of -5 (Eastern Standard Time),
+            convert_to_utc(10, -5) may return (5, 0), indicating that the adjusted UTC hour is 5 with no days passed.
+
+        Note:
+            The method assumes a 24-hour clock format.
+        """
+        logger.info(f"Checking whether start_hour should change: {start_hour}, tz_offset: {tz_offset}")
+        # Calculate the adjusted hour
+        adjusted_hour = start_hour - tz_offset
+        if adjusted_hour < 0:
+            days_passed = -1
+        elif adjusted_hour >= 24:
+            days_passed = 1
+        else:
+            days_passed = 0
+        adjusted_hour = adjusted_hour % 24
+        return adjusted_hour, days_passed
+
+    def get_previous_day(self, current_day):
+        """
+        Returns the name of the previous day based on the given current day.
+
+        Parameters:
+        - current_day (str): The name of the current day (e.g., 'mon').
+
+        Returns:
+        str: The name of the previous day.
+        """
+        # Find the index of the current day
+        current_index = DAYS.index(current_day)
+        # Calculate the index of the previous day
+        previous_index = (current_index - 1) % len(DAYS)
+        # Get the name of the previous day
+        previous_day = DAYS[previous_index]
+        return previous_day
+
+    def get_next_day(self, current_day):
+        """
+        Returns the name of the next day based on the given current day.
+
+        Parameters:
+        - current_day (str): The name of the current day (e.g., 'mon').
+
+        Returns:
+        str: The name of the next day.
+        """
+        # Find the index of the current day
+        current_index = DAYS.index(current_day)
+        # Calculate the index of the next day
+        next_index = (current_index + 1) % len(DAYS)
+        # Get the name of the next day
+        next_day = DAYS[next_index]
+        return next_day
+
+    def get_start_day_hour(self, day, start_hour, tz_offset):
+        """
+        Checks if the start day or hour should be adjusted based on the provided conditions.
+
+        Parameters:
+        - day (str): The name of the current day (e.g., 'Monday').
+        - start_hour (int): The original start hour (0 to 23).
+        - tz_offset (int): The timezone offset in hours (-12 to +14).
+
+        Returns:
+        tuple: A tuple containing the adjusted day and start hour based on the provided conditions.
+        """
+        logger.info(f"Checking whether start_day should change: {day}")
+        # Convert start_hour to UTC (e.g. start_hour=0, tz_offset=2, start_hour=22)
+        start_hour, days_passed = self.convert_to_utc(start_hour, tz_offset)
+        if days_passed == 1:
+            day = self.get_next_day(day)
+        elif days_passed == -1:
+            day = self.get_previous_day(day)
+        logger.info(f"new start_day: {day}")
+        logger.info(f"new start_hour: {start_hour}")
+        return day, start_hour
+
+    def get_stop_datetime(self, day, start_hour, start_min, period):
+        """
+        Calculate the stop time for a program cycle.
+
+        Parameters:
+        - day (str): The day of the week.
+        - start_hour (int): The starting hour.
+        - start_min (int): The starting minute.
+        - period (int): The duration of the cycle in minutes.
+
+        Returns:
+        tuple: A tuple containing the stop day, stop hour, and stop minute.
+        """
+        logger.debug(f"Converting to correct day, start, stop: {day}, {start_hour}, {start_min}, {period}")
+        stop_day_index = DAYS.index(day)
+        logger.debug(f"stop_day_index {stop_day_index}")
+
+        stop_min = (start_min + period) % 60
+        logger.debug(f"stop_min {stop_min}")
+
+        if stop_min < start_min:
+            # should go to the next hour
+            stop_hour = (start_hour + 1) % 24
+            # should go to the next day
+            if stop_hour < start_hour:
+                stop_day_index = (stop_day_index + 1) % 7
+        else:
+            stop_hour = start_hour
+
+        logger.debug(f"stop_hour {stop_hour}")
+
+        stop_day = DAYS[stop_day_index]
+        logger.debug(f"stop_day: {stop_day}")
+
+        return stop_day, stop_hour, stop_min
+
+    def program_digest(self, json_data):
+        """
+        Get the digest of a program, independent of the order of its keys.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        str: The hex digest of the program.
+        """
+        return hashlib.sha1(json.dumps(json_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_program_timezone(self, json_data):
+        """
+        Get the IANA timezone of a program, if it has one. Recurring programs using tz_offset
+        get the fixed offset 'Etc/GMT' timezone, as their calendar is kept in local dates.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        str or None: The IANA name of the timezone (e.g. 'Europe/Athens'), or None for weekly programs using tz_offset.
+        """
+        zone = json_data.get("timezone")
+        if zone is None:
+            if not self.is_recurring(json_data):
+                return None
+            if not isinstance(json_data["tz_offset"], int):
+                raise TypeError(f"The variable tz_offset is not an integer: {json_data['tz_offset']}")
+            # the signs of the Etc/GMT zones are inverted: Etc/GMT-2 is UTC+2
+            zone = f"Etc/GMT{-json_data['tz_offset']:+d}"
+        try:
+            ZoneInfo(zone)
+        except (ZoneInfoNotFoundError, ValueError, TypeError) as exception:
+            raise TimezoneValueException(f"{zone} is not an IANA timezone!") from exception
+        return zone
+
+    def is_recurring(self, json_data):
+        """
+        Check whether a program recurs on dates rather than every week.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        bool: True if the program has any of the recurrence fields, False otherwise.
+        """
+        return any(field in json_data for field in RECURRENCE_FIELDS)
+
+    def get_program_days(self, json_data):
+        """
+        Get the weekdays of a program. Recurring programs without days run on any weekday.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        list: The days of the program, e.g. ['mon', 'thu'].
+        """
+        if "days" not in json_data and self.is_recurring(json_data):
+            return list(DAYS)
+        days = json_data["days"].split(",")
+        for day in days:
+            if day not in DAYS:
+                raise DayValueException(f"{day} is not correct! Accepted values: {DAYS}")
+        return days
+
+    def parse_date(self, json_data, field):
+        """
+        Parse an ISO 8601 date field of a program.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+        - field (str): The name of the field.
+
+        Returns:
+        date or None: The date, or None if the program does not have the field.
+        """
+        if json_data.get(field) is None:
+            return None
+        try:
+            return date.fromisoformat(json_data[field])
+        except (ValueError, TypeError) as exception:
+            raise DayValueException(f"{field}={json_data[field]} is not an ISO 8601 date!") from exception
+
+    def compile_calendar(self, json_data):
+        """
+        Compile the recurrence of a program into the calendar of the dates it runs on.
+
+        The recurrence fields are:
+        - every (int): Run every N days, counted from start_date.
+        - dates (str): 'odd' or 'even' to run only on odd or even dates of the month.
+        - start_date, end_date (str): The first and last ISO 8601 dates the program runs on.
+        - blackout (list): The ISO 8601 dates the program does not run on.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        RunCalendar or None: The calendar of the program, or None if the program runs every week.
+        """
+        if not self.is_recurring(json_data):
+            return None
+        every = json_data.get("every", 1)
+        if not isinstance(every, int) or every < 1:
+            raise TypeError(f"The variable every is not a positive integer: {every}")
+        parity = json_data.get("dates")
+        if parity not in (None, "odd", "even"):
+            raise DayValueException(f"dates={parity} is not correct! Accepted values: ['odd', 'even']")
+        first = self.parse_date(json_data, "start_date")
+        if every > 1 and first is None:
+            raise DayValueException(f"every={every} needs a start_date to count the days from!")
+        blackout = [self.parse_date({"blackout": day}, "blackout") for day in json_data.get("blackout", [])]
+        return RunCalendar(every, first, parity, first, self.parse_date(json_data, "end_date"), blackout)
+
+    def compile_cycle(self, valve, day, cycle, tz_offset, segment=None):  # pylint: disable=too-many-arguments
+        """
+        Compile a cycle of a program day into turn on/off events, shifted to UTC by the timezone offset.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - day (str): The day of the cycle as sent by the user.
+        - cycle (dict): The cycle, with its start time and duration in minutes.
+        - tz_offset (int): The timezone offset in hours.
+        - segment (tuple, optional): The (offset, minutes) of a run segment of the cycle. Default is the whole cycle.
+
+        Returns:
+        tuple: The turn on and turn off events of the cycle.
+        """
+        new_start_hour = self.convert_12h_to_24h(cycle["start"])
+        start_hour = new_start_hour.split(":")[0]
+        start_min = new_start_hour.split(":")[1]
+
+        day, start_hour = self.get_start_day_hour(day, int(start_hour), tz_offset)
+
+        offset, minutes = segment or (0, int(cycle["min"]))
+        start = (minute_of_week(DAYS.index(day), int(start_hour), int(start_min)) + offset) % MINUTES_PER_WEEK
+        stop = (start + minutes) % MINUTES_PER_WEEK
+        logger.info(f"Start: {day} at {start_hour}:{start_min}, minute of week: {start}, stop minute of week: {stop}")
+        return (start, valve, ON), (stop, valve, OFF)
+
+    def split_cycle(self, minutes, max_run, soak):
+        """
+        Split a cycle into run segments of at most `max_run` minutes, each followed by `soak` minutes off.
+
+        Parameters:
+        - minutes (int): The minutes of the cycle.
+        - max_run (int): The maximum minutes of a run segment, 0 for no splitting.
+        - soak (int): The minutes between the run segments.
+
+        Returns:
+        list: The (offset from the cycle start, minutes) of every run segment.
+        """
+        if not max_run or minutes <= max_run:
+            return [(0, minutes)]
+        segments = []
+        offset = 0
+        while minutes > 0:
+            segments.append((offset, min(minutes, max_run)))
+            minutes -= max_run
+            offset += max_run + soak
+        return segments
+
+    def get_cycle_and_soak(self, json_data):
+        """
+        Get the cycle and soak parameters of a program.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        tuple: The maximum minutes of a run segment (0 for no splitting) and the minutes between segments.
+        """
+        max_run = json_data.get("max_run", 0)
+        soak = json_data.get("soak", 0)
+        for name, value in (("max_run", max_run), ("soak", soak)):
+            if not isinstance(value, int) or value < 0:
+                raise TypeError(f"The variable {name} is not a non-negative integer: {value}")
+        return max_run, soak
+
+    def has_solar_starts(self, json_data):
+        """
+        Check whether a program has cycles starting relative to sunrise or sunset.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        bool: True if a cycle starts relative to the sun, False otherwise.
+        """
+        return any(parse_solar_start(cycle.get("start", "")) is not None for cycle in json_data.get("cycles", []))
+
+    def get_location(self):
+        """
+        Get the location of the device from the LATITUDE and LONGITUDE environment variables.
+
+        Returns:
+        tuple: The latitude and longitude in degrees.
+        """
+        try:
+            latitude, longitude = float(LATITUDE), float(LONGITUDE)
+        except ValueError as exception:
+            raise LocationValueException(f"LATITUDE={LATITUDE!r}, LONGITUDE={LONGITUDE!r}") from exception
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            raise LocationValueException(f"LATITUDE={LATITUDE!r}, LONGITUDE={LONGITUDE!r}")
+        return latitude, longitude
+
+    def resolve_solar_starts(self, json_data, zone, now=None):
+        """
+        Resolve the cycle starts relative to sunrise or sunset into local times, for the next date of every program day.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+        - zone (str or None): The IANA timezone of the program, or None for programs using tz_offset.
+        - now (datetime, optional): The current UTC datetime. Default is now.
+
+        Returns:
+        dict: The local 'HH:MM' start of every solar cycle, keyed by (day, start).
+        """
+        if not self.has_solar_starts(json_data):
+            return {}
+        latitude, longitude = self.get_location()
+        now = now or datetime.now(timezone.utc)
+        tzinfo = ZoneInfo(zone) if zone is not None else timezone(timedelta(hours=json_data["tz_offset"]))
+        today = now.astimezone(tzinfo).date()
+        starts = {}
+        for day in self.get_program_days(json_data):
+            date_of_day = today + timedelta(days=(DAYS.index(day) - today.weekday()) % 7)
+            midnight = datetime(date_of_day.year, date_of_day.month, date_of_day.day, tzinfo=timezone.utc)
+            for cycle in json_data["cycles"]:
+                solar = parse_solar_start(cycle["start"])
+                if solar is None:
+                    continue
+                event, offset = solar
+                minute = solar_table(latitude, longitude, date_of_day.year).event(event, date_of_day)
+                start = (midnight + timedelta(minutes=minute)).astimezone(tzinfo) + timedelta(minutes=offset)
+                starts[(day, cycle["start"])] = start.strftime("%H:%M")
+        return starts
+
+    def compile_program(self, json_data, previous=None, now=None) -> CompiledProgram:
+        """
+        Compile program cycles, reusing the events of the cycles already compiled in a previous version.
+
+        Cycles starting relative to sunrise or sunset are resolved for the next date of their day,
+        so the program changes, and only its solar cycles are compiled again, when the sun times move.
+        Cycle durations are scaled by the water budget of the valve, and a changed budget only
+        recomputes the stop events of the cycles.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+        - previous (CompiledProgram, optional): The previously compiled program of the same valve.
+        - now (datetime, optional): The current UTC datetime, resolving the solar cycles and monthly budgets. Default is now.
+
+        Returns:
+        CompiledProgram: The compiled program, or `previous` itself if the program has not changed.
+        """
+        now = now or datetime.now(timezone.utc)
+        valve = json_data["out"]
+        zone = self.get_program_timezone(json_data)
+        extra = {"budget": self.get_budget_percent(valve, now.month)}
+        solar_starts = self.resolve_solar_starts(json_data, zone, now)
+        if solar_starts:
+            extra["solar_starts"] = sorted(solar_starts.items())
+        digest = self.program_digest(dict(json_data, **extra) if extra["budget"] != 100 or solar_starts else json_data)
+        if previous is not None and previous.digest == digest:
+            return previous
+
+        priority = json_data.get("priority")
+        if priority is not None and not isinstance(priority, int):
+            raise TypeError(f"The variable priority is not an integer: {priority}")
+        max_run, soak = self.get_cycle_and_soak(json_data)
+        calendar = self.compile_calendar(json_data)
+        starts = self.cycle_starts(previous)
+        cycles = {}
+        for day in self.get_program_days(json_data):
+            # programs with a timezone are compiled in local time and converted to UTC per date
+            tz_offset = 0 if zone is not None else json_data["tz_offset"]
+            if not isinstance(tz_offset, int):
+                raise TypeError("The variable tz_offset is not an integer: {tz_offset}")
+
+            for cycle in json_data["cycles"]:
+                logger.info(f"Cycle: {cycle}")
+                minutes = self.scale_minutes(int(cycle["min"]), extra["budget"])
+                if minutes <= 0:
+                    logger.info("This cycle should not be considered to be in the program due to min <=0.")
+                    continue
+                start = solar_starts.get((day, cycle["start"]), cycle["start"])
+                base = (valve, day, start, int(cycle["min"]), zone or tz_offset)
+                segments = self.split_cycle(minutes, max_run, soak)
+                for index, segment in enumerate(segments):
+                    key = base if extra["budget"] == 100 else base + (extra["budget"],)
+                    if len(segments) > 1:
+                        key += (max_run, soak, index)
+                    cycles[key] = self.reuse_cycle(previous, key, starts.get(base) if len(segments) == 1 else None, minutes)
+                    if cycles[key] is None:
+                        cycles[key] = self.compile_cycle(valve, day, dict(cycle, start=start), tz_offset, segment)
+
+        return CompiledProgram(digest, cycles, zone, priority, calendar)
+
+    def scale_minutes(self, minutes, percent):
+        """
+        Scale the duration of a cycle by a water budget percentage, keeping at least a minute of a scaled cycle.
+
+        Parameters:
+        - minutes (int): The minutes of the cycle.
+        - percent (int): The water budget percentage.
+
+        Returns:
+        int: The scaled minutes, 0 if the cycle does not run.
+        """
+        if minutes <= 0 or percent <= 0:
+            return 0
+        return max(1, (minutes * percent + 50) // 100)
+
+    def cycle_starts(self, previous):
+        """
+        Get the start events of the unsplit cycles of a compiled program, keyed by cycle without its budget.
+
+        Parameters:
+        - previous (CompiledProgram or None): The previously compiled program.
+
+        Returns:
+        dict: The turn on event of every unsplit cycle.
+        """
+        if previous is None:
+            return {}
+        # unsplit cycles are keyed by (valve, day, start, min, zone), followed by the budget if scaled
+        return {key[:5]: events[0] for key, events in previous.cycles.items() if len(key) <= 6}
+
+    def reuse_cycle(self, previous, key, on_event, minutes):
+        """
+        Get the events of a cycle from the previous version of its program. A cycle whose duration
+        was only rescaled by the water budget keeps its start event and gets a new stop event.
+
+        Parameters:
+        - previous (CompiledProgram or None): The previously compiled program.
+        - key (tuple): The key of the cycle.
+        - on_event (tuple or None): The previous start event of the unsplit cycle, if any.
+        - minutes (int): The scaled minutes of the cycle.
+
+        Returns:
+        tuple or None: The turn on and turn off events, or None if the cycle has to be compiled.
+        """
+        if previous is not None and key in previous.cycles:
+            return previous.cycles[key]
+        if on_event is None:
+            return None
+        return on_event, ((on_event[0] + minutes) % MINUTES_PER_WEEK, on_event[1], OFF)
+
+    def program_spans(self, json_data):
+        """
+        Get the spans of the cycles of a program in local minutes of the week, as the user wrote them.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        list: (start, minutes, valve, name) tuples, the minutes running to the end of the last soaked segment.
+        """
+        solar_starts = self.resolve_solar_starts(json_data, self.get_program_timezone(json_data))
+        max_run, soak = self.get_cycle_and_soak(json_data)
+        spans = []
+        for day in self.get_program_days(json_data):
+            for cycle in json_data["cycles"]:
+                if int(cycle["min"]) <= 0:
+                    continue
+                start_hour, start_min = self.convert_12h_to_24h(solar_starts.get((day, cycle["start"]), cycle["start"])).split(":")
+                offset, minutes = self.split_cycle(int(cycle["min"]), max_run, soak)[-1]
+                start = minute_of_week(DAYS.index(day), int(start_hour), int(start_min))
+                spans.append((start, offset + minutes, json_data["out"], json_data.get("name")))
+        return spans
+
+    def validate_programs(self, programs):
+        """
+        Find the overlapping cycles of the valves and the cycles running past midnight, across all
+        programs at once. Programs that cannot be read are left to be rejected when stored.
+        Recurring programs run on dates rather than weekdays, so they are only checked for cycles running past midnight.
+
+        Parameters:
+        - programs (list): Program JSON data, e.g. as uploaded to the config topic.
+
+        Returns:
+        dict: The "overlaps" and the "wraparounds" found, in local times.
+        """
+        spans = []
+        weekly = []
+        for json_data in programs:
+            try:
+                program_spans = self.program_spans(json_data)
+                spans.extend(program_spans)
+                if not self.is_recurring(json_data):
+                    weekly.extend(program_spans)
+            except Exception as exception:
+                logger.warning(f"Not validating the program {json_data}: {exception}")
+
+        def describe(span):
+            described = {"out": span[2], "start": format_minute_of_week(span[0]), "min": span[1]}
+            if span[3]:
+                described["name"] = span[3]
+            return described
+
+        overlaps = find_overlaps(weekly)[0]
+        wraparounds = find_overlaps(spans)[1]
+        report = {
+            "overlaps": [dict(describe(span), overlaps=describe(previous)) for previous, span in overlaps],
+            "wraparounds": [dict(describe(span), until=format_minute_of_week(span[0] + span[1])) for span in wraparounds],
+        }
+        if report["overlaps"] or report["wraparounds"]:
+            logger.warning(f"Program validation: {report}")
+        return report
+
+    def compile_program_cycles(self, json_data) -> EventTable:
+        """
+        Compile program cycles into a table of UTC turn on/off events.
+
+        Parameters:
+        - json_data (dict): JSON data containing program information.
+
+        Returns:
+        EventTable: The compiled events of the program.
+        """
+        return self.compile_program(json_data).table
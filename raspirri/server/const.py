@@ -40,6 +40,10 @@ class Command(Enum):
     REBOOT_RPI = 4
     DELETE_PROGRAM = 5
     UPDATE_RPI = 6
+    SEND_SCHEDULE = 7
+    PAUSE_PROGRAMS = 8
+    RUN_VALVES = 9
+    SET_WATER_BUDGET = 10
 
 
 def load_env_variable(varname, default_value):
@@ -107,6 +111,8 @@ MQTT_END = "}"
 MQTT_OK = '"OK"'
 
 DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+# program fields of recurrences beyond the weekdays: every N days, odd/even dates, date ranges and blackout dates
+RECURRENCE_FIELDS = ["every", "dates", "start_date", "end_date", "blackout"]
 
 if not RUNNING_UNIT_TESTS:
     PROGRAM = "program_"
@@ -116,10 +122,41 @@ PROGRAM_EXT = ".json"
 
 if not RUNNING_UNIT_TESTS:
     STATUSES_FILE = "statuses.pkl"
+    STATUSES_JOURNAL = "statuses.journal"
     NETWORKS_FILE = "networks.pkl"
+    SCHEDULE_DB = "schedule.db"
 else:
     STATUSES_FILE = "test_statuses.pkl"
+    STATUSES_JOURNAL = "test_statuses.journal"
     NETWORKS_FILE = "test_networks.pkl"
+    SCHEDULE_DB = "test_schedule.db"
+# number of journaled status changes after which they are compacted into STATUSES_FILE
+JOURNAL_COMPACT_RECORDS = int(load_env_variable("JOURNAL_COMPACT_RECORDS", "500"))
+# seconds the changed statuses are coalesced before they are written
+STATUS_FLUSH_DELAY = float(load_env_variable("STATUS_FLUSH_DELAY", "0" if RUNNING_UNIT_TESTS else "1"))
+
+# seconds after which a missed program event is no longer run
+MISFIRE_GRACE_TIME = int(load_env_variable("MISFIRE_GRACE_TIME", "600"))
+# run only the latest of several missed events of a valve
+SCHEDULER_COALESCE = str(load_env_variable("SCHEDULER_COALESCE", "1")) == "1"
+
+# number of upcoming events per valve returned by the schedule query
+UPCOMING_EVENTS = int(load_env_variable("UPCOMING_EVENTS", "5"))
+# maximum number of upcoming events per valve a schedule query may ask for
+MAX_UPCOMING_EVENTS = int(load_env_variable("MAX_UPCOMING_EVENTS", "50"))
+# scheduler backend: "apscheduler" or "lite" for low-memory devices
+SCHEDULER_BACKEND = load_env_variable("SCHEDULER_BACKEND", "apscheduler")
+# maximum number of valves open at once, overlapping cycles are queued; 0 for no limit
+MAX_CONCURRENT_VALVES = int(load_env_variable("MAX_CONCURRENT_VALVES", "0"))
+# number of valves of the controller, reported as out1..outN
+VALVE_COUNT = int(load_env_variable("VALVE_COUNT", "4"))
+# JSON map of the valves to the physical (BOARD) GPIO pins driving them
+GPIO_PINS = load_env_variable("GPIO_PINS", '{"out2": 11}')
+# highest water budget percentage scaling the cycle durations
+MAX_WATER_BUDGET = int(load_env_variable("MAX_WATER_BUDGET", "300"))
+# device location in degrees, needed by cycles starting relative to sunrise or sunset
+LATITUDE = load_env_variable("LATITUDE", "")
+LONGITUDE = load_env_variable("LONGITUDE", "")
 
 MQTT_CLIENT_ID = "RaspirriV1-MQTT-Client" + str(uuid.uuid4())
 MAX_NUM_OF_BYTES_CHUNK = 512
@@ -39,3 +39,35 @@ class DayValueException(Exception):
     def __init__(self, argument_name):
         self.argument_name = argument_name
         super().__init__(f"Day is not correct: {argument_name}")
+
+
+class TimezoneValueException(Exception):
+    """Specific exception definition."""
+
+    def __init__(self, argument_name):
+        self.argument_name = argument_name
+        super().__init__(f"Timezone is not correct: {argument_name}")
+
+
+class LocationValueException(Exception):
+    """Specific exception definition."""
+
+    def __init__(self, argument_name):
+        self.argument_name = argument_name
+        super().__init__(f"Location is not correct: {argument_name}")
+
+
+class ValveValueException(Exception):
+    """Specific exception definition."""
+
+    def __init__(self, argument_name):
+        self.argument_name = argument_name
+        super().__init__(f"Valve is not correct: {argument_name}")
+
+
+class PinMapValueException(Exception):
+    """Specific exception definition."""
+
+    def __init__(self, argument_name):
+        self.argument_name = argument_name
+        super().__init__(f"Pin map is not correct: {argument_name}")
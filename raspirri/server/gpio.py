@@ -0,0 +1,160 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from loguru import logger
+from raspirri.server.const import ARCH
+from raspirri.server.exceptions import PinMapValueException
+
+if ARCH == "arm":
+    from RPi import GPIO as GPIO  # pylint: disable=import-error,useless-import-alias
+
+
+def parse_pin_map(config):
+    """
+    Parse the map of the valves to the physical GPIO pins driving them.
+
+    Parameters:
+    - config (str or dict): The map, e.g. '{"out2": 11}'. A valve may also be given by its number, e.g. '{"2": 11}'.
+
+    Returns:
+    dict: The pin of every mapped valve name, e.g. {"out2": 11}.
+
+    Raises:
+    PinMapValueException: The map is not a JSON object of pins, or two valves share a pin.
+    """
+    try:
+        pins = json.loads(config) if isinstance(config, str) else dict(config)
+        pin_map = {(f"out{valve}" if str(valve).isdigit() else str(valve)): int(pin) for valve, pin in pins.items()}
+    except (ValueError, TypeError, AttributeError) as exception:
+        raise PinMapValueException(config) from exception
+    if len(set(pin_map.values())) != len(pin_map):
+        raise PinMapValueException(config)
+    return pin_map
+
+
+class GpioBackend(ABC):
+    """
+    The `GpioBackend` class is the interface of the GPIO outputs driving the valves.
+    A write sets the levels of several pins in one call.
+    """
+
+    @abstractmethod
+    def setup(self, pins):
+        """
+        Configure pins as outputs.
+
+        Parameters:
+        - pins (iterable): The physical pin numbers.
+        """
+
+    @abstractmethod
+    def write(self, levels):
+        """
+        Set the levels of pins.
+
+        Parameters:
+        - levels (dict): The level, True for high, of every pin to set.
+        """
+
+    @abstractmethod
+    def read(self, pin):
+        """
+        Read the level of a pin.
+
+        Parameters:
+        - pin (int): The physical pin number.
+
+        Returns:
+        bool: True if the pin is high.
+        """
+
+
+class RpiGpioBackend(GpioBackend):
+    """The GPIO outputs of a Raspberry Pi, through RPi.GPIO with physical pin numbering."""
+
+    def setup(self, pins):
+        GPIO.setwarnings(False)
+        GPIO.cleanup()
+        # Use physical pin numbers
+        GPIO.setmode(GPIO.BOARD)
+        for pin in pins:
+            GPIO.setup(pin, GPIO.OUT)
+
+    def write(self, levels):
+        pins = list(levels)
+        if len(pins) == 1:
+            GPIO.output(pins[0], levels[pins[0]])
+        else:
+            # RPi.GPIO sets a list of channels in one call
+            GPIO.output(pins, [levels[pin] for pin in pins])
+        for pin in pins:
+            logger.info(f"===========> PIN {pin} Status GPIO.input: {GPIO.input(pin)}")
+
+    def read(self, pin):
+        return bool(GPIO.input(pin))
+
+
+class FakeGpioBackend(GpioBackend):
+    """
+    The `FakeGpioBackend` class keeps the pin levels in memory, for machines without GPIO.
+    It records the latest writes, so tests can check how the pins were driven.
+    """
+
+    def __init__(self, history=100):
+        """
+        Constructor
+
+        Parameters:
+        - history (int, optional): The number of latest writes recorded.
+        """
+        self.levels = {}
+        self.writes = deque(maxlen=history)
+
+    def setup(self, pins):
+        for pin in pins:
+            self.levels.setdefault(pin, False)
+
+    def write(self, levels):
+        self.levels.update(levels)
+        self.writes.append(dict(levels))
+
+    def read(self, pin):
+        return self.levels.get(pin, False)
+
+
+def create_gpio_backend():
+    """
+    Create the GPIO backend of the machine.
+
+    Returns:
+    GpioBackend: RPi.GPIO on a Raspberry Pi, otherwise the fake backend.
+    """
+    if ARCH == "arm":
+        return RpiGpioBackend()
+    return FakeGpioBackend()
@@ -35,12 +35,17 @@ import ast
 import threading
 import signal
 import configparser
+from contextlib import contextmanager
 from datetime import datetime
 import feedparser
 
 from loguru import logger
+from raspirri.server.gpio import create_gpio_backend, parse_pin_map
+from raspirri.server.journal import StateJournal
+from raspirri.server.valves import ValveBank, ValveStateStore
 from raspirri.server.const import (
     STATUSES_FILE,
+    STATUSES_JOURNAL,
     RPI_HW_ID,
     ARCH,
     WPA_SUPL_CONF_TMP,
@@ -50,11 +55,9 @@ from raspirri.server.const import (
     DUMMY_PASSKEY,
     GITHUB_FEED_URL,
     BUMP_VERSION_CFG,
+    GPIO_PINS,
 )
 
-if ARCH == "arm":
-    from RPi import GPIO as GPIO  # pylint: disable=import-error,useless-import-alias
-
 
 class Helpers:
     """
@@ -79,7 +82,12 @@ class Helpers:
         if cls.__instance is None:
             with cls.__lock:
                 cls.__instance = super().__new__(cls)  # pylint: disable=duplicate-code
-                cls._toggle_statuses = {}
+                cls._valve_state = ValveStateStore()
+                cls._journal = StateJournal(STATUSES_FILE, STATUSES_JOURNAL, volatile=("server_time", "tz", "hw_id"))
+                cls._pin_map = parse_pin_map(GPIO_PINS)
+                cls._gpio = create_gpio_backend()
+                cls._pending_pins = None
+                cls._pending_store = False
                 cls._ap_array = []
                 cls._is_connected_to_inet = False
         return cls.__instance
@@ -104,23 +112,43 @@ class Helpers:
         Outputs:
         None
         """
+        if getattr(cls, "_journal", None) is not None:
+            cls._journal.flush()
         cls.__instance = None
-        cls._toggle_statuses = {}
+        cls._valve_state = ValveStateStore()
+        cls._journal = None
+        cls._pending_pins = None
+        cls._pending_store = False
         cls._ap_array = []
         cls._is_connected_to_inet = False
 
+    @property
+    def pin_map(self):
+        """getter"""
+        return self._pin_map
+
+    @property
+    def gpio(self):
+        """getter"""
+        return self._gpio
+
+    @property
+    def journal(self):
+        """getter"""
+        return self._journal
+
     @property
     def toggle_statuses(self):
         """
         Getter method for the toggle_statuses property.
 
         Returns:
-            dict: A dictionary containing toggle statuses.
+            dict: A dictionary containing toggle statuses, converted from the valve bank.
 
         Example:
             Access toggle statuses using `instance.toggle_statuses`.
         """
-        return self._toggle_statuses
+        return self._valve_state.snapshot.to_dict()
 
     @toggle_statuses.setter
     def toggle_statuses(self, value):
@@ -133,7 +161,17 @@ class Helpers:
         Example:
             Set toggle statuses using `instance.toggle_statuses = new_statuses`.
         """
-        self._toggle_statuses = value
+        self._valve_state.replace(ValveBank.from_dict(value))
+
+    @property
+    def valve_bank(self):
+        """getter, an immutable snapshot of the valve statuses"""
+        return self._valve_state.snapshot
+
+    @property
+    def valve_state(self):
+        """getter"""
+        return self._valve_state
 
     @property
     def ap_array(self):
@@ -176,7 +214,7 @@ class Helpers:
                 valves = ast.literal_eval(valves)
             else:
                 valves = ast.literal_eval(str(valves))
-            self._toggle_statuses["valves"] = valves
+            self._valve_state.set_valves(valves)
         except Exception as exception:
             logger.error(f"Error in set_valves: {exception}")
             raise
@@ -291,7 +329,9 @@ class Helpers:
 
     def store_toggle_statuses_to_file(self):
         """
-        Store toggle statuses to a file.
+        Store toggle statuses to a file, appending only the changed statuses to the journal
+        of the statuses file after the flush delay. The server time, timezone and hardware id
+        are recomputed, so an update changing only them writes nothing.
 
         Returns:
             dict: The toggle statuses being stored.
@@ -299,7 +339,15 @@ class Helpers:
         Example:
             stored_statuses = instance.store_toggle_statuses_to_file()
         """
-        return self.store_object_to_file(STATUSES_FILE, self._toggle_statuses)
+        # under the writer lock, so a snapshot is never recorded after a newer one
+        with self._valve_state.lock:
+            statuses = self._valve_state.snapshot.to_dict()
+            if self._pending_pins is not None:
+                # stored once when the batch ends
+                self._pending_store = True
+                return statuses
+            self._journal.record(statuses)
+        return statuses
 
     def store_wifi_networks_to_file(self):
         """
@@ -340,9 +388,9 @@ class Helpers:
 
     def load_toggle_statuses_from_file(self):
         """
-        Load toggle statuses from a file and update the instance's _toggle_statuses attribute.
+        Load toggle statuses from the statuses file and its journal and update the instance's _valve_state attribute.
         """
-        self._toggle_statuses = self.load_object_from_file(STATUSES_FILE)
+        self._valve_state.replace(ValveBank.from_dict(self._journal.replay()))
 
     def load_wifi_networks_from_file(self):
         """
@@ -362,20 +410,6 @@ class Helpers:
         """
         return str(time.tzname[time.daylight])
 
-    def check_empty_toggle(self, valve):
-        """
-        Check if a toggle status is empty for a specific valve and set a default value if it is.
-
-        Args:
-            valve (str): The name of the valve.
-
-        Example:
-            instance.check_empty_toggle("out1")
-        """
-        if self._toggle_statuses.get(valve) is None:
-            self._toggle_statuses[valve] = 0
-        self._toggle_statuses[valve] = self.set_gpio_outputs(self._toggle_statuses[valve], valve)
-
     def get_toggle_statuses(self, store_file=True):
         """
         Get and update toggle statuses, system information, and store them to a file.
@@ -386,23 +420,36 @@ class Helpers:
         Example:
             updated_statuses = instance.get_toggle_statuses()
         """
-        if "valves" not in self._toggle_statuses:
-            self.set_valves([])
+        with self.batch():
+            snapshot = self._valve_state.snapshot
+            for valve in snapshot.names:
+                self.set_gpio_outputs(snapshot.get(valve), valve)
+            statuses = self.get_statuses_snapshot(snapshot)
+            if store_file:
+                self._journal.record(statuses)
 
-        self.check_empty_toggle("out1")
-        self.check_empty_toggle("out2")
-        self.check_empty_toggle("out3")
-        self.check_empty_toggle("out4")
+        logger.info(f"Valves statuses:{statuses}")
+        return statuses
 
-        self._toggle_statuses["server_time"] = str(datetime.now().strftime("%Y/%m/%d %H:%M:%S"))
-        self._toggle_statuses["tz"] = self.get_timezone()
-        self._toggle_statuses["hw_id"] = RPI_HW_ID
+    def get_statuses_snapshot(self, snapshot=None):
+        """
+        Get the toggle statuses and system information without driving the GPIO outputs or storing them,
+        from an immutable snapshot of the valves, so publishers read them without waiting for writers.
 
-        logger.info(f"Valves statuses:{self._toggle_statuses}")
-        if store_file:
-            self.store_toggle_statuses_to_file()
+        Args:
+            snapshot (ValveBank, optional): The snapshot of the valves. Default is the current one.
+
+        Returns:
+            dict: The toggle statuses.
 
-        return self._toggle_statuses
+        Example:
+            statuses = instance.get_statuses_snapshot()
+        """
+        statuses = (snapshot or self._valve_state.snapshot).to_dict()
+        statuses["server_time"] = str(datetime.now().strftime("%Y/%m/%d %H:%M:%S"))
+        statuses["tz"] = self.get_timezone()
+        statuses["hw_id"] = RPI_HW_ID
+        return statuses
 
     def set_gpio_outputs(self, status, valve):
         """
@@ -420,12 +467,14 @@ class Helpers:
         """
         status = bool(status in (1, 2))
         logger.info(f"Set Output of Valve: {valve}::{status}")
-        if ARCH == "arm":
-            if valve == "out2":
-                logger.info(f"===========> Setting PIN 11 GPIO.output...{status}")
-                # RuntimeError: Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)
-                GPIO.output(11, status)
-                logger.info(f"===========> PIN 11 Status GPIO.input: {GPIO.input(11)}")
+        pin = self._pin_map.get(valve)
+        if pin is not None:
+            with self._valve_state.lock:
+                if self._pending_pins is not None:
+                    self._pending_pins[pin] = status
+                else:
+                    logger.info(f"===========> Setting PIN {pin} GPIO.output...{status}")
+                    self._gpio.write({pin: status})
         return 1 if status is True else 0
 
     def toggle(self, status, valve):
@@ -442,12 +491,69 @@ class Helpers:
         Example:
             confirmation = instance.toggle(1, "out1")
         """
-        status = self.set_gpio_outputs(status, valve)
-        self._toggle_statuses[valve] = status
-        logger.info(f"Modified valves statuses: {self._toggle_statuses}")
-        self.store_toggle_statuses_to_file()
+        with self._valve_state.lock:
+            status = self.set_gpio_outputs(status, valve)
+            snapshot = self._valve_state.set(valve, status)
+            self.store_toggle_statuses_to_file()
+        logger.info(f"Modified valves statuses: {snapshot}")
+        return "OK"
+
+    def toggle_many(self, statuses):
+        """
+        Toggle several valves in one batch: one GPIO write and one store of the toggle statuses.
+
+        Args:
+            statuses (dict): The new status (0 or 1) of every valve to set, by valve name.
+
+        Returns:
+            str: A confirmation message.
+
+        Example:
+            confirmation = instance.toggle_many({"out1": 0, "out2": 1})
+        """
+        with self.batch():
+            for valve, status in statuses.items():
+                self.toggle(status, valve)
         return "OK"
 
+    @staticmethod
+    def batch_valves():
+        """
+        Batch the valve changes of the current Helpers instance.
+
+        Returns:
+            A context manager, see `batch`.
+        """
+        return Helpers().batch()
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the GPIO writes and toggle status stores of the valve changes made inside the context,
+        and apply them once when it ends. Batches may be nested, the outermost one applies them.
+
+        Example:
+            with instance.batch():
+                instance.toggle(0, "out1")
+                instance.toggle(1, "out2")
+        """
+        with self._valve_state.lock:
+            if self._pending_pins is not None:
+                yield
+                return
+            self._pending_pins = {}
+            self._pending_store = False
+            try:
+                yield
+            finally:
+                pins, self._pending_pins = self._pending_pins, None
+                if pins:
+                    logger.info(f"===========> Setting PINs GPIO.output...{pins}")
+                    self._gpio.write(pins)
+                if self._pending_store:
+                    self._pending_store = False
+                    self.store_toggle_statuses_to_file()
+
     @property
     def is_connected_to_inet(self):
         """
@@ -0,0 +1,210 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import os
+import pickle
+import threading
+from loguru import logger
+from raspirri.server.const import JOURNAL_COMPACT_RECORDS, STATUS_FLUSH_DELAY
+
+
+class StateJournal:  # pylint: disable=too-many-instance-attributes
+    """
+    The `StateJournal` class persists a dictionary of states as a pickled snapshot followed by an
+    append-only journal of the changed keys, one short JSON line per change, so that a change
+    appends a few bytes instead of rewriting the whole file. Once the journal holds
+    `compact_after` records, or when there is no snapshot yet, it is compacted into a new snapshot.
+    Changes are kept dirty for `flush_delay` seconds, so a burst of them is flushed in one write.
+    """
+
+    def __init__(
+        self, snapshot, journal, compact_after=JOURNAL_COMPACT_RECORDS, volatile=(), flush_delay=STATUS_FLUSH_DELAY
+    ):  # pylint: disable=too-many-arguments
+        """
+        Constructor
+
+        Parameters:
+        - snapshot (str): The pickle file of the snapshot.
+        - journal (str): The file of the journal.
+        - compact_after (int, optional): The number of journal records compacted into a new snapshot.
+        - volatile (iterable, optional): The keys that are not persisted, e.g. because they are recomputed.
+        - flush_delay (float, optional): The seconds the changes are kept before they are flushed, 0 to flush at once.
+        """
+        self._snapshot = snapshot
+        self._journal = journal
+        self._compact_after = compact_after
+        self._volatile = frozenset(volatile)
+        self._flush_delay = flush_delay
+        self._state = {}
+        self._dirty = {}
+        self._timer = None
+        self._records = 0
+        self._writes = 0
+        self._writes_avoided = 0
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        """getter"""
+        return self._snapshot
+
+    @property
+    def journal(self):
+        """getter"""
+        return self._journal
+
+    @property
+    def records(self):
+        """getter"""
+        return self._records
+
+    @property
+    def dirty(self):
+        """getter"""
+        return bool(self._dirty)
+
+    @property
+    def writes(self):
+        """getter"""
+        return self._writes
+
+    @property
+    def writes_avoided(self):
+        """getter"""
+        return self._writes_avoided
+
+    def replay(self):
+        """
+        Load the snapshot and apply the journal on top of it. A record torn by a power loss
+        ends the replay, keeping the changes before it. Dirty changes are flushed first, so
+        they are part of the replay.
+
+        Returns:
+        dict: The persisted states.
+        """
+        state = {}
+        records = 0
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._flush()
+            if os.path.exists(self._snapshot):
+                try:
+                    with open(self._snapshot, "rb") as snapshot_file:
+                        state = pickle.load(snapshot_file)
+                except Exception as exception:
+                    logger.error(f"Error loading the snapshot {self._snapshot}: {exception}")
+            if os.path.exists(self._journal):
+                with open(self._journal, encoding="utf-8") as journal_file:
+                    for line in journal_file:
+                        try:
+                            key, value = json.loads(line)
+                        except ValueError:
+                            logger.warning(f"Ignoring the torn end of the journal {self._journal}: {line!r}")
+                            break
+                        state[key] = value
+                        records += 1
+            self._state = dict(state)
+            self._dirty = {}
+            self._records = records
+        logger.info(f"Replayed {self._snapshot} and {records} records of {self._journal}: {state}")
+        return state
+
+    def record(self, state):
+        """
+        Mark the changes of the states since they were last recorded dirty and flush them after
+        the flush delay. Recording unchanged states, or changes joining ones not flushed yet,
+        counts as a write avoided.
+
+        Parameters:
+        - state (dict): The current states.
+
+        Returns:
+        int: The number of changed keys.
+        """
+        with self._lock:
+            changes = {
+                key: value
+                for key, value in state.items()
+                if key not in self._volatile and (key not in self._state or self._state[key] != value)
+            }
+            if not changes:
+                self._writes_avoided += 1
+                return 0
+            if self._dirty:
+                self._writes_avoided += 1
+            self._state.update(changes)
+            self._dirty.update(changes)
+            if self._flush_delay <= 0:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return len(changes)
+
+    def flush(self):
+        """Append the dirty changes to the journal right away."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._flush()
+
+    def _flush(self):
+        """Append the dirty changes to the journal, with the lock held."""
+        with open(self._journal, "a", encoding="utf-8") as journal_file:
+            journal_file.write("".join(json.dumps([key, value]) + "\n" for key, value in self._dirty.items()))
+        self._records += len(self._dirty)
+        self._writes += 1
+        self._dirty = {}
+        logger.debug(f"Flushed {self._journal}: {self._writes} writes, {self._writes_avoided} writes avoided")
+        if self._records >= self._compact_after or not os.path.exists(self._snapshot):
+            self._compact()
+
+    def compact(self):
+        """Write the persisted states into a new snapshot and empty the journal."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        """Compact the journal, with the lock held, including the dirty changes."""
+        # the new snapshot replaces the old one at once, so a power loss leaves either of them
+        temporary = self._snapshot + ".tmp"
+        with open(temporary, "wb") as snapshot_file:
+            pickle.dump(self._state, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary, self._snapshot)
+        with open(self._journal, "w", encoding="utf-8"):
+            pass
+        logger.info(f"Compacted {self._records} records of {self._journal} into {self._snapshot}")
+        self._dirty = {}
+        self._records = 0
@@ -0,0 +1,214 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+from loguru import logger
+from apscheduler.jobstores.base import JobLookupError
+
+
+class LiteJob:  # pylint: disable=too-few-public-methods
+    """
+    The `LiteJob` class is the job record of the `LiteScheduler`.
+    """
+
+    __slots__ = ("id", "func", "trigger", "next_run_time", "misfire_grace_time", "coalesce")
+
+    def __init__(self, job_id, func, trigger, misfire_grace_time=1, coalesce=True):  # pylint: disable=too-many-arguments
+        """
+        Constructor
+
+        Parameters:
+        - job_id (str): The unique id of the job.
+        - func (callable): The function run when the job fires.
+        - trigger (BaseTrigger): The trigger giving the fire times of the job.
+        - misfire_grace_time (int, optional): Seconds after its fire time a late run is still allowed. Default is 1.
+        - coalesce (bool, optional): Whether several missed runs are run once. Default is True.
+        """
+        self.id = job_id  # pylint: disable=invalid-name
+        self.func = func
+        self.trigger = trigger
+        self.next_run_time = None
+        self.misfire_grace_time = misfire_grace_time
+        self.coalesce = coalesce
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (id={self.id}, next_run_time={self.next_run_time})>"
+
+
+class LiteScheduler:
+    """
+    The `LiteScheduler` class is a lightweight alternative to APScheduler's `BackgroundScheduler`
+    for low-memory devices. A single thread sleeps until the earliest entry of a heap of next
+    fire times and runs due jobs inline, without executors or job stores. It implements the part
+    of the `BackgroundScheduler` API that the `SchedulerRegistry` uses.
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        """getter"""
+        return self._running
+
+    def start(self):
+        """Start the scheduler thread."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="Lite_Scheduler_Thread")
+        self._thread.start()
+
+    def shutdown(self, wait=True):
+        """
+        Stop the scheduler thread.
+
+        Parameters:
+        - wait (bool, optional): Whether to wait for the running job to finish. Default is True.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _push(self, job, now):
+        """Compute the next fire time of a job and queue it, or drop the job if it will not fire again."""
+        job.next_run_time = job.trigger.get_next_fire_time(None, now)
+        if job.next_run_time is None:
+            self._jobs.pop(job.id, None)
+            return
+        heapq.heappush(self._heap, (job.next_run_time, next(self._counter), job))
+        self._condition.notify()
+
+    def add_job(self, func, trigger, id=None, replace_existing=False, **kwargs):  # pylint: disable=redefined-builtin
+        """
+        Add a job, or replace the job with the same id.
+
+        Parameters:
+        - func (callable): The function run when the job fires.
+        - trigger (BaseTrigger): The trigger giving the fire times of the job.
+        - id (str, optional): The unique id of the job. Default is a generated id.
+        - replace_existing (bool, optional): Whether to replace a job with the same id. Default is False.
+        - kwargs: `misfire_grace_time` and `coalesce`, as accepted by APScheduler.
+
+        Returns:
+        LiteJob: The added job.
+        """
+        job = LiteJob(id or f"job_{next(self._counter)}", func, trigger, **kwargs)
+        with self._condition:
+            if job.id in self._jobs and not replace_existing:
+                raise ValueError(f"Job {job.id} already exists")
+            self._jobs[job.id] = job
+            self._push(job, datetime.now(timezone.utc))
+        return job
+
+    def remove_job(self, job_id):
+        """
+        Remove a job.
+
+        Parameters:
+        - job_id (str): The id of the job.
+        """
+        with self._condition:
+            if self._jobs.pop(job_id, None) is None:
+                raise JobLookupError(job_id)
+            self._condition.notify()
+
+    def get_job(self, job_id):
+        """
+        Get a job.
+
+        Parameters:
+        - job_id (str): The id of the job.
+
+        Returns:
+        LiteJob or None: The job, or None if there is no such job.
+        """
+        return self._jobs.get(job_id)
+
+    def get_jobs(self):
+        """
+        Get the scheduled jobs.
+
+        Returns:
+        list: The jobs, in order of next fire time.
+        """
+        with self._condition:
+            return sorted(self._jobs.values(), key=lambda job: job.next_run_time)
+
+    def _next_due(self):
+        """Wait until the earliest job is due and pop it, or return None when the scheduler is shut down."""
+        with self._condition:
+            while self._running:
+                # entries of removed or replaced jobs are dropped lazily
+                while self._heap and self._jobs.get(self._heap[0][2].id) is not self._heap[0][2]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                run_time, _, job = self._heap[0]
+                delay = (run_time - datetime.now(timezone.utc)).total_seconds()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return run_time, job
+        return None
+
+    def _run(self):
+        """Run due jobs until the scheduler is shut down."""
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            run_time, job = due
+            now = datetime.now(timezone.utc)
+            if job.misfire_grace_time is not None and now - run_time > timedelta(seconds=job.misfire_grace_time):
+                logger.warning(f"Run time of job {job.id} was missed by {now - run_time}")
+            else:
+                try:
+                    job.func()
+                except Exception as exception:
+                    logger.error(f"Error running job {job.id}: {exception}")
+            with self._condition:
+                if self._jobs.get(job.id) is job:
+                    # without coalescing every missed run time is visited in turn
+                    job.next_run_time = job.trigger.get_next_fire_time(run_time, datetime.now(timezone.utc) if job.coalesce else run_time)
+                    if job.next_run_time is None:
+                        self._jobs.pop(job.id)
+                    else:
+                        heapq.heappush(self._heap, (job.next_run_time, next(self._counter), job))
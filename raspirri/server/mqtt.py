@@ -36,6 +36,8 @@ import paho.mqtt.client as mqtt
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from raspirri.server.services import Services
+from raspirri.server.store import ProgramStore
+from raspirri.server.schedule import program_key
 from raspirri.server.const import (
     MQTT_CLIENT_ID,
     MQTT_TOPIC_STATUS,
@@ -55,6 +57,8 @@ from raspirri.server.const import (
     MQTT_HOST,
     MQTT_PORT,
     STATUSES_FILE,
+    STATUSES_JOURNAL,
+    UPCOMING_EVENTS,
 )
 from raspirri.server.helpers import Helpers
 from raspirri.server.const import Command
@@ -171,7 +175,7 @@ class Mqtt:
     @staticmethod
     def handle_file_change():
         """Implement your custom logic to handle the file change here"""
-        statuses = Helpers().get_toggle_statuses(False)
+        statuses = Helpers().get_statuses_snapshot()
         logger.info(f"{STATUSES_FILE} changed! Publishing right away Statuses to MQTT topic: {MQTT_TOPIC_STATUS}: {statuses}")
         Mqtt.publish_to_topic(Mqtt.client, MQTT_TOPIC_STATUS, str(statuses))
 
@@ -185,8 +189,10 @@ class Mqtt:
         event_handler = FileSystemEventHandler()
         event_handler.on_modified = Mqtt.on_file_change
 
-        # Start watching the specified file
-        observer.schedule(event_handler, path=os.path.abspath(STATUSES_FILE), recursive=False)
+        # Start watching the journal, every change of the statuses is appended to it
+        with open(STATUSES_JOURNAL, "a", encoding="utf-8"):
+            pass
+        observer.schedule(event_handler, path=os.path.abspath(STATUSES_JOURNAL), recursive=False)
         observer.start()
 
         try:
@@ -195,7 +201,7 @@ class Mqtt:
                 time.sleep(1)
                 logger.info(
                     f"Monitoring file: \
-{os.path.abspath(STATUSES_FILE)} for changes...If it changes, a new MQTT message will be send to {MQTT_TOPIC_STATUS}"
+{os.path.abspath(STATUSES_JOURNAL)} for changes...If it changes, a new MQTT message will be send to {MQTT_TOPIC_STATUS}"
                 )
         except KeyboardInterrupt:
             # Stop the observer when the script is interrupted
@@ -232,7 +238,7 @@ class Mqtt:
 
         if return_code == 0:
             logger.info("Connected successfully")
-            Helpers().load_toggle_statuses_from_file()
+            # the statuses are loaded once at startup, the statuses in memory are kept across reconnections
             if Mqtt().get_periodic_updates_thread() is None:
                 Mqtt().set_periodic_updates_thread(
                     Thread(daemon=True, name="PeriodicUpdatesThread", target=Mqtt.send_periodic_updates, args=(client,))
@@ -264,13 +270,19 @@ class Mqtt:
         try:
             json_data = json.loads(data)
             logger.info(f"prestored programs={json_data}")
+            # overlapping cycles and cycles running past midnight, found once for all programs
+            report = {name: found for name, found in Services().validate_programs(json_data).items() if found}
             for program in json_data:
                 logger.info(f"program={program}")
                 if program == {}:
                     Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + MQTT_OK + MQTT_END)
                     return
-                Services().store_program_cycles(program, True)
-                Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + MQTT_OK + MQTT_END)
+                services = Services()
+                services.store_program_cycles(program, True)
+                # report the cycles queued behind others to respect MAX_CONCURRENT_VALVES
+                status = {"conflicts": services.get_schedule_conflicts(), **report}
+                details = "".join(f', "{name}": {json.dumps(found)}' for name, found in status.items() if found)
+                Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + MQTT_OK + details + MQTT_END)
         except Exception as exception:
             logger.error(f"Error: {exception}")
             Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_ERR + str(exception)[0:128] + MQTT_END)
@@ -287,7 +299,7 @@ class Mqtt:
             Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_ERR + str(exception)[0:128] + MQTT_END)
 
     @staticmethod
-    def handle_command(client, data):
+    def handle_command(client, data):  # pylint: disable=too-many-branches,too-many-statements
         """Handle cmd."""
         try:
             json_data = json.loads(data)
@@ -309,18 +321,33 @@ class Mqtt:
                 Helpers().get_toggle_statuses()
             elif command == Command.SEND_PROGRAM:
                 logger.info(f"Looking for {file_path}")
-                if os.path.exists(file_path):
+                payload = ProgramStore().get_payload(program_key(valve, json_data.get("name")))
+                if payload is not None:
                     logger.info(f"{file_path} exists!")
-                    with open(file_path, encoding="utf-8") as json_file:
-                        json_data = json.load(json_file)
-                        Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, str(json_data))
+                    Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, payload)
                 else:
                     Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_ERR + file_path + " does not exist!" + MQTT_END)
             elif command == Command.DELETE_PROGRAM:
-                if not Services().delete_program(valve):
+                if not Services().delete_program(valve, json_data.get("name")):
                     Mqtt.publish_to_topic(
                         client, MQTT_TOPIC_STATUS, MQTT_STATUS_ERR + file_path + " does not exist! Cannot be deleted." + MQTT_END
                     )
+            elif command == Command.SEND_SCHEDULE:
+                schedule = Services().get_schedule(int(json_data.get("count", UPCOMING_EVENTS)), json_data.get("out"))
+                Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + json.dumps(schedule) + MQTT_END)
+            elif command == Command.PAUSE_PROGRAMS:
+                if json_data.get("until"):
+                    paused_until = Services().pause_programs(json_data["until"])
+                else:
+                    Services().resume_programs()
+                    paused_until = None
+                Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + json.dumps({"paused_until": paused_until}) + MQTT_END)
+            elif command == Command.RUN_VALVES:
+                runs = Services().run_valves(json_data)
+                Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + json.dumps(runs) + MQTT_END)
+            elif command == Command.SET_WATER_BUDGET:
+                budgets = Services().set_water_budget(json_data.get("budget"), json_data.get("out"))
+                Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + json.dumps({"budgets": budgets}) + MQTT_END)
             elif command == Command.SEND_TIMEZONE:
                 Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + str(Helpers().get_timezone() + MQTT_END))
             elif command == Command.REBOOT_RPI:
@@ -368,6 +395,7 @@ class Mqtt:
                 logger.info("Sending Periodic Updates to status topic every 10s...")
                 statuses = Helpers().get_toggle_statuses()
                 logger.info(f"Publishing Statuses to MQTT topic: {MQTT_TOPIC_STATUS}: {statuses}")
+                logger.debug(f"Statuses writes: {Helpers().journal.writes}, writes avoided: {Helpers().journal.writes_avoided}")
                 Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, str(statuses))
                 metadata = {}
                 metadata["ip_address"] = Helpers().extract_local_ip()
@@ -439,16 +467,10 @@ class Mqtt:
 
             logger.debug(f"Host: {MQTT_HOST}, Port: {MQTT_PORT}, Username: {MQTT_USER}, Password: {MQTT_PASS}")
 
-            # Find local stored programs and publish them again to config topic
-            program_data = []
-            for valve in range(1, 5):
-                json_data = Services().load_program_cycles_if_exists(valve)
-                if json_data is not None:
-                    program_data.append(json_data)
-
-            program_data = str(program_data).replace("'", '"').replace("True", '"True"').replace("False", '"False"')
+            # Publish the local stored programs, scheduled at boot, again to config topic
+            program_data = ProgramStore().config_payload()
             logger.info(f"program_data={program_data}")
-            Mqtt.publish_to_topic(client, MQTT_TOPIC_CONFIG, str(program_data))
+            Mqtt.publish_to_topic(client, MQTT_TOPIC_CONFIG, program_data)
             Mqtt.publish_to_topic(client, MQTT_TOPIC_STATUS, MQTT_STATUS_OK + MQTT_OK + MQTT_END)
 
             logger.info("Before client.loop_forever()")
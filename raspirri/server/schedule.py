@@ -0,0 +1,887 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from apscheduler.triggers.base import BaseTrigger
+from raspirri.server.const import DAYS
+
+MINUTES_PER_HOUR = 60
+MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+ON = 1
+OFF = 0
+
+
+def minute_of_week(day_index, hour, minute):
+    """
+    Get the minute of the week for a weekday, hour and minute.
+
+    Parameters:
+    - day_index (int): The weekday index, Monday being 0.
+    - hour (int): The hour (0 to 23).
+    - minute (int): The minute (0 to 59).
+
+    Returns:
+    int: The minute of the week (0 to MINUTES_PER_WEEK - 1).
+    """
+    return (day_index * MINUTES_PER_DAY + hour * MINUTES_PER_HOUR + minute) % MINUTES_PER_WEEK
+
+
+def program_key(valve, name=None):
+    """
+    Get the key of a program, unique among the programs of all valves.
+
+    Parameters:
+    - valve (int or str): The valve number.
+    - name (str, optional): The name of the program, e.g. 'morning lawn'. Default is the unnamed program.
+
+    Returns:
+    str: The valve number, followed by ':' and the name for a named program.
+    """
+    return f"{valve}:{name}" if name else str(valve)
+
+
+def program_valve(key):
+    """
+    Get the valve of a program key.
+
+    Parameters:
+    - key (str): The program key, as returned by `program_key`.
+
+    Returns:
+    str: The valve number.
+    """
+    return key.split(":", 1)[0]
+
+
+def datetime_to_epoch_minute(moment):
+    """
+    Get the number of whole minutes between the Unix epoch and an aware datetime.
+
+    Parameters:
+    - moment (datetime): The aware datetime.
+
+    Returns:
+    int: The epoch minute of the datetime.
+    """
+    return int(moment.timestamp()) // 60
+
+
+def epoch_minute_to_datetime(minute):
+    """
+    Get the UTC datetime of an epoch minute.
+
+    Parameters:
+    - minute (int): The number of whole minutes since the Unix epoch.
+
+    Returns:
+    datetime: The aware UTC datetime.
+    """
+    return datetime.fromtimestamp(minute * 60, timezone.utc)
+
+
+def datetime_to_minute_of_week(moment):
+    """
+    Get the minute of the week of a datetime.
+
+    Parameters:
+    - moment (datetime): The datetime.
+
+    Returns:
+    int: The minute of the week of the datetime.
+    """
+    return minute_of_week(moment.weekday(), moment.hour, moment.minute)
+
+
+class EventTable:
+    """
+    The `EventTable` class is a compiled schedule: a table of (minute, valve, action)
+    events sorted by minute, kept in arrays so that the next event can be found with a
+    binary search. By default the minutes are minutes of the week and the table repeats
+    every week; with no period they are epoch minutes and the table does not repeat.
+    """
+
+    __slots__ = ("_period", "_minutes", "_actions", "_valves", "_valve_keys")
+
+    def __init__(self, events=(), period=MINUTES_PER_WEEK):
+        """
+        Constructor
+
+        Parameters:
+        - events (iterable): (minute, valve, action) tuples in any order.
+        - period (int or None, optional): The minutes after which the table repeats. Default is a week.
+        """
+        # turning a valve off sorts before turning it on at the same minute
+        ordered = sorted(events, key=lambda event: (event[0] % period if period else event[0], event[2]))
+        valve_keys = []
+        for _, valve, _ in ordered:
+            if valve not in valve_keys:
+                valve_keys.append(valve)
+        self._period = period
+        self._valve_keys = tuple(valve_keys)
+        self._minutes = array("H" if period else "q", (event[0] % period if period else event[0] for event in ordered))
+        self._actions = array("B", (event[2] for event in ordered))
+        self._valves = array("B", (valve_keys.index(event[1]) for event in ordered))
+
+    def __len__(self):
+        return len(self._minutes)
+
+    def __iter__(self):
+        for index, minute in enumerate(self._minutes):
+            yield minute, self._valve_keys[self._valves[index]], self._actions[index]
+
+    def __eq__(self, other):
+        return isinstance(other, EventTable) and self._period == other.period and list(self) == list(other)
+
+    def __repr__(self):
+        return f"EventTable({list(self)})"
+
+    @property
+    def period(self):
+        """getter"""
+        return self._period
+
+    @property
+    def valves(self):
+        """getter"""
+        return self._valve_keys
+
+    @classmethod
+    def merge(cls, tables):
+        """
+        Merge several weekly event tables into one.
+
+        Parameters:
+        - tables (iterable): The event tables to merge.
+
+        Returns:
+        EventTable: A table with the events of all tables.
+        """
+        return cls(event for table in tables for event in table)
+
+    def end(self):
+        """
+        Get the UTC datetime after which the table has no more events.
+
+        Returns:
+        datetime or None: The last event of a table without a period, or None if the events repeat every period.
+        """
+        if self._period or not self._minutes:
+            return None
+        return epoch_minute_to_datetime(self._minutes[-1])
+
+    def next_minute(self, minute):
+        """
+        Find how long after a minute the next event is due, wrapping around the period.
+
+        Parameters:
+        - minute (int): The minute to search from.
+
+        Returns:
+        int or None: The minutes until the next event (0 if an event is due at that minute),
+                     or None if there is no next event.
+        """
+        if not self._minutes:
+            return None
+        if self._period:
+            minute = minute % self._period
+        index = bisect_left(self._minutes, minute)
+        if index < len(self._minutes):
+            return self._minutes[index] - minute
+        if self._period:
+            return self._minutes[0] + self._period - minute
+        return None
+
+    def events_at(self, minute):
+        """
+        Get the events scheduled at a minute.
+
+        Parameters:
+        - minute (int): The minute.
+
+        Returns:
+        list: (valve, action) tuples in dispatch order.
+        """
+        if self._period:
+            minute = minute % self._period
+        start = bisect_left(self._minutes, minute)
+        stop = bisect_right(self._minutes, minute, lo=start)
+        return [(self._valve_keys[self._valves[index]], self._actions[index]) for index in range(start, stop)]
+
+    def last_events(self, minute):
+        """
+        Get the latest event of every valve at or before a minute.
+
+        Parameters:
+        - minute (int): The minute to search back from.
+
+        Returns:
+        dict: (age in minutes, action) of the latest event, keyed by valve.
+        """
+        latest = {}
+        if self._period:
+            minute = minute % self._period
+        index = bisect_right(self._minutes, minute) - 1
+        for step in range(len(self._minutes)):
+            position = index - step
+            if position < 0:
+                if not self._period:
+                    break
+                position += len(self._minutes)
+            valve = self._valve_keys[self._valves[position]]
+            if valve not in latest:
+                age = minute - self._minutes[position]
+                latest[valve] = (age % self._period if self._period else age, self._actions[position])
+                if len(latest) == len(self._valve_keys):
+                    break
+        return latest
+
+    def minute(self, moment):
+        """
+        Get the minute of a UTC datetime in the minutes of the table.
+
+        Parameters:
+        - moment (datetime): The UTC datetime.
+
+        Returns:
+        int: The minute of the week for weekly tables, or the epoch minute for tables without a period.
+        """
+        if self._period:
+            return datetime_to_minute_of_week(moment)
+        return datetime_to_epoch_minute(moment)
+
+    def state_at(self, moment):
+        """
+        Get the action that the schedule requires for every valve at a UTC minute.
+
+        Parameters:
+        - moment (datetime): The UTC datetime.
+
+        Returns:
+        dict: The action of the latest event at or before the moment, keyed by valve.
+        """
+        return {valve: action for valve, (_, action) in self.last_events(self.minute(moment)).items()}
+
+    def minutes_until(self, moment):
+        """
+        Find how long after a UTC minute the next event is due.
+
+        Parameters:
+        - moment (datetime): The UTC datetime to search from, truncated to the minute.
+
+        Returns:
+        int or None: The minutes until the next event, or None if the table is empty.
+        """
+        return self.next_minute(self.minute(moment))
+
+    def events_on(self, moment):
+        """
+        Get the events scheduled at a UTC minute.
+
+        Parameters:
+        - moment (datetime): The UTC datetime, truncated to the minute.
+
+        Returns:
+        list: (valve, action) tuples in dispatch order.
+        """
+        return self.events_at(self.minute(moment))
+
+
+class RunCalendar:
+    """
+    The `RunCalendar` class keeps the dates on which a recurring program runs: every N days,
+    on odd or even dates, within a date range and outside blackout dates. The run dates of
+    a year are compiled once into a bitset, so that checking a date is a constant time lookup.
+    """
+
+    __slots__ = ("every", "anchor", "parity", "first", "last", "blackout", "_years")
+
+    def __init__(self, every=1, anchor=None, parity=None, first=None, last=None, blackout=()):  # pylint: disable=too-many-arguments
+        """
+        Constructor
+
+        Parameters:
+        - every (int, optional): The program runs every `every` days, counted from `anchor`. Default is every day.
+        - anchor (date, optional): The first date of the every N days recurrence. Default is `first`.
+        - parity (str, optional): 'odd' or 'even' to run only on odd or even dates of the month. Default is any date.
+        - first (date, optional): The first date the program runs on. Default is no limit.
+        - last (date, optional): The last date the program runs on. Default is no limit.
+        - blackout (iterable, optional): The dates the program does not run on.
+        """
+        self.every = every
+        self.anchor = anchor or first
+        self.parity = parity
+        self.first = first
+        self.last = last
+        self.blackout = frozenset(blackout)
+        self._years = {}
+
+    def _rules(self):
+        return (self.every, self.anchor, self.parity, self.first, self.last, tuple(sorted(self.blackout)))
+
+    def __reduce__(self):
+        return (self.__class__, self._rules())
+
+    def __eq__(self, other):
+        return isinstance(other, RunCalendar) and self._rules() == other._rules()
+
+    def __hash__(self):
+        return hash(self._rules())
+
+    def __repr__(self):
+        return f"RunCalendar{self._rules()}"
+
+    def _allows(self, day):
+        """Check the rules of the calendar for a date."""
+        if (self.first is not None and day < self.first) or (self.last is not None and day > self.last) or day in self.blackout:
+            return False
+        if self.parity is not None and day.day % 2 != (1 if self.parity == "odd" else 0):
+            return False
+        return self.every <= 1 or (day - self.anchor).days % self.every == 0
+
+    def year(self, year):
+        """
+        Get the bitset of the run dates of a year, compiling it on first use.
+
+        Parameters:
+        - year (int): The year.
+
+        Returns:
+        bytes: One bit per day of the year, January 1st being the lowest bit of the first byte.
+        """
+        bits = self._years.get(year)
+        if bits is None:
+            bits = bytearray(366 // 8 + 1)
+            day = date(year, 1, 1)
+            index = 0
+            while day.year == year:
+                if self._allows(day):
+                    bits[index >> 3] |= 1 << (index & 7)
+                day += timedelta(days=1)
+                index += 1
+            bits = self._years[year] = bytes(bits)
+        return bits
+
+    def runs_on(self, day):
+        """
+        Check whether the program runs on a date.
+
+        Parameters:
+        - day (date): The date.
+
+        Returns:
+        bool: True if the program runs on the date, False otherwise.
+        """
+        index = day.timetuple().tm_yday - 1
+        return bool(self.year(day.year)[index >> 3] >> (index & 7) & 1)
+
+
+class ZoneTable:
+    """
+    The `ZoneTable` class is the compiled schedule of a program that runs in an IANA timezone.
+    Its cycles are kept in local minutes of the week and expanded once per local year into a
+    sorted table of UTC transitions, so that daylight saving time changes keep the local start
+    times and the durations of the cycles.
+    """
+
+    __slots__ = ("_zone", "_cycles", "_calendar", "_years")
+
+    def __init__(self, zone, cycles, calendar=None):
+        """
+        Constructor
+
+        Parameters:
+        - zone (str): The IANA name of the timezone, e.g. 'Europe/Athens'.
+        - cycles (iterable): (on_event, off_event) pairs in local minutes of the week.
+        - calendar (RunCalendar, optional): The local dates the cycles run on. Default is every date.
+        """
+        self._zone = ZoneInfo(zone)
+        self._cycles = tuple(union_cycles(cycle_spans(cycles)))
+        self._calendar = calendar
+        self._years = {}
+
+    def __len__(self):
+        return 2 * len(self._cycles)
+
+    def __repr__(self):
+        if self._calendar is not None:
+            return f"ZoneTable({self._zone.key}, {list(self._cycles)}, {self._calendar})"
+        return f"ZoneTable({self._zone.key}, {list(self._cycles)})"
+
+    @property
+    def zone(self):
+        """getter"""
+        return self._zone.key
+
+    @property
+    def valves(self):
+        """getter"""
+        return list(dict.fromkeys(valve for _, _, valve in self._cycles))
+
+    def end(self):
+        """
+        Get the UTC datetime after which the table has no more transitions.
+
+        Returns:
+        datetime or None: The end of the cycles of the last date of the calendar, or None if the table runs without end.
+        """
+        if self._calendar is None or self._calendar.last is None or not self._cycles:
+            return None
+        last = self._calendar.last + timedelta(days=1)
+        local = datetime(last.year, last.month, last.day, tzinfo=self._zone)
+        return (local + timedelta(minutes=max(minutes for _, minutes, _ in self._cycles))).astimezone(timezone.utc)
+
+    def transitions(self, year):
+        """
+        Get the UTC transitions of a local year, expanding them on first use.
+
+        Parameters:
+        - year (int): The year in the timezone of the table.
+
+        Returns:
+        tuple: Arrays of the epoch minutes, valves and actions of the transitions, sorted by minute.
+        """
+        if year not in self._years:
+            events = []
+            day = date(year, 1, 1)
+            while day.year == year:
+                if self._calendar is not None and not self._calendar.runs_on(day):
+                    day += timedelta(days=1)
+                    continue
+                midnight = day.weekday() * MINUTES_PER_DAY
+                for start, minutes, valve in self._cycles:
+                    if midnight <= start < midnight + MINUTES_PER_DAY:
+                        # adding a timedelta to an aware datetime moves its wall clock time
+                        local = datetime(day.year, day.month, day.day, tzinfo=self._zone) + timedelta(minutes=start - midnight)
+                        on = datetime_to_epoch_minute(local)
+                        events.append((on, valve, ON))
+                        events.append((on + minutes, valve, OFF))
+                day += timedelta(days=1)
+            table = EventTable(events, period=None)
+            self._years = {key: value for key, value in self._years.items() if key >= year - 2}
+            self._years[year] = table
+        return self._years[year]
+
+    def minutes_until(self, moment):
+        """
+        Find how long after a UTC minute the next transition is due.
+
+        Parameters:
+        - moment (datetime): The UTC datetime to search from, truncated to the minute.
+
+        Returns:
+        int or None: The minutes until the next transition, or None if the table has no cycles.
+        """
+        if not self._cycles:
+            return None
+        year = moment.astimezone(self._zone).year
+        minute = datetime_to_epoch_minute(moment)
+        # cycles of the previous year may still have to stop in this one
+        delays = [self.transitions(other).next_minute(minute) for other in (year - 1, year, year + 1)]
+        delays = [delay for delay in delays if delay is not None]
+        return min(delays) if delays else None
+
+    def state_at(self, moment):
+        """
+        Get the action that the schedule requires for every valve at a UTC minute.
+
+        Parameters:
+        - moment (datetime): The UTC datetime.
+
+        Returns:
+        dict: The action of the latest transition at or before the moment, keyed by valve.
+        """
+        year = moment.astimezone(self._zone).year
+        minute = datetime_to_epoch_minute(moment)
+        latest = {}
+        for other in (year - 1, year):
+            for valve, (age, action) in self.transitions(other).last_events(minute).items():
+                if valve not in latest or age <= latest[valve][0]:
+                    latest[valve] = (age, action)
+        return {valve: action for valve, (_, action) in latest.items()}
+
+    def events_on(self, moment):
+        """
+        Get the transitions due at a UTC minute.
+
+        Parameters:
+        - moment (datetime): The UTC datetime, truncated to the minute.
+
+        Returns:
+        list: (valve, action) tuples in dispatch order.
+        """
+        year = moment.astimezone(self._zone).year
+        minute = datetime_to_epoch_minute(moment)
+        return self.transitions(year - 1).events_at(minute) + self.transitions(year).events_at(minute)
+
+
+class CompiledProgram:  # pylint: disable=too-few-public-methods
+    """
+    The `CompiledProgram` class keeps the digest of a program together with the
+    events compiled for each of its cycles, so that an updated program only needs
+    its new cycles compiled.
+    """
+
+    __slots__ = ("digest", "cycles", "zone", "priority", "calendar", "table")
+
+    def __init__(self, digest, cycles, zone=None, priority=None, calendar=None):  # pylint: disable=too-many-arguments
+        """
+        Constructor
+
+        Parameters:
+        - digest (str): The digest of the program JSON data.
+        - cycles (dict): The compiled (on_event, off_event) pair of every cycle, keyed by cycle.
+        - zone (str, optional): The IANA timezone of a program compiled in local time. Default is UTC.
+        - priority (int, optional): The order in which queued cycles run, lowest first. Default is the valve number.
+        - calendar (RunCalendar, optional): The local dates a recurring program runs on. Default is every week.
+        """
+        self.digest = digest
+        self.cycles = cycles
+        self.zone = zone
+        self.priority = priority
+        self.calendar = calendar
+        if zone is None and calendar is None:
+            self.table = EventTable(event for events in cycles.values() for event in events)
+        else:
+            self.table = ZoneTable(zone or "UTC", cycles.values(), calendar)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.digest}, {len(self.cycles)} cycles)>"
+
+
+def cycle_spans(cycles):
+    """
+    Get the start, duration and valve of compiled cycles.
+
+    Parameters:
+    - cycles (iterable): (on_event, off_event) pairs in minutes of the week.
+
+    Returns:
+    list: (start, minutes, valve) tuples, a cycle stopping at its start minute lasting the whole week.
+    """
+    return [(on[0], (off[0] - on[0]) % MINUTES_PER_WEEK or MINUTES_PER_WEEK, on[1]) for on, off in cycles]
+
+
+def union_cycles(cycles):
+    """
+    Union the overlapping or touching cycles of every valve within the repeating week, so that
+    a valve is turned on once and off once for every span it has to stay open.
+
+    Parameters:
+    - cycles (iterable): (start, minutes, valve) tuples in minutes of the week.
+
+    Returns:
+    list: The (start, minutes, valve) tuples of the disjoint spans, sorted by start.
+    """
+    by_valve = {}
+    for start, minutes, valve in cycles:
+        by_valve.setdefault(valve, []).append((start % MINUTES_PER_WEEK, min(minutes, MINUTES_PER_WEEK)))
+    spans = []
+    for valve, intervals in by_valve.items():
+        intervals.sort()
+        merged = []
+        for start, minutes in intervals:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], start + minutes)
+            else:
+                merged.append([start, start + minutes])
+        # a span running past the end of the week may reach the first spans of the next one
+        while len(merged) > 1 and merged[-1][1] - MINUTES_PER_WEEK >= merged[0][0]:
+            merged[-1][1] = max(merged[-1][1], merged.pop(0)[1] + MINUTES_PER_WEEK)
+        spans.extend((start, min(stop - start, MINUTES_PER_WEEK), valve) for start, stop in merged)
+    return sorted(spans, key=lambda span: (span[0], str(span[2])))
+
+
+def find_overlaps(cycles):
+    """
+    Find the overlapping cycles of every valve, and the cycles running past midnight, in one sweep
+    over the week. The cycles are bucketed by start minute, so the sweep is linear in their number.
+
+    Parameters:
+    - cycles (iterable): (start, minutes, valve, ...) tuples in minutes of the week, with any extra fields.
+
+    Returns:
+    tuple: The (earlier cycle, overlapping cycle) pairs, and the cycles running past midnight.
+    """
+    buckets = {}
+    for cycle in cycles:
+        buckets.setdefault(cycle[0] % MINUTES_PER_WEEK, []).append(cycle)
+    ordered = [cycle for minute in range(MINUTES_PER_WEEK) for cycle in buckets.get(minute, ())]
+
+    overlaps = []
+    wraparounds = []
+    # the cycle of every valve reaching furthest so far
+    latest = {}
+    for cycle in ordered:
+        start, minutes, valve = cycle[0] % MINUTES_PER_WEEK, cycle[1], cycle[2]
+        if start % MINUTES_PER_DAY + minutes > MINUTES_PER_DAY:
+            wraparounds.append(cycle)
+        previous = latest.get(valve)
+        if previous is not None and start < previous[0] % MINUTES_PER_WEEK + previous[1]:
+            overlaps.append((previous, cycle))
+        if previous is None or start + minutes > previous[0] % MINUTES_PER_WEEK + previous[1]:
+            latest[valve] = cycle
+
+    # cycles running past the end of the week reach the first cycles of the next one
+    reach = {valve: cycle[0] % MINUTES_PER_WEEK + cycle[1] - MINUTES_PER_WEEK for valve, cycle in latest.items()}
+    reach = {valve: minute for valve, minute in reach.items() if minute > 0}
+    for cycle in ordered:
+        if not reach:
+            break
+        if cycle[2] not in reach or cycle is latest[cycle[2]]:
+            continue
+        if cycle[0] % MINUTES_PER_WEEK < reach[cycle[2]]:
+            overlaps.append((latest[cycle[2]], cycle))
+        else:
+            del reach[cycle[2]]
+    return overlaps, wraparounds
+
+
+def merge_programs(programs):
+    """
+    Merge compiled programs into the tables driven by a single trigger. The cycles of the weekly programs
+    of a valve, e.g. of several named programs, are unioned so that the valve gets no redundant toggles.
+    A valve may still have cycles in several tables, which the dispatcher combines, keeping it on while any table does.
+
+    Parameters:
+    - programs (iterable): The compiled programs.
+
+    Returns:
+    list: One EventTable with the cycles of all weekly programs, followed by one ZoneTable per timezone and calendar.
+    """
+    weekly = []
+    zones = {}
+    for program in programs:
+        if isinstance(program.table, EventTable):
+            weekly.extend(cycle_spans(program.cycles.values()))
+        else:
+            zones.setdefault((program.zone or "UTC", program.calendar), []).extend(program.cycles.values())
+    events = []
+    for start, minutes, valve in union_cycles(weekly):
+        events.append((start, valve, ON))
+        events.append(((start + minutes) % MINUTES_PER_WEEK, valve, OFF))
+    return [EventTable(events)] + [ZoneTable(zone, cycles, calendar) for (zone, calendar), cycles in zones.items() if cycles]
+
+
+def format_minute_of_week(minute):
+    """
+    Format a minute of the week as a day and time.
+
+    Parameters:
+    - minute (int): The minute of the week.
+
+    Returns:
+    str: The day and time, e.g. "mon 08:30".
+    """
+    minute %= MINUTES_PER_WEEK
+    day, minute = divmod(minute, MINUTES_PER_DAY)
+    return f"{DAYS[day]} {minute // MINUTES_PER_HOUR:02d}:{minute % MINUTES_PER_HOUR:02d}"
+
+
+def _sweep(cycles, max_concurrent, busy):
+    """
+    Start every cycle at the first minute a valve slot is free, taking queued cycles in priority order.
+
+    Parameters:
+    - cycles (list): (start, priority, valve, duration) tuples, sorted by start.
+    - max_concurrent (int): The maximum number of valves open at once.
+    - busy (list): The minutes at which slots already taken at minute 0 are freed.
+
+    Returns:
+    list: (actual start, cycle) tuples.
+    """
+    running = list(busy)
+    heapq.heapify(running)
+    queued = []
+    placed = []
+    index = 0
+    minute = cycles[0][0]
+    while index < len(cycles) or queued:
+        while index < len(cycles) and cycles[index][0] <= minute:
+            heapq.heappush(queued, (cycles[index][1], cycles[index][0], index))
+            index += 1
+        while running and running[0] <= minute:
+            heapq.heappop(running)
+        while queued and len(running) < max_concurrent:
+            cycle = cycles[heapq.heappop(queued)[2]]
+            placed.append((minute, cycle))
+            heapq.heappush(running, minute + cycle[3])
+        candidates = []
+        if index < len(cycles):
+            candidates.append(cycles[index][0])
+        if queued and running:
+            candidates.append(running[0])
+        if not candidates:
+            break
+        minute = min(candidates)
+    return placed
+
+
+def _weekly_cycles(programs):
+    """
+    Get the unioned cycles of the weekly programs to sequence. The overlapping cycles of a valve
+    take a single slot, at the highest priority of its programs.
+
+    Parameters:
+    - programs (iterable): The compiled programs.
+
+    Returns:
+    list: (start, priority, valve, duration) tuples, sorted by start and priority.
+    """
+    spans = []
+    priorities = {}
+    for program in programs:
+        if isinstance(program.table, EventTable):
+            for start, minutes, valve in cycle_spans(program.cycles.values()):
+                priority = program.priority if program.priority is not None else valve
+                priorities[valve] = min(priorities.get(valve, priority), priority)
+                spans.append((start, minutes, valve))
+    cycles = [(start, (priorities[valve], str(valve)), valve, minutes) for start, minutes, valve in union_cycles(spans)]
+    return sorted(cycles, key=lambda cycle: (cycle[0], cycle[1]))
+
+
+def sequence_cycles(programs, max_concurrent):
+    """
+    Queue the overlapping cycles of weekly programs so that at most `max_concurrent` valves are open at once.
+    A sweep line over the cycle starts and stops delays every cycle that finds no free slot until one
+    is freed, and queued cycles start in priority order. Programs compiled in a timezone or calendar are not sequenced.
+
+    Parameters:
+    - programs (iterable): The compiled programs.
+    - max_concurrent (int): The maximum number of valves open at once.
+
+    Returns:
+    tuple: The sequenced weekly EventTable and the list of delayed cycles, whose requested starts are in UTC
+           as the weekly programs are compiled to UTC.
+    """
+    cycles = _weekly_cycles(programs)
+    if not cycles:
+        return EventTable(), []
+
+    placed = _sweep(cycles, max_concurrent, [])
+    # cycles still running at the end of the week take their slots at the start of the next one
+    busy = [start + cycle[3] - MINUTES_PER_WEEK for start, cycle in placed if start + cycle[3] > MINUTES_PER_WEEK]
+    if busy:
+        placed = _sweep(cycles, max_concurrent, busy)
+
+    events = []
+    delayed = []
+    for start, (requested, _, valve, duration) in placed:
+        events.append((start % MINUTES_PER_WEEK, valve, ON))
+        events.append(((start + duration) % MINUTES_PER_WEEK, valve, OFF))
+        if start != requested:
+            delayed.append((requested, str(valve), valve, start - requested))
+    conflicts = [
+        {"out": valve, "start": format_minute_of_week(requested), "timezone": "UTC", "delay": delay}
+        for requested, _, valve, delay in sorted(delayed)
+    ]
+    return EventTable(events), conflicts
+
+
+def build_tables(programs, max_concurrent=0):
+    """
+    Build the tables driven by the dispatcher from compiled programs.
+
+    Parameters:
+    - programs (iterable): The compiled programs.
+    - max_concurrent (int, optional): The maximum number of valves open at once, 0 for no limit. Default is 0.
+
+    Returns:
+    tuple: The merged tables, as returned by `merge_programs`, and the list of delayed cycles.
+    """
+    programs = list(programs)
+    tables = merge_programs(programs)
+    if max_concurrent <= 0:
+        return tables, []
+    tables[0], conflicts = sequence_cycles(programs, max_concurrent)
+    return tables, conflicts
+
+
+def events_due(tables, moment):
+    """
+    Get the events of several tables due at a UTC minute.
+
+    Parameters:
+    - tables (iterable): The compiled tables.
+    - moment (datetime): The UTC datetime, truncated to the minute.
+
+    Returns:
+    list: (valve, action) tuples in dispatch order.
+    """
+    return [event for table in tables for event in table.events_on(moment)]
+
+
+class EventTableTrigger(BaseTrigger):
+    """
+    The `EventTableTrigger` class fires on every minute that has an event in one of
+    its compiled tables, looking up the next fire time with a binary search instead
+    of evaluating one cron expression per event.
+    """
+
+    __slots__ = ("tables",)
+
+    def __init__(self, *tables):  # pylint: disable=super-init-not-called
+        """
+        Constructor
+
+        Parameters:
+        - tables (EventTable or ZoneTable): The compiled schedules, in UTC.
+        """
+        self.tables = tables
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        """
+        Get the next UTC datetime at which an event of the tables is due.
+
+        Parameters:
+        - previous_fire_time (datetime or None): The previous fire time, if any.
+        - now (datetime): The current datetime.
+
+        Returns:
+        datetime or None: The next fire time, or None if the tables are empty.
+        """
+        start = now.astimezone(timezone.utc)
+        if previous_fire_time is not None:
+            start = max(start, previous_fire_time.astimezone(timezone.utc) + timedelta(minutes=1))
+        candidate = start.replace(second=0, microsecond=0)
+        if candidate < start:
+            candidate += timedelta(minutes=1)
+        delays = [table.minutes_until(candidate) for table in self.tables]
+        delays = [delay for delay in delays if delay is not None]
+        if not delays:
+            return None
+        return candidate + timedelta(minutes=min(delays))
+
+    def __str__(self):
+        return f"event_table[{sum(len(table) for table in self.tables)} events]"
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({', '.join(repr(table) for table in self.tables)})>"
@@ -0,0 +1,627 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from loguru import logger
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.triggers.cron import CronTrigger
+from raspirri.server.const import MAX_CONCURRENT_VALVES, MAX_UPCOMING_EVENTS, MISFIRE_GRACE_TIME, SCHEDULER_BACKEND, SCHEDULER_COALESCE
+from raspirri.server.lite_scheduler import LiteScheduler
+from raspirri.server.schedule import (
+    ON,
+    OFF,
+    EventTable,
+    EventTableTrigger,
+    ZoneTable,
+    build_tables,
+    datetime_to_epoch_minute,
+    epoch_minute_to_datetime,
+    events_due,
+    program_key,
+    program_valve,
+)
+from raspirri.server.store import ScheduleStore
+
+DISPATCHER_JOB_ID = "program_dispatcher"
+REFRESH_JOB_ID = "program_refresh"
+
+
+def create_scheduler(backend=SCHEDULER_BACKEND):
+    """
+    Create the scheduler of a backend.
+
+    Parameters:
+    - backend (str, optional): "lite" for the `LiteScheduler`, anything else for APScheduler. Default is SCHEDULER_BACKEND.
+
+    Returns:
+    LiteScheduler or BackgroundScheduler: The scheduler, not started.
+    """
+    if backend == "lite":
+        return LiteScheduler()
+    return BackgroundScheduler()
+
+
+class SchedulerRegistry:  # pylint: disable=too-many-instance-attributes
+    """
+    The `SchedulerRegistry` class owns the single `BackgroundScheduler` of the process
+    and the compiled program of every valve. All programs are merged into one event
+    table driven by a single dispatcher job, so that re-uploading a program replaces
+    its events and deleting a program removes them. Timed manual runs are one more
+    table of the same dispatcher. Compiled programs and manual runs are persisted
+    in a `ScheduleStore`, so they can be restored after a restart.
+    """
+
+    __instance = None
+    __lock = threading.Lock()
+
+    def __new__(cls):
+        """
+        Create a new instance of the SchedulerRegistry class using the singleton design pattern.
+
+        Returns:
+            An instance of the SchedulerRegistry class.
+
+        Example Usage:
+            instance = SchedulerRegistry()
+        """
+        if cls.__instance is None:
+            with cls.__lock:
+                if cls.__instance is None:
+                    cls.__instance = super().__new__(cls)
+                    cls._scheduler = create_scheduler()
+                    cls._scheduler_started = False
+                    cls._jobs_lock = threading.Lock()
+                    cls._programs = {}
+                    cls._handlers = {}
+                    cls._tables = [EventTable()]
+                    cls._conflicts = []
+                    cls._store = ScheduleStore()
+                    last_dispatch = cls._store.load_value("last_dispatch")
+                    cls._last_dispatch = datetime.fromisoformat(last_dispatch) if last_dispatch else None
+                    paused_until = cls._store.load_value("paused_until")
+                    cls._paused_until = datetime.fromisoformat(paused_until) if paused_until else None
+                    cls._runs = [tuple(run) for run in json.loads(cls._store.load_value("manual_runs", "[]"))]
+                    cls._run_handlers = None
+                    cls._run_table = None
+                    cls._batch = nullcontext
+        return cls.__instance
+
+    @classmethod
+    def destroy_instance(cls):
+        """
+        Destroy the instance of the SchedulerRegistry class, shutting down its scheduler if running.
+
+        Example Usage:
+        ```python
+        instance = SchedulerRegistry()  # Create an instance of the SchedulerRegistry class
+        SchedulerRegistry.destroy_instance()  # Destroy the instance
+        ```
+        """
+        if cls.__instance is not None and cls.__instance.scheduler_started:
+            try:
+                cls.__instance.scheduler.shutdown(wait=False)
+            except Exception as exception:
+                logger.warning(f"Could not shutdown scheduler: {exception}")
+        cls.__instance = None
+
+    @property
+    def scheduler(self):
+        """getter"""
+        return self._scheduler
+
+    @property
+    def batch(self):
+        """getter"""
+        return self._batch
+
+    @batch.setter
+    def batch(self, value):
+        """setter, a callable returning the context in which the valve actions of one dispatch are applied"""
+        self._batch = value
+
+    @scheduler.setter
+    def scheduler(self, value):
+        """setter"""
+        self._scheduler = value
+
+    @property
+    def scheduler_started(self):
+        """getter"""
+        return self._scheduler_started
+
+    @scheduler_started.setter
+    def scheduler_started(self, value):
+        """setter"""
+        self._scheduler_started = value
+
+    @property
+    def store(self):
+        """getter"""
+        return self._store
+
+    @property
+    def last_dispatch(self):
+        """getter"""
+        return self._last_dispatch
+
+    @property
+    def paused_until(self):
+        """getter"""
+        return self._paused_until
+
+    @property
+    def conflicts(self):
+        """getter"""
+        return self._conflicts
+
+    @property
+    def tables(self):
+        """getter"""
+        return {valve: program.table for valve, program in self._programs.items()}
+
+    def program(self, valve, name=None):
+        """
+        Get a compiled program scheduled for a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - name (str, optional): The name of the program. Default is the unnamed program.
+
+        Returns:
+        CompiledProgram or None: The compiled program, or None if the valve has no such program.
+        """
+        return self._programs.get(program_key(valve, name))
+
+    @property
+    def table(self):
+        """getter"""
+        return self._tables[0]
+
+    @property
+    def zone_tables(self):
+        """getter"""
+        return [table for table in self._tables[1:] if isinstance(table, ZoneTable)]
+
+    @property
+    def runs(self):
+        """getter"""
+        return list(self._runs)
+
+    def start(self):
+        """Start the shared scheduler if it is not running yet."""
+        with self._jobs_lock:
+            if not self._scheduler_started:
+                self._scheduler.start()
+                self._scheduler_started = True
+
+    def _apply(self, valve, action, manual=False):
+        """Run the handler of a valve for an action, the manual run handlers for the events of manual runs."""
+        handlers = self._run_handlers if manual else self._handlers.get(str(valve))
+        if handlers is None:
+            logger.warning(f"No handlers for valve {valve}, ignoring action {action}")
+            return
+        turn_on, turn_off = handlers
+        try:
+            if action == ON:
+                turn_on(valve)
+            else:
+                turn_off(valve)
+        except Exception as exception:
+            logger.error(f"Error dispatching {action} to valve {valve}: {exception}")
+
+    def _set_last_dispatch(self, moment):
+        """Remember the last dispatched minute, in memory and in the store."""
+        self._last_dispatch = moment
+        self._store.save_value("last_dispatch", moment.isoformat())
+
+    def dispatch(self, now=None):
+        """
+        Run the handlers of every event due since the last dispatch, up to MISFIRE_GRACE_TIME seconds ago.
+        With SCHEDULER_COALESCE only the latest missed event of every valve is run.
+
+        Parameters:
+        - now (datetime, optional): The current UTC datetime. Default is now.
+
+        Returns:
+        list: The (valve, action) events that were dispatched.
+        """
+        now = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+        start = now
+        if self._last_dispatch is not None:
+            if self._last_dispatch >= now:
+                return []
+            start = max(self._last_dispatch + timedelta(minutes=1), now - timedelta(seconds=MISFIRE_GRACE_TIME))
+
+        trigger = EventTableTrigger(*self._tables)
+        events = []
+        fire_time = trigger.get_next_fire_time(None, start)
+        while fire_time is not None and fire_time <= now:
+            events.extend(self._events_on(fire_time))
+            fire_time = trigger.get_next_fire_time(fire_time, fire_time)
+        if SCHEDULER_COALESCE and len(events) > 1:
+            latest = {}
+            for event in events:
+                latest.pop(event[0], None)
+                latest[event[0]] = event
+            events = list(latest.values())
+
+        with self._batch():
+            for valve, action, manual in events:
+                self._apply(valve, action, manual)
+        self._set_last_dispatch(now)
+        self._prune_runs(now)
+        return [(valve, action) for valve, action, _ in events]
+
+    def _program_events(self, tables, moment):
+        """
+        Get the events of the program tables due at a UTC minute. A valve driven by several tables is on
+        while any of them keeps it on, so its events are only kept when they change that combined state.
+
+        Parameters:
+        - tables (list): The tables of the programs.
+        - moment (datetime): The UTC datetime, truncated to the minute.
+
+        Returns:
+        list: (valve, action) tuples in dispatch order.
+        """
+        events = events_due(tables, moment)
+        if len(tables) < 2 or not events:
+            return events
+        before = self.state_at(moment - timedelta(minutes=1), tables)
+        after = self.state_at(moment, tables)
+        changed = {}
+        for valve, _ in events:
+            if after.get(valve, OFF) != before.get(valve, OFF):
+                changed[valve] = after.get(valve, OFF)
+        return list(changed.items())
+
+    def _events_on(self, moment):
+        """Get the (valve, action, manual) events of the programs and manual runs due at a UTC minute."""
+        programs = [table for table in self._tables if table is not self._run_table]
+        events = [(valve, action, False) for valve, action in self._program_events(programs, moment)]
+        if self._run_table is not None:
+            events.extend((valve, action, True) for valve, action in self._run_table.events_on(moment))
+        return events
+
+    def run(self, runs, turn_on, turn_off, now=None):
+        """
+        Run valves one after the other for a number of minutes each, replacing the pending manual runs.
+        The first valve is turned on now and the rest are turned on and off by the dispatcher, so the
+        runs are completed after a restart. Every run ends at a whole minute. Manual runs have their
+        own handlers, so they run while the programs are paused.
+
+        Parameters:
+        - runs (list): (valve, minutes) tuples, in running order. An empty list cancels the manual runs.
+        - turn_on (callable): The function called with a valve to turn it on for a manual run.
+        - turn_off (callable): The function called with a valve to turn it off at the end of a manual run.
+        - now (datetime, optional): The current UTC datetime. Default is now.
+
+        Returns:
+        list: The (valve, start, stop) epoch minutes of the scheduled runs.
+        """
+        now = now or datetime.now(timezone.utc)
+        # the first valve is on from now, and its minutes are counted from the next whole minute
+        start = datetime_to_epoch_minute(now + timedelta(seconds=59))
+        scheduled = []
+        for valve, minutes in runs:
+            scheduled.append((valve, start if scheduled else datetime_to_epoch_minute(now), start + minutes))
+            start += minutes
+        with self._jobs_lock:
+            stopped = [valve for valve, action in self._runs_table().state_at(now).items() if action == ON]
+            self._run_handlers = (turn_on, turn_off)
+            self._runs = scheduled
+            self._store.save_value("manual_runs", json.dumps(self._runs))
+            self._reschedule_dispatcher()
+        for valve in stopped:
+            if not scheduled or str(valve) != str(scheduled[0][0]):
+                self._apply(valve, OFF, manual=True)
+        if scheduled:
+            self._apply(scheduled[0][0], ON, manual=True)
+        logger.info(f"Manual runs: {scheduled}")
+        return scheduled
+
+    def _runs_table(self):
+        """Get the turn on/off events of the manual runs, in epoch minutes."""
+        events = []
+        for valve, start, stop in self._runs:
+            events.append((start, valve, ON))
+            events.append((stop, valve, OFF))
+        return EventTable(events, period=None)
+
+    def _prune_runs(self, now):
+        """Forget the manual runs that have ended."""
+        minute = datetime_to_epoch_minute(now)
+        with self._jobs_lock:
+            runs = [run for run in self._runs if run[2] > minute]
+            if len(runs) == len(self._runs):
+                return
+            self._runs = runs
+            self._store.save_value("manual_runs", json.dumps(self._runs))
+            self._reschedule_dispatcher()
+
+    def upcoming_runs(self):
+        """
+        Get the pending manual runs.
+
+        Returns:
+        list: The valve and UTC start and stop of every run that has not ended.
+        """
+        return [
+            {"out": valve, "start": epoch_minute_to_datetime(start).isoformat(), "stop": epoch_minute_to_datetime(stop).isoformat()}
+            for valve, start, stop in self._runs
+        ]
+
+    def is_paused(self, now=None):
+        """
+        Check whether the programs are paused.
+
+        Parameters:
+        - now (datetime, optional): The current UTC datetime. Default is now.
+
+        Returns:
+        bool: True if the programs are paused at that moment, False otherwise.
+        """
+        paused_until = self._paused_until
+        return paused_until is not None and (now or datetime.now(timezone.utc)) < paused_until
+
+    def pause(self, until, now=None):
+        """
+        Pause the programs until a moment, turning off the valves that their programs keep open now.
+        The schedule is left compiled, so resuming needs no recompilation.
+
+        Parameters:
+        - until (datetime): The aware datetime at which the programs resume.
+        - now (datetime, optional): The current UTC datetime. Default is now.
+
+        Returns:
+        datetime: The UTC datetime at which the programs resume.
+        """
+        self._paused_until = until.astimezone(timezone.utc)
+        self._store.save_value("paused_until", self._paused_until.isoformat())
+        logger.info(f"Programs paused until {self._paused_until}")
+        # the manual runs are not paused
+        programs = [table for table in self._tables if table is not self._run_table]
+        for valve, action in self.state_at(now or datetime.now(timezone.utc), programs).items():
+            if action == ON:
+                self._apply(valve, OFF)
+        return self._paused_until
+
+    def resume(self):
+        """Resume the paused programs."""
+        self._paused_until = None
+        self._store.save_value("paused_until", "")
+        logger.info("Programs resumed")
+
+    def upcoming(self, count, valve=None, now=None):
+        """
+        Get the next turn on/off events of every valve from the compiled tables.
+
+        Parameters:
+        - count (int): The number of events per valve, at most MAX_UPCOMING_EVENTS.
+        - valve (int or str, optional): Only return the events of this valve. Default is all valves.
+        - now (datetime, optional): The UTC datetime to search from. Default is now.
+
+        Returns:
+        dict: The UTC time and action ("on" or "off") of the next events, keyed by valve.
+        """
+        now = now or datetime.now(timezone.utc)
+        count = min(count, MAX_UPCOMING_EVENTS)
+        # the programs are keyed by program key, the events by valve
+        programmed = dict.fromkeys(program_valve(key) for key in self._programs)
+        valves = [str(valve)] if valve is not None else list(programmed)
+        ends = self._valve_ends()
+        # valves without events in any table, or whose calendars have ended, have no upcoming events
+        upcoming = {key: [] for key in valves if key in programmed and key in ends and (ends[key] is None or ends[key] > now)}
+        # weekly programs have events in every week, but recurring ones may skip weeks or months,
+        # so the search stops when every valve has its events, at the end of their calendars, or at worst a year per event later
+        horizon = now + timedelta(days=366 * (count + 1))
+        if upcoming and all(ends[key] is not None for key in upcoming):
+            horizon = min(horizon, max(ends[key] for key in upcoming))
+        trigger = EventTableTrigger(*self._tables)
+        pending = len(upcoming) if count > 0 else 0
+        fire_time = trigger.get_next_fire_time(None, now)
+        while pending and fire_time is not None and fire_time <= horizon:
+            for event_valve, action, _ in self._events_on(fire_time):
+                events = upcoming.get(str(event_valve))
+                if events is not None and len(events) < count:
+                    events.append({"time": fire_time.isoformat(), "action": "on" if action == ON else "off"})
+                    if len(events) == count:
+                        pending -= 1
+            fire_time = trigger.get_next_fire_time(fire_time, fire_time)
+        return upcoming
+
+    def _valve_ends(self):
+        """
+        Get the UTC datetime after which every valve has no more events.
+
+        Returns:
+        dict: The end of the events, or None if they repeat without end, keyed by the valves of the tables.
+        """
+        ends = {}
+        for table in self._tables:
+            if not table:
+                continue
+            end = table.end()
+            for key in map(str, table.valves):
+                if key not in ends:
+                    ends[key] = end
+                elif ends[key] is not None:
+                    ends[key] = None if end is None else max(ends[key], end)
+        return ends
+
+    def state_at(self, moment, tables=None):
+        """
+        Get the action that the schedule requires for every valve at a moment.
+
+        Parameters:
+        - moment (datetime): The UTC datetime.
+        - tables (list, optional): The tables to look at. Default is the tables of the programs and manual runs.
+
+        Returns:
+        dict: The required action, keyed by valve. A valve is on if any of the tables keeps it on.
+        """
+        state = {}
+        for table in self._tables if tables is None else tables:
+            for valve, action in table.state_at(moment).items():
+                if action == ON or valve not in state:
+                    state[valve] = action
+        return state
+
+    def reconcile(self, now=None):
+        """
+        Bring every scheduled valve to the state the schedule requires now.
+
+        Parameters:
+        - now (datetime, optional): The current UTC datetime. Default is now.
+
+        Returns:
+        dict: The applied action, keyed by valve.
+        """
+        now = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+        state = self.state_at(now)
+        runs = self._run_table.state_at(now) if self._run_table is not None else {}
+        self._prune_runs(now)
+        logger.info(f"Reconciling valves to the state required at {now}: {state}")
+        with self._batch():
+            for valve, action in state.items():
+                # valves kept open by a manual run, and valves without programs, use the manual run handlers
+                self._apply(valve, action, runs.get(valve) == ON or str(valve) not in self._handlers)
+        self._set_last_dispatch(now)
+        return state
+
+    def restore(self, turn_on, turn_off, run_handlers=None):
+        """
+        Schedule the compiled programs kept in the store and reconcile the valves to them.
+
+        Parameters:
+        - turn_on (callable): The function called with a valve to turn it on.
+        - turn_off (callable): The function called with a valve to turn it off.
+        - run_handlers (tuple, optional): The turn on and turn off functions of the manual runs. Default is turn_on and turn_off.
+
+        Returns:
+        list: The restored valves.
+        """
+        programs = self._store.load_programs()
+        with self._jobs_lock:
+            for key, program in programs.items():
+                self._programs[key] = program
+                self._handlers[program_valve(key)] = (turn_on, turn_off)
+            self._run_handlers = run_handlers or (turn_on, turn_off)
+            self._reschedule_dispatcher()
+        logger.info(f"Restored the programs of valves: {list(programs)}")
+        self.reconcile()
+        return list(programs)
+
+    def _reschedule_dispatcher(self):
+        """Point the dispatcher job at the merged tables of all valves, or remove it if there is nothing to run."""
+        self._tables, self._conflicts = build_tables(self._programs.values(), MAX_CONCURRENT_VALVES)
+        self._run_table = self._runs_table() if self._runs else None
+        if self._run_table is not None:
+            self._tables.append(self._run_table)
+        if self._conflicts:
+            logger.warning(f"Cycles queued to keep at most {MAX_CONCURRENT_VALVES} valves open: {self._conflicts}")
+        if any(len(table) > 0 for table in self._tables):
+            self._scheduler.add_job(
+                self.dispatch,
+                EventTableTrigger(*self._tables),
+                id=DISPATCHER_JOB_ID,
+                replace_existing=True,
+                misfire_grace_time=MISFIRE_GRACE_TIME,
+                coalesce=SCHEDULER_COALESCE,
+            )
+            return
+        try:
+            self._scheduler.remove_job(DISPATCHER_JOB_ID)
+        except JobLookupError:
+            logger.debug(f"No scheduled job {DISPATCHER_JOB_ID} to remove")
+
+    def schedule_refresh(self, func):
+        """
+        Run a function every hour, e.g. to move the programs following the sun to their next dates.
+        Running hourly lets every program timezone pass its local midnight within the hour.
+
+        Parameters:
+        - func (callable): The function refreshing the programs.
+
+        Returns:
+        None
+        """
+        if self._scheduler.get_job(REFRESH_JOB_ID) is None:
+            self._scheduler.add_job(func, CronTrigger(minute=1, timezone=timezone.utc), id=REFRESH_JOB_ID, replace_existing=True)
+
+    def schedule_valve(self, valve, program, turn_on, turn_off, name=None):  # pylint: disable=too-many-arguments
+        """
+        Schedule a compiled program of a valve, replacing the one previously scheduled with the same name.
+        The programs of a valve are merged, unioning their overlapping cycles.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - program (CompiledProgram): The compiled program of the valve, in UTC.
+        - turn_on (callable): The function called with the valve to turn it on.
+        - turn_off (callable): The function called with the valve to turn it off.
+        - name (str, optional): The name of the program. Default is the unnamed program.
+
+        Returns:
+        None
+        """
+        key = program_key(valve, name)
+        with self._jobs_lock:
+            self._programs[key] = program
+            self._handlers[str(valve)] = (turn_on, turn_off)
+            self._reschedule_dispatcher()
+            self._store.save_program(key, program)
+        logger.info(f"Scheduled {len(program.table)} events for program {key}, {len(self.table)} weekly events in total")
+
+    def unschedule_valve(self, valve, name=None) -> bool:
+        """
+        Remove the scheduled programs of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - name (str, optional): The name of the program to remove. Default is every program of the valve.
+
+        Returns:
+        bool: True if a program was removed, False otherwise.
+        """
+        with self._jobs_lock:
+            if name is not None:
+                keys = [program_key(valve, name)] if program_key(valve, name) in self._programs else []
+            else:
+                keys = [key for key in self._programs if program_valve(key) == str(valve)]
+            if not keys:
+                return False
+            for key in keys:
+                del self._programs[key]
+                self._store.delete_program(key)
+            if not any(program_valve(key) == str(valve) for key in self._programs):
+                self._handlers.pop(str(valve), None)
+            self._reschedule_dispatcher()
+        logger.info(f"Unscheduled programs {keys}, {len(self.table)} weekly events left")
+        return True
@@ -24,21 +24,12 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-# pylint: disable=too-many-locals
-
 import json
 from threading import Thread
-from os import path, remove
-from datetime import datetime
+from datetime import datetime, timezone
 from loguru import logger
-from apscheduler.triggers.combining import OrTrigger
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from raspirri.server.exceptions import DayValueException
+from raspirri.server.exceptions import ValveValueException
 from raspirri.server.const import (
-    DAYS,
-    PROGRAM,
-    PROGRAM_EXT,
     RPI_HW_ID,
     ARCH,
     MQTT_HOST,
@@ -47,11 +38,17 @@ from raspirri.server.const import (
     MQTT_PASS,
     MAX_NUM_OF_BYTES_CHUNK,
     MAX_NUM_OF_BUFFER_TO_ADD,
+    UPCOMING_EVENTS,
+    MAX_WATER_BUDGET,
 )
+from raspirri.server.compiler import ProgramCompiler
 from raspirri.server.helpers import Helpers
+from raspirri.server.scheduler import SchedulerRegistry
+from raspirri.server.store import ProgramStore
+from raspirri.server.schedule import program_key
 
 
-class Services:
+class Services(ProgramCompiler):
     """
     The `Services` class provides various methods for managing and controlling
     services related to a Raspberry Pi device, such as turning on/off valves,
@@ -61,28 +58,29 @@ class Services:
 
     def __init__(self):
         """Constructor"""
-        self._scheduler = BackgroundScheduler()
-        self._scheduler_started = False
+        self._registry = SchedulerRegistry()
+        # valves switched by the same dispatch are written to the GPIO and stored once
+        self._registry.batch = Helpers.batch_valves
 
     @property
     def scheduler_started(self):
         """getter"""
-        return self._scheduler_started
+        return self._registry.scheduler_started
 
     @scheduler_started.setter
     def scheduler_started(self, value):
         """setter"""
-        self._scheduler_started = value
+        self._registry.scheduler_started = value
 
     @property
     def scheduler(self):
         """getter"""
-        return self._scheduler
+        return self._registry.scheduler
 
     @scheduler.setter
     def scheduler(self, value):
         """setter"""
-        self._scheduler = value
+        self._registry.scheduler = value
 
     def turn_on_from_program(self, valve):
         """
@@ -92,8 +90,11 @@ class Services:
         - valve (int): The valve number.
 
         Returns:
-        None
+        str: "OK", or "PAUSED" if the programs are paused.
         """
+        if self._registry.is_paused():
+            logger.info(f"Programs paused until {self._registry.paused_until}, not turning on valve {valve}")
+            return "PAUSED"
         return Helpers().toggle(2, "out" + str(valve))
 
     def turn_off_from_program(self, valve):
@@ -108,245 +109,313 @@ class Services:
         """
         return Helpers().toggle(0, "out" + str(valve))
 
-    def convert_12h_to_24h(self, time_12h):
+    def turn_on_from_run(self, valve):
         """
-        Convert a 12-hour time string to a 24-hour time string if 'am' or 'pm' is present.
+        Turn on a valve for a manual run, also while the programs are paused.
 
         Parameters:
-        - time_12h (str): A string representing the time in 12-hour format (e.g., '03:45 PM').
+        - valve (int): The valve number.
 
         Returns:
-        - str or None: If 'am' or 'pm' is present, returns a string representing the time in 24-hour format (e.g., '15:45').
-                    If 'am' or 'pm' is not present, returns None.
-
-        Example:
-        >>> convert_12h_to_24h('03:45 PM')
-        '15:45'
-        >>> convert_12h_to_24h('10:30 am')
-        '10:30'
-        >>> convert_12h_to_24h('08:15')
-        None
+        str: "OK".
         """
-        logger.info(f"Checking whether start_hour should change: {time_12h}")
-        # Convert the input string to lowercase for case-insensitive check
-        time_12h = time_12h.lower()
-        time_24h = time_12h
-        if "am" in time_12h or "pm" in time_12h:
-            # Parse the 12-hour time string
-            time_obj = datetime.strptime(time_12h, "%I:%M %p")
-            # Format the time object as a 24-hour time string
-            time_24h = time_obj.strftime("%H:%M")
-        logger.info(f"Checking whether start_hour changed: {time_24h}")
-        return time_24h
+        return Helpers().toggle(2, "out" + str(valve))
 
-    def convert_to_utc(self, start_hour, tz_offset):
+    def turn_off_from_run(self, valve):
         """
-        Converts a given start hour in a specific time zone to Coordinated Universal Time (UTC).
+        Turn off a valve at the end of a manual run.
 
-        Args:
-            start_hour (int): The starting hour in the local time zone.
-            tz_offset (int): The time zone offset in hours. Positive values for time zones ahead of UTC,
-                            negative values for time zones behind UTC.
+        Parameters:
+        - valve (int): The valve number.
 
         Returns:
-            Tuple[int, int]: A tuple containing the adjusted hour in UTC and the number of days passed.
-                            The adjusted hour is in the range [0, 23], and the days_passed is -1, 0, or 1
-                            indicating whether the adjusted hour falls before, within, or after the current day.
-
-        Example:
-            For a local start_hour of 10 and tz_offset of -5 (Eastern Standard Time),
-            convert_to_utc(10, -5) may return (5, 0), indicating that the adjusted UTC hour is 5 with no days passed.
-
-        Note:
-            The method assumes a 24-hour clock format.
-        """
-        logger.info(f"Checking whether start_hour should change: {start_hour}, tz_offset: {tz_offset}")
-        # Calculate the adjusted hour
-        adjusted_hour = start_hour - tz_offset
-        if adjusted_hour <= 0:
-            days_passed = -1
-        elif adjusted_hour >= 24:
-            days_passed = 1
-        else:
-            days_passed = 0
-        adjusted_hour = adjusted_hour % 24
-        return adjusted_hour, days_passed
+        str: "OK".
+        """
+        return Helpers().toggle(0, "out" + str(valve))
 
-    def get_previous_day(self, current_day):
+    def get_budget_percent(self, valve, month):
         """
-        Returns the name of the previous day based on the given current day.
+        Get the water budget percentage that scales the cycles of a valve in a month.
 
         Parameters:
-        - current_day (str): The name of the current day (e.g., 'mon').
+        - valve (int or str): The valve number.
+        - month (int): The month, 1 to 12.
 
         Returns:
-        str: The name of the previous day.
+        int: The water budget percentage of the valve in the program store.
         """
-        # Find the index of the current day
-        current_index = DAYS.index(current_day)
-        # Calculate the index of the previous day
-        previous_index = (current_index - 1) % len(DAYS)
-        # Get the name of the previous day
-        previous_day = DAYS[previous_index]
-        return previous_day
+        return ProgramStore().budget_percent(valve, month)
 
-    def get_next_day(self, current_day):
+    def store_program_cycles(self, json_data, store=False, max_run=None, soak=None) -> bool:
         """
-        Returns the name of the next day based on the given current day.
+        Store program cycles and schedule them using the scheduler.
+        Only the cycles that changed since the program was last scheduled are compiled,
+        and an unchanged program is neither rescheduled nor rewritten.
+        Cycles longer than `max_run` minutes are split into run segments separated by `soak` minutes.
 
         Parameters:
-        - current_day (str): The name of the current day (e.g., 'mon').
+        - json_data (dict): JSON data containing program information.
+        - store (bool, optional): Whether to store the program information. Default is False.
+        - max_run (int, optional): The maximum minutes of a run segment, overriding the program's "max_run".
+        - soak (int, optional): The minutes between the run segments, overriding the program's "soak".
 
         Returns:
-        str: The name of the next day.
+        bool: True if the program changed, False otherwise.
         """
-        # Find the index of the current day
-        current_index = DAYS.index(current_day)
-        # Calculate the index of the next day
-        next_index = (current_index + 1) % len(DAYS)
-        # Get the name of the next day
-        next_day = DAYS[next_index]
-        return next_day
+        if max_run is not None:
+            json_data = {**json_data, "max_run": max_run}
+        if soak is not None:
+            json_data = {**json_data, "soak": soak}
+        try:
+            name = json_data.get("name")
+            if name is not None and not isinstance(name, str):
+                raise TypeError(f"The variable name is not a string: {name}")
+            key = program_key(json_data["out"], name)
+            previous = self._registry.program(json_data["out"], name)
+            program = self.compile_program(json_data, previous)
+            changed = program is not previous
+            if changed:
+                old_cycles = previous.cycles.keys() if previous is not None else set()
+                logger.info(
+                    f"Program {key} changed: "
+                    f"{len(program.cycles.keys() - old_cycles)} cycles added, {len(old_cycles - program.cycles.keys())} cycles removed"
+                )
+                logger.info(f"FINAL Events to be in the program: {program.table}")
+                self._registry.schedule_valve(json_data["out"], program, self.turn_on_from_program, self.turn_off_from_program, name)
+            else:
+                logger.info(f"Program {key} has not changed")
+            if self.has_solar_starts(json_data) or any(isinstance(budget, list) for budget in ProgramStore().budgets.values()):
+                self._registry.schedule_refresh(self.refresh_programs)
+            self._registry.start()
+
+            if store is True and (changed or ProgramStore().get(key) != json_data):
+                ProgramStore().save(key, json_data)
+            return changed
+
+        except KeyError as kex:
+            raise KeyError(f"The {kex} field is missing in the JSON data.") from kex
+        except Exception as exception:
+            logger.error(f"Error: {exception}")
+            raise
 
-    def get_start_day_hour(self, day, start_hour, tz_offset):
+    def recompile_programs(self, keys):
         """
-        Checks if the start day or hour should be adjusted based on the provided conditions.
+        Compile the stored programs again, rescheduling the ones that changed.
 
         Parameters:
-        - day (str): The name of the current day (e.g., 'Monday').
-        - start_hour (int): The original start hour (0 to 23).
-        - tz_offset (int): The timezone offset in hours (-12 to +14).
+        - keys (iterable): The keys of the programs.
+
+        Returns:
+        list: The keys of the programs that changed.
+        """
+        changed = []
+        for key in keys:
+            try:
+                if self.store_program_cycles(ProgramStore().get(key)):
+                    changed.append(key)
+            except Exception as exception:
+                logger.error(f"Error compiling the program {key} again: {exception}")
+        return changed
+
+    def refresh_programs(self):
+        """
+        Move the cycles starting relative to sunrise or sunset to the sun times of their next dates,
+        and apply the monthly water budgets of the current month.
+        Programs whose sun times and budgets have not changed are left scheduled as they are.
 
         Returns:
-        tuple: A tuple containing the adjusted day and start hour based on the provided conditions.
+        list: The keys of the programs that changed.
         """
-        logger.info(f"Checking whether start_day should change: {day}")
-        # Convert start_hour to UTC (e.g. start_hour=0, tz_offset=2, start_hour=22)
-        start_hour, days_passed = self.convert_to_utc(start_hour, tz_offset)
-        if days_passed == 1:
-            day = self.get_next_day(day)
-        elif days_passed == -1:
-            day = self.get_previous_day(day)
-        logger.info(f"new start_day: {day}")
-        logger.info(f"new start_hour: {start_hour}")
-        return day, start_hour
+        monthly = any(isinstance(budget, list) for budget in ProgramStore().budgets.values())
+        keys = [key for key in ProgramStore().valves if monthly or self.has_solar_starts(ProgramStore().get(key))]
+        changed = self.recompile_programs(keys)
+        logger.info(f"Refreshed the programs: {changed}")
+        return changed
 
-    def get_stop_datetime(self, day, start_hour, start_min, period):
+    def set_water_budget(self, budget, valve=None):
         """
-        Calculate the stop time for a program cycle.
+        Set the water budget scaling the cycle durations of a valve, or of every valve of the device.
+        Only the programs of the affected valves are compiled again, and only their stop events change.
 
         Parameters:
-        - day (str): The day of the week.
-        - start_hour (int): The starting hour.
-        - start_min (int): The starting minute.
-        - period (int): The duration of the cycle in minutes.
+        - budget (int, list or None): The percentage, 12 monthly percentages from January, or None to remove the budget.
+        - valve (int, optional): The valve number. Default is the budget of the device.
 
         Returns:
-        tuple: A tuple containing the stop day, stop hour, and stop minute.
+        dict: The budgets, keyed by valve and by "" for the device.
         """
-        logger.debug(f"Converting to correct day, start, stop: {day}, {start_hour}, {start_min}, {period}")
-        stop_day_index = DAYS.index(day)
-        logger.debug(f"stop_day_index {stop_day_index}")
+        for percent in budget if isinstance(budget, list) else [budget]:
+            if percent is not None and (not isinstance(percent, int) or not 0 <= percent <= MAX_WATER_BUDGET):
+                raise ValueError(f"The water budget is not a percentage between 0 and {MAX_WATER_BUDGET}: {percent}")
+        if isinstance(budget, list) and len(budget) != 12:
+            raise ValueError(f"The monthly water budget does not have 12 percentages: {budget}")
+        ProgramStore().set_budget(valve, budget)
+        keys = ProgramStore().valves if valve is None else ProgramStore().keys_of(valve)
+        logger.info(f"Water budget of {'valve ' + str(valve) if valve is not None else 'the device'} set to {budget}")
+        self.recompile_programs(keys)
+        return ProgramStore().budgets
+
+    def get_schedule_conflicts(self):
+        """
+        Get the cycles queued to keep at most MAX_CONCURRENT_VALVES valves open at once.
 
-        stop_min = (start_min + period) % 60
-        logger.debug(f"stop_min {stop_min}")
+        Returns:
+        list: The valve, requested UTC start and delay in minutes of every queued cycle.
+        """
+        return self._registry.conflicts
 
-        if stop_min < start_min:
-            # should go to the next hour
-            stop_hour = (start_hour + 1) % 24
-            # should go to the next day
-            if stop_hour < start_hour:
-                stop_day_index = (stop_day_index + 1) % 7
-        else:
-            stop_hour = start_hour
+    def pause_programs(self, until):
+        """
+        Pause the programs until a moment, e.g. for a rain delay. A moment in the past resumes them.
 
-        logger.debug(f"stop_hour {stop_hour}")
+        Parameters:
+        - until (datetime, str, int or float): The datetime, ISO 8601 string or UNIX timestamp, also as a
+          string, at which the programs resume. Naive datetimes are in UTC.
 
-        stop_day = DAYS[stop_day_index]
-        logger.debug(f"stop_day: {stop_day}")
+        Returns:
+        str or None: The UTC ISO 8601 datetime at which the programs resume, or None if they are not paused.
+        """
+        if isinstance(until, str) and until.strip().replace(".", "", 1).isdigit():
+            until = float(until)
+        if isinstance(until, (int, float)):
+            until = datetime.fromtimestamp(until, timezone.utc)
+        elif isinstance(until, str):
+            # fromisoformat accepts the "Z" UTC designator only since Python 3.11
+            until = datetime.fromisoformat(until[:-1] + "+00:00" if until.endswith(("Z", "z")) else until)
+        if not isinstance(until, datetime):
+            raise TypeError(f"The variable until is not a datetime: {until}")
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        if until <= datetime.now(timezone.utc):
+            self.resume_programs()
+            return None
+        return self._registry.pause(until).isoformat()
+
+    def resume_programs(self):
+        """Resume the paused programs."""
+        self._registry.resume()
+
+    def get_paused_until(self):
+        """
+        Get the moment at which paused programs resume.
 
-        return stop_day, stop_hour, stop_min
+        Returns:
+        str or None: The UTC ISO 8601 datetime at which the programs resume, or None if they are not paused.
+        """
+        if not self._registry.is_paused():
+            return None
+        return self._registry.paused_until.isoformat()
 
-    def store_program_cycles(self, json_data, store=False) -> None:
+    def get_runs(self, json_data):
         """
-        Store program cycles and schedule them using the scheduler.
+        Get the manual runs of a request, either a list of runs or valves that run for the same minutes.
 
         Parameters:
-        - json_data (dict): JSON data containing program information.
-        - store (bool, optional): Whether to store the program information. Default is False.
+        - json_data (dict): {"runs": [{"out": 1, "min": 5}, ...]}, or {"out": 1 or [1, 2, ...], "min": 5}.
 
         Returns:
-        None
+        list: (valve, minutes) tuples, in running order.
+
+        Raises:
+        ValueError: There are no runs, a valve is not one of the valve bank, or its minutes are not positive.
         """
-        try:
-            triggers_to_start = []
-            triggers_to_stop = []
-            for day in json_data["days"].split(","):
-                if day not in DAYS:
-                    raise DayValueException(f"{day} is not correct! Accepted values: {DAYS}")
-                tz_offset = json_data["tz_offset"]
-                if not isinstance(tz_offset, int):
-                    raise TypeError("The variable tz_offset is not an integer: {tz_offset}")
-
-                # keeping day sent by user to use on every iteration of cycles
-                user_day = day
-                for cycle in json_data["cycles"]:
-                    logger.info(f"Cycle: {cycle}")
-                    if int(cycle["min"]) <= 0:
-                        logger.info("This cycle should not be considered to be in the program due to min <=0.")
-                        continue
-                    new_start_hour = self.convert_12h_to_24h(cycle["start"])
-                    start_hour = new_start_hour.split(":")[0]
-                    start_min = new_start_hour.split(":")[1]
-
-                    day, start_hour = self.get_start_day_hour(user_day, int(start_hour), tz_offset)
-
-                    logger.info(f"Start: {day} at {start_hour}:{start_min}")
-                    triggers_to_start.append(CronTrigger(day_of_week=day, hour=int(start_hour), minute=int(start_min)))
-
-                    stop_day, stop_hour, stop_min = self.get_stop_datetime(day, int(start_hour), int(start_min), int(cycle["min"]))
-                    logger.info(f"Stop: {stop_day} at {stop_hour}:{stop_min}")
-                    triggers_to_stop.append(CronTrigger(day_of_week=stop_day, hour=stop_hour, minute=stop_min))
-
-            logger.info(f"FINAL Triggers To Start to be in the program:{triggers_to_start}")
-            logger.info(f"FINAL Triggers To Stop to be in the program: {triggers_to_stop}")
-
-            self._scheduler.add_job(self.turn_on_from_program, OrTrigger(triggers_to_start), args=[json_data["out"]])
-            self._scheduler.add_job(self.turn_off_from_program, OrTrigger(triggers_to_stop), args=[json_data["out"]])
-
-            if not self._scheduler_started:
-                self._scheduler.start()
-                self._scheduler_started = True
-
-            if store is True:
-                file_path = PROGRAM + str(json_data["out"]) + PROGRAM_EXT
-                with open(file_path, "w", encoding="utf-8") as outfile:
-                    json.dump(json_data, outfile)
-                outfile.close()
+        if json_data.get("runs") is not None:
+            runs = [(run["out"], run["min"]) for run in json_data["runs"]]
+        else:
+            valves = json_data["out"] if isinstance(json_data["out"], list) else [json_data["out"]]
+            runs = [(valve, json_data["min"]) for valve in valves]
+        if not runs:
+            raise ValueError("No valves to run")
+        bank = Helpers().valve_bank
+        for valve, minutes in runs:
+            try:
+                bank.index(valve)
+            except ValveValueException as exception:
+                raise ValueError(f"No such valve: {valve}") from exception
+            if int(minutes) <= 0:
+                raise ValueError(f"The minutes of valve {valve} must be positive: {minutes}")
+        return [(valve, int(minutes)) for valve, minutes in runs]
+
+    def run_valves(self, json_data):
+        """
+        Run valves one after the other for a number of minutes each, turning each off automatically.
+        The runs replace the pending manual runs and are completed after a restart.
+
+        Parameters:
+        - json_data (dict): The runs, as accepted by `get_runs`, or {"cancel": true} to cancel the manual runs.
 
+        Returns:
+        list: The valve and UTC start and stop of every run.
+        """
+        try:
+            runs = [] if json_data.get("cancel") is True else self.get_runs(json_data)
         except KeyError as kex:
             raise KeyError(f"The {kex} field is missing in the JSON data.") from kex
-        except Exception as exception:
-            logger.error(f"Error: {exception}")
-            raise
+        self._registry.run(runs, self.turn_on_from_run, self.turn_off_from_run)
+        self._registry.start()
+        return self._registry.upcoming_runs()
 
-    def delete_program(self, valve) -> bool:
+    def get_schedule(self, count=UPCOMING_EVENTS, valve=None):
         """
-        Delete a stored program for a specific valve.
+        Get the upcoming turn on/off events of the valves from the compiled schedule.
+
+        Parameters:
+        - count (int, optional): The number of events per valve. Default is UPCOMING_EVENTS.
+        - valve (int or str, optional): Only return the events of this valve. Default is all valves.
+
+        Returns:
+        dict: The UTC time and action of the next events, keyed by valve.
+        """
+        return self._registry.upcoming(count, valve)
+
+    def delete_program(self, valve, name=None) -> bool:
+        """
+        Delete the stored programs of a specific valve and remove their scheduled jobs.
 
         Parameters:
         - valve (int): The valve number.
+        - name (str, optional): The name of the program to delete. Default is every program of the valve.
+
+        Returns:
+        bool: True if a program was deleted, False otherwise.
+        """
+        self._registry.unschedule_valve(valve, name)
+        keys = ProgramStore().keys_of(valve) if name is None else [program_key(valve, name)]
+        deleted = [key for key in keys if ProgramStore().delete(key)]
+        logger.info(f"Programs of valve {valve} deleted: {deleted}")
+        return bool(deleted)
+
+    def restore_programs(self):
+        """
+        Restore the compiled programs kept in the schedule store, so that the valves follow their
+        programs right after a restart, and catch up with the events missed while stopped.
+
+        Returns:
+        list: The restored valves.
+        """
+        valves = self._registry.restore(
+            self.turn_on_from_program, self.turn_off_from_program, (self.turn_on_from_run, self.turn_off_from_run)
+        )
+        self._registry.start()
+        return valves
+
+    def bootstrap_schedule(self):
+        """
+        Schedule the programs kept on the device, from the compiled and the uploaded programs
+        of the schedule store, so that irrigation does not wait for the MQTT broker to be reachable.
 
         Returns:
-        bool: True if the program was deleted, False otherwise.
+        list: The scheduled valves.
         """
-        file_path = PROGRAM + str(valve) + PROGRAM_EXT
-        logger.info(f"Looking for {file_path} to delete!")
-        if path.exists(file_path):
-            logger.info(f"{file_path} exists! Deleting it...")
-            remove(file_path)
-            return True
-        return False
+        self.restore_programs()
+        for valve in ProgramStore().valves:
+            try:
+                self.load_program_cycles_if_exists(valve)
+            except Exception as exception:
+                logger.error(f"Error loading the program of valve {valve}: {exception}")
+        valves = list(self._registry.tables)
+        logger.info(f"Schedule bootstrapped from local storage for valves: {valves}")
+        return valves
 
     def load_program_cycles_if_exists(self, valve):
         """
@@ -358,18 +427,11 @@ class Services:
         Returns:
         dict or None: The loaded JSON data or None if no program exists.
         """
-        file_path = PROGRAM + str(valve) + PROGRAM_EXT
-        logger.info(f"Loading {file_path} if exists!")
-        json_data = None
-        if path.exists(file_path):
-            logger.info(f"{file_path} exists!")
-            with open(file_path, encoding="utf-8") as json_file:
-                json_data = json.load(json_file)
-                self.store_program_cycles(json_data)
-            json_file.close()
-        if not self._scheduler_started:
-            self._scheduler.start()
-            self._scheduler_started = True
+        json_data = ProgramStore().get(valve)
+        logger.info(f"Loading the program of valve {valve} if exists: {json_data is not None}")
+        if json_data is not None:
+            self.store_program_cycles(json_data)
+        self._registry.start()
         return json_data
 
     def split_json_into_chunks(self, selected_page, ap_array):
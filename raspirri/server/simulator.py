@@ -0,0 +1,112 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from loguru import logger
+from raspirri.server.compiler import ProgramCompiler
+from raspirri.server.const import MAX_CONCURRENT_VALVES
+from raspirri.server.schedule import ON, EventTableTrigger, build_tables, events_due
+
+
+class ScheduleSimulator:
+    """
+    The `ScheduleSimulator` class runs programs against a virtual clock. Programs are
+    compiled and triggered exactly as the scheduler does it, but the clock jumps from
+    one fire time to the next instead of waiting, so weeks are simulated in milliseconds.
+    The programs are compiled without the scheduler and the stores, so the water budgets are not applied.
+    """
+
+    def __init__(self, programs, max_concurrent=MAX_CONCURRENT_VALVES):
+        """
+        Constructor
+
+        Parameters:
+        - programs (list): Program JSON data, as accepted by `ProgramCompiler.compile_program`.
+        - max_concurrent (int, optional): The maximum number of valves open at once, 0 for no limit.
+          Default is MAX_CONCURRENT_VALVES.
+        """
+        compiler = ProgramCompiler()
+        self._tables, self._conflicts = build_tables((compiler.compile_program(program) for program in programs), max_concurrent)
+        self._trigger = EventTableTrigger(*self._tables)
+
+    def run(self, start, weeks=1):
+        """
+        Simulate the programs for a number of weeks. All valves are off at the start.
+
+        Parameters:
+        - start (datetime): The aware datetime at which the simulation starts.
+        - weeks (int, optional): The number of weeks to simulate. Default is 1.
+
+        Returns:
+        dict: The on/off timeline, the total minutes and runs of every valve and the queued cycles.
+        """
+        end = start + timedelta(weeks=weeks)
+        opened = {}
+        timeline = {}
+        previous_fire_time = None
+        fire_time = self._trigger.get_next_fire_time(None, start)
+        while fire_time is not None and fire_time < end:
+            for valve, action in events_due(self._tables, fire_time):
+                key = str(valve)
+                if action == ON and key not in opened:
+                    opened[key] = fire_time
+                elif action != ON and key in opened:
+                    timeline.setdefault(key, []).append((opened.pop(key), fire_time))
+            previous_fire_time = fire_time
+            fire_time = self._trigger.get_next_fire_time(previous_fire_time, fire_time)
+        for key, opened_at in opened.items():
+            timeline.setdefault(key, []).append((opened_at, end))
+
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "timeline": {key: [(on.isoformat(), off.isoformat()) for on, off in runs] for key, runs in timeline.items()},
+            "totals": {
+                key: {"runs": len(runs), "min": sum(int((off - on).total_seconds()) // 60 for on, off in runs)}
+                for key, runs in timeline.items()
+            },
+            "conflicts": self._conflicts,
+        }
+
+    def benchmark(self, weeks=52, start=None):
+        """
+        Measure how fast the programs are simulated.
+
+        Parameters:
+        - weeks (int, optional): The number of weeks to simulate. Default is 52.
+        - start (datetime, optional): The aware datetime at which the simulation starts. Default is now.
+
+        Returns:
+        float: The simulated weeks per second of wall clock time.
+        """
+        start = start or datetime.now(timezone.utc)
+        began = time.perf_counter()
+        self.run(start, weeks)
+        elapsed = time.perf_counter() - began
+        weeks_per_second = weeks / elapsed if elapsed > 0 else float("inf")
+        logger.info(f"Simulated {weeks} weeks in {elapsed:.3f}s: {weeks_per_second:.1f} weeks/s")
+        return weeks_per_second
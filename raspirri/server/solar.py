@@ -0,0 +1,159 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import math
+import re
+from array import array
+from calendar import isleap
+from functools import lru_cache
+from raspirri.server.schedule import MINUTES_PER_DAY
+
+SUNRISE = "sunrise"
+SUNSET = "sunset"
+
+# e.g. "sunrise", "sunrise-30min", "sunset + 15"
+SOLAR_START = re.compile(r"^(sunrise|sunset)\s*(?:([+-])\s*(\d+)\s*(?:min)?)?$")
+# zenith of the sun at sunrise and sunset, accounting for refraction and the solar disc
+ZENITH = math.radians(90.833)
+
+
+def parse_solar_start(start):
+    """
+    Parse a cycle start relative to sunrise or sunset.
+
+    Parameters:
+    - start (str): The start of a cycle, e.g. 'sunrise-30min' or '06:00'.
+
+    Returns:
+    tuple or None: The solar event ('sunrise' or 'sunset') and the offset in minutes from it,
+    or None if the start is not relative to the sun.
+    """
+    match = SOLAR_START.match(str(start).strip().lower())
+    if match is None:
+        return None
+    event, sign, minutes = match.groups()
+    offset = int(minutes or 0)
+    return event, -offset if sign == "-" else offset
+
+
+def solar_events(latitude, longitude, day_of_year, days_in_year):
+    """
+    Compute the sunrise and sunset of a day with the NOAA solar equations.
+
+    Near the poles, where the sun does not rise or set, the hour angle is clamped so that
+    a polar night gives sunrise and sunset at solar noon and a midnight sun gives a whole day.
+
+    Parameters:
+    - latitude (float): The latitude in degrees, north positive.
+    - longitude (float): The longitude in degrees, east positive.
+    - day_of_year (int): The day of the year, January 1st being 1.
+    - days_in_year (int): The number of days in the year (365 or 366).
+
+    Returns:
+    tuple: The sunrise and sunset in UTC minutes of the day, possibly outside 0 to MINUTES_PER_DAY - 1.
+    """
+    gamma = 2 * math.pi / days_in_year * (day_of_year - 1)
+    eqtime = 229.18 * (
+        0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma) - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma)
+    )
+    decl = (
+        0.006918
+        - 0.399912 * math.cos(gamma)
+        + 0.070257 * math.sin(gamma)
+        - 0.006758 * math.cos(2 * gamma)
+        + 0.000907 * math.sin(2 * gamma)
+        - 0.002697 * math.cos(3 * gamma)
+        + 0.00148 * math.sin(3 * gamma)
+    )
+    lat = math.radians(latitude)
+    cos_ha = math.cos(ZENITH) / (math.cos(lat) * math.cos(decl)) - math.tan(lat) * math.tan(decl)
+    hour_angle = math.degrees(math.acos(max(-1.0, min(1.0, cos_ha))))
+    noon = 720 - 4 * longitude - eqtime
+    return round(noon - 4 * hour_angle), round(noon + 4 * hour_angle)
+
+
+class SolarTable:
+    """
+    The `SolarTable` class keeps the sunrise and sunset of every day of a year at a location,
+    computed locally once and indexed by day of the year.
+    """
+
+    __slots__ = ("latitude", "longitude", "year", "_sunrise", "_sunset")
+
+    def __init__(self, latitude, longitude, year):
+        """
+        Compute the table.
+
+        Parameters:
+        - latitude (float): The latitude in degrees, north positive.
+        - longitude (float): The longitude in degrees, east positive.
+        - year (int): The year of the table.
+        """
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            raise ValueError(f"Invalid location: {latitude}, {longitude}")
+        self.latitude = latitude
+        self.longitude = longitude
+        self.year = year
+        days_in_year = 366 if isleap(year) else 365
+        events = [solar_events(latitude, longitude, day, days_in_year) for day in range(1, days_in_year + 1)]
+        self._sunrise = array("h", (sunrise for sunrise, _ in events))
+        self._sunset = array("h", (sunset for _, sunset in events))
+
+    def __len__(self):
+        return len(self._sunrise)
+
+    def __repr__(self):
+        return f"SolarTable({self.latitude}, {self.longitude}, {self.year})"
+
+    def event(self, name, day):
+        """
+        Get the time of a solar event on a date.
+
+        Parameters:
+        - name (str): 'sunrise' or 'sunset'.
+        - day (date): The date, in the year of the table.
+
+        Returns:
+        int: The UTC minute of the day of the event, wrapped to 0 to MINUTES_PER_DAY - 1.
+        """
+        events = self._sunrise if name == SUNRISE else self._sunset
+        return events[day.timetuple().tm_yday - 1] % MINUTES_PER_DAY
+
+
+@lru_cache(maxsize=4)
+def solar_table(latitude, longitude, year):
+    """
+    Get the solar table of a location and year, built on first use.
+
+    Parameters:
+    - latitude (float): The latitude in degrees, north positive.
+    - longitude (float): The longitude in degrees, east positive.
+    - year (int): The year of the table.
+
+    Returns:
+    SolarTable: The sunrise and sunset of every day of the year.
+    """
+    return SolarTable(latitude, longitude, year)
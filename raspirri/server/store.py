@@ -0,0 +1,387 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import closing
+from loguru import logger
+from raspirri.server.const import SCHEDULE_DB, PROGRAM, PROGRAM_EXT
+from raspirri.server.schedule import CompiledProgram, program_valve
+
+
+class ScheduleStore:
+    """
+    The `ScheduleStore` class persists the compiled programs of the valves and the
+    state of the dispatcher in a local SQLite database, so that the schedule survives
+    restarts without reparsing the programs.
+    """
+
+    def __init__(self, filename=SCHEDULE_DB):
+        """
+        Constructor
+
+        Parameters:
+        - filename (str, optional): The SQLite database file. Default is SCHEDULE_DB.
+        """
+        self._filename = filename
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS programs "
+                    "(valve TEXT PRIMARY KEY, digest TEXT, zone TEXT, priority INTEGER, cycles BLOB, calendar BLOB)"
+                )
+                # databases created before recurring programs lack their calendar
+                columns = [row[1] for row in connection.execute("PRAGMA table_info(programs)")]
+                if "calendar" not in columns:
+                    connection.execute("ALTER TABLE programs ADD COLUMN calendar BLOB")
+                connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+                connection.execute("CREATE TABLE IF NOT EXISTS program_data (valve TEXT PRIMARY KEY, data TEXT)")
+
+    @property
+    def filename(self):
+        """getter"""
+        return self._filename
+
+    def _connect(self):
+        """Open a connection to the database."""
+        return sqlite3.connect(self._filename, timeout=10)
+
+    def save_program(self, valve, program):
+        """
+        Store the compiled program of a valve, replacing the previous one.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - program (CompiledProgram): The compiled program.
+        """
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO programs (valve, digest, zone, priority, cycles, calendar) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        str(valve),
+                        program.digest,
+                        program.zone,
+                        program.priority,
+                        pickle.dumps(program.cycles),
+                        pickle.dumps(program.calendar) if program.calendar is not None else None,
+                    ),
+                )
+
+    def delete_program(self, valve):
+        """
+        Delete the compiled program of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        """
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute("DELETE FROM programs WHERE valve = ?", (str(valve),))
+
+    def load_programs(self):
+        """
+        Load the compiled programs of all valves.
+
+        Returns:
+        dict: The compiled programs, keyed by valve.
+        """
+        programs = {}
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT valve, digest, zone, priority, cycles, calendar FROM programs")
+            for valve, digest, zone, priority, cycles, calendar in rows:
+                try:
+                    calendar = pickle.loads(calendar) if calendar is not None else None
+                    programs[valve] = CompiledProgram(digest, pickle.loads(cycles), zone, priority, calendar)
+                except Exception as exception:
+                    logger.error(f"Error loading the program of valve {valve}: {exception}")
+        return programs
+
+    def save_program_data(self, valve, json_data):
+        """
+        Store the program JSON data of a valve, replacing the previous one.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - json_data (dict): The program JSON data.
+        """
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO program_data (valve, data) VALUES (?, ?)", (str(valve), json.dumps(json_data)))
+
+    def delete_program_data(self, valve):
+        """
+        Delete the program JSON data of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        """
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute("DELETE FROM program_data WHERE valve = ?", (str(valve),))
+
+    def load_program_data(self):
+        """
+        Load the program JSON data of all valves.
+
+        Returns:
+        dict: The program JSON data, keyed by valve.
+        """
+        with closing(self._connect()) as connection:
+            return {valve: json.loads(data) for valve, data in connection.execute("SELECT valve, data FROM program_data")}
+
+    def save_value(self, key, value):
+        """
+        Store a setting.
+
+        Parameters:
+        - key (str): The name of the setting.
+        - value (str): The value of the setting.
+        """
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def load_value(self, key, default=None):
+        """
+        Load a setting.
+
+        Parameters:
+        - key (str): The name of the setting.
+        - default (str, optional): The value returned if the setting is not stored. Default is None.
+
+        Returns:
+        str: The value of the setting.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+
+class ProgramStore:
+    """
+    The `ProgramStore` class keeps the programs uploaded for the valves in the schedule
+    database, with an in-memory index keyed by program key: the valve number, followed
+    by the program name for the named programs of a valve. The database is read once, and the
+    legacy per-valve program files are migrated into it on first use. The JSON payloads
+    published for the programs are serialized once and cached until a program changes.
+    """
+
+    __instance = None
+    __lock = threading.Lock()
+
+    def __new__(cls):
+        """
+        Create a new instance of the ProgramStore class using the singleton design pattern.
+
+        Returns:
+            An instance of the ProgramStore class.
+
+        Example Usage:
+            instance = ProgramStore()
+        """
+        with cls.__lock:
+            if cls.__instance is None:
+                cls.__instance = super().__new__(cls)
+                cls._store = ScheduleStore()
+                cls._programs = cls._store.load_program_data()
+                cls._write_lock = threading.Lock()
+                cls._payloads = {}
+                cls._config_payload = None
+                cls._budgets = json.loads(cls._store.load_value("water_budgets", "{}"))
+                cls.__instance.migrate_program_files()
+        return cls.__instance
+
+    @classmethod
+    def destroy_instance(cls):
+        """
+        Destroy the instance of the ProgramStore class.
+
+        Example Usage:
+        ```python
+        instance = ProgramStore()  # Create an instance of the ProgramStore class
+        ProgramStore.destroy_instance()  # Destroy the instance
+        ```
+        """
+        cls.__instance = None
+
+    @property
+    def valves(self):
+        """getter"""
+        return sorted(self._programs, key=lambda valve: (len(valve), valve))
+
+    def keys_of(self, valve):
+        """
+        Get the keys of the programs of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+
+        Returns:
+        list: The program keys of the valve, the unnamed program first.
+        """
+        return [key for key in self.valves if program_valve(key) == str(valve)]
+
+    def get(self, valve):
+        """
+        Get the program of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+
+        Returns:
+        dict or None: The program JSON data, or None if the valve has no program.
+        """
+        return self._programs.get(str(valve))
+
+    def save(self, valve, json_data):
+        """
+        Store the program of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - json_data (dict): The program JSON data.
+        """
+        with self._write_lock:
+            self._store.save_program_data(valve, json_data)
+            self._programs[str(valve)] = json_data
+            self._invalidate(valve)
+
+    def delete(self, valve) -> bool:
+        """
+        Delete the program of a valve.
+
+        Parameters:
+        - valve (int or str): The valve number.
+
+        Returns:
+        bool: True if the program was deleted, False if the valve had no program.
+        """
+        with self._write_lock:
+            if str(valve) not in self._programs:
+                return False
+            self._store.delete_program_data(valve)
+            del self._programs[str(valve)]
+            self._invalidate(valve)
+        return True
+
+    @property
+    def budgets(self):
+        """getter"""
+        return dict(self._budgets)
+
+    def set_budget(self, valve, budget):
+        """
+        Store the water budget of a valve, or of the device.
+
+        Parameters:
+        - valve (int or str or None): The valve number, or None for the budget of the device.
+        - budget (int or list or None): The percentage, 12 monthly percentages, or None to remove the budget.
+        """
+        with self._write_lock:
+            if budget is None:
+                self._budgets.pop(str(valve or ""), None)
+            else:
+                self._budgets[str(valve or "")] = budget
+            self._store.save_value("water_budgets", json.dumps(self._budgets))
+
+    def budget_percent(self, valve, month):
+        """
+        Get the water budget percentage of a valve in a month, falling back to the budget of the device.
+
+        Parameters:
+        - valve (int or str): The valve number.
+        - month (int): The month (1 to 12).
+
+        Returns:
+        int: The percentage scaling the cycle durations of the valve, 100 without a budget.
+        """
+        budget = self._budgets.get(str(valve), self._budgets.get("", 100))
+        return budget[month - 1] if isinstance(budget, list) else budget
+
+    def _invalidate(self, valve):
+        """Drop the cached payloads of a changed program."""
+        self._payloads.pop(str(valve), None)
+        self._config_payload = None
+
+    def get_payload(self, valve):
+        """
+        Get the JSON payload of the program of a valve, serialized once and cached.
+
+        Parameters:
+        - valve (int or str): The valve number.
+
+        Returns:
+        bytes or None: The UTF-8 encoded JSON of the program, or None if the valve has no program.
+        """
+        with self._write_lock:
+            payload = self._payloads.get(str(valve))
+            if payload is None and str(valve) in self._programs:
+                payload = self._payloads[str(valve)] = json.dumps(self._programs[str(valve)]).encode("utf-8")
+            return payload
+
+    def config_payload(self):
+        """
+        Get the JSON array of all programs, as republished to the config topic, serialized once and cached.
+
+        Returns:
+        bytes: The UTF-8 encoded JSON array of the programs, in valve order.
+        """
+        with self._write_lock:
+            if self._config_payload is None:
+                self._config_payload = json.dumps([self._programs[valve] for valve in self.valves]).encode("utf-8")
+            return self._config_payload
+
+    def migrate_program_files(self, directory="."):
+        """
+        Move the legacy program_<valve>.json files into the store.
+
+        Parameters:
+        - directory (str, optional): The directory of the program files. Default is the working directory.
+
+        Returns:
+        list: The migrated valves.
+        """
+        migrated = []
+        for file_name in sorted(os.listdir(directory)):
+            valve = file_name.removeprefix(PROGRAM).removesuffix(PROGRAM_EXT)
+            if not (file_name.startswith(PROGRAM) and file_name.endswith(PROGRAM_EXT) and valve):
+                continue
+            file_path = os.path.join(directory, file_name)
+            try:
+                with open(file_path, encoding="utf-8") as json_file:
+                    json_data = json.load(json_file)
+                self.save(valve, json_data)
+                os.remove(file_path)
+                migrated.append(valve)
+            except Exception as exception:
+                logger.error(f"Error migrating {file_path}: {exception}")
+        if migrated:
+            logger.info(f"Migrated the program files of valves {migrated} to {self._store.filename}")
+        return migrated
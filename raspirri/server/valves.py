@@ -0,0 +1,280 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import threading
+from functools import lru_cache
+from raspirri.server.const import VALVE_COUNT
+from raspirri.server.exceptions import ValveValueException
+
+VALVES = "valves"
+
+
+@lru_cache(maxsize=None)
+def valve_names(count):
+    """
+    Name the valves of a bank, shared by every bank of the same size.
+
+    Parameters:
+    - count (int): The number of valves.
+
+    Returns:
+    tuple: The valve names, "out1".."outN", and a dict from each name and number to the valve index.
+    """
+    names = tuple(f"out{index + 1}" for index in range(count))
+    indexes = {}
+    for index, name in enumerate(names):
+        indexes[name] = indexes[index + 1] = indexes[str(index + 1)] = index
+    return names, indexes
+
+
+class ValveBank:
+    """
+    The `ValveBank` class holds the on/off states of the valves of the controller as the bits of one
+    integer, valve N being bit N-1, next to the configured "valves" list. It is converted to the
+    statuses dict, {"valves": [...], "out1": 0, ..., "outN": 0}, only where the statuses leave the
+    device, so controllers with more valves cost the same. A bank is never modified: changes
+    return a new bank, so a bank can be shared with readers while the valves change.
+    """
+
+    __slots__ = ("_mask", "_names", "_indexes", "_valves")
+
+    def __init__(self, count=VALVE_COUNT, mask=0, valves=None):
+        """
+        Constructor
+
+        Parameters:
+        - count (int, optional): The number of valves.
+        - mask (int, optional): The bitmask of the open valves.
+        - valves (list, optional): The configured valves.
+        """
+        self._names, self._indexes = valve_names(count)
+        self._mask = mask & ((1 << count) - 1)
+        # a list is kept as a tuple, so readers cannot modify it
+        self._valves = () if valves is None else tuple(valves) if isinstance(valves, list) else valves
+
+    @classmethod
+    def from_dict(cls, statuses, count=VALVE_COUNT):
+        """
+        Build a bank from a statuses dict, ignoring its other keys.
+
+        Parameters:
+        - statuses (dict): The statuses, e.g. {"valves": [1, 2], "out1": 1, "out2": 0}.
+        - count (int, optional): The number of valves.
+
+        Returns:
+        ValveBank: The bank.
+        """
+        names, _ = valve_names(count)
+        mask = 0
+        for index, name in enumerate(names):
+            if statuses.get(name):
+                mask |= 1 << index
+        return cls(count, mask, statuses.get(VALVES))
+
+    @property
+    def count(self):
+        """getter"""
+        return len(self._names)
+
+    @property
+    def names(self):
+        """getter"""
+        return self._names
+
+    @property
+    def mask(self):
+        """getter"""
+        return self._mask
+
+    @property
+    def valves(self):
+        """getter"""
+        return list(self._valves) if isinstance(self._valves, tuple) else self._valves
+
+    def index(self, valve):
+        """
+        Find the bit of a valve.
+
+        Parameters:
+        - valve (str or int): The valve name, e.g. "out1", or number, e.g. 1.
+
+        Returns:
+        int: The bit index of the valve.
+
+        Raises:
+        ValveValueException: The bank has no such valve.
+        """
+        try:
+            return self._indexes[valve]
+        except (KeyError, TypeError) as exception:
+            raise ValveValueException(f"{valve} of {self.count} valves") from exception
+
+    def get(self, valve):
+        """
+        Get the status of a valve.
+
+        Parameters:
+        - valve (str or int): The valve name or number.
+
+        Returns:
+        int: 1 if the valve is on, otherwise 0.
+        """
+        return self._mask >> self.index(valve) & 1
+
+    def with_statuses(self, statuses):
+        """
+        Change the statuses of valves.
+
+        Parameters:
+        - statuses (dict): The status, 1 for on and 0 for off, of every valve to change, by valve name or number.
+
+        Returns:
+        ValveBank: The changed bank.
+        """
+        mask = self._mask
+        for valve, status in statuses.items():
+            bit = 1 << self.index(valve)
+            mask = mask | bit if status else mask & ~bit
+        return ValveBank(self.count, mask, self._valves)
+
+    def with_valves(self, valves):
+        """
+        Change the configured valves.
+
+        Parameters:
+        - valves (list): The configured valves.
+
+        Returns:
+        ValveBank: The changed bank.
+        """
+        return ValveBank(self.count, self._mask, valves)
+
+    def to_dict(self):
+        """
+        Convert the bank to the statuses dict.
+
+        Returns:
+        dict: {"valves": [...], "out1": 0 or 1, ..., "outN": 0 or 1}.
+        """
+        statuses = {VALVES: self.valves}
+        mask = self._mask
+        for name in self._names:
+            statuses[name] = mask & 1
+            mask >>= 1
+        return statuses
+
+    def __len__(self):
+        return len(self._names)
+
+    def __eq__(self, other):
+        if not isinstance(other, ValveBank):
+            return NotImplemented
+        return self._names == other._names and self._mask == other._mask and self._valves == other._valves
+
+    def __repr__(self):
+        return f"ValveBank({self.count}, mask={self._mask:#b}, valves={self._valves!r})"
+
+
+class ValveStateStore:
+    """
+    The `ValveStateStore` class holds the current `ValveBank`. Writers replace it under a single
+    writer lock, and readers take the current bank, an immutable snapshot, without locking.
+    """
+
+    def __init__(self, bank=None):
+        """
+        Constructor
+
+        Parameters:
+        - bank (ValveBank, optional): The initial bank. Default is every valve off.
+        """
+        self._bank = ValveBank() if bank is None else bank
+        self._lock = threading.RLock()
+
+    @property
+    def lock(self):
+        """getter, the writer lock, held by callers that make changes depending on the snapshot"""
+        return self._lock
+
+    @property
+    def snapshot(self):
+        """getter"""
+        return self._bank
+
+    def replace(self, bank):
+        """
+        Replace the bank.
+
+        Parameters:
+        - bank (ValveBank): The new bank.
+
+        Returns:
+        ValveBank: The new snapshot.
+        """
+        with self._lock:
+            self._bank = bank
+            return bank
+
+    def update(self, statuses):
+        """
+        Change the statuses of valves at once.
+
+        Parameters:
+        - statuses (dict): The status of every valve to change, by valve name or number.
+
+        Returns:
+        ValveBank: The new snapshot.
+        """
+        with self._lock:
+            self._bank = self._bank.with_statuses(statuses)
+            return self._bank
+
+    def set(self, valve, status):
+        """
+        Change the status of a valve.
+
+        Parameters:
+        - valve (str or int): The valve name or number.
+        - status (int): 1 to turn the valve on, 0 to turn it off.
+
+        Returns:
+        ValveBank: The new snapshot.
+        """
+        return self.update({valve: status})
+
+    def set_valves(self, valves):
+        """
+        Change the configured valves.
+
+        Parameters:
+        - valves (list): The configured valves.
+
+        Returns:
+        ValveBank: The new snapshot.
+        """
+        with self._lock:
+            self._bank = self._bank.with_valves(valves)
+            return self._bank
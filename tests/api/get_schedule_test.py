@@ -0,0 +1,66 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import pytest
+from fastapi import HTTPException, status
+from raspirri.main_app import schedule
+
+
+class TestSchedule:
+    """Schedule API Test Class"""
+
+    @pytest.mark.asyncio
+    async def test_returns_upcoming_events(self, mocker):
+        """
+        Test that the upcoming events of the compiled schedule are returned.
+        """
+        upcoming = {"1": [{"time": "2024-03-19T08:30:00+00:00", "action": "on"}]}
+        get_schedule = mocker.patch("raspirri.main_app.services.get_schedule", return_value=upcoming)
+        response = await schedule(count=1, valve="1")
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.body) == upcoming
+        get_schedule.assert_called_once_with(1, "1")
+
+    @pytest.mark.asyncio
+    async def test_invalid_count(self):
+        """
+        Test that a negative number of events is rejected.
+        """
+        with pytest.raises(HTTPException) as exc:
+            await schedule(count=-1)
+        assert exc.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.asyncio
+    async def test_error(self, mocker):
+        """
+        Test that errors of the schedule query are returned as internal server errors.
+        """
+        mocker.patch("raspirri.main_app.services.get_schedule", side_effect=ValueError("error"))
+        with pytest.raises(HTTPException) as exc:
+            await schedule()
+        assert exc.value.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert exc.value.detail == "error"
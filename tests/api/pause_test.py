@@ -0,0 +1,109 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import pytest
+from fastapi import HTTPException, status
+from fastapi.testclient import TestClient
+from raspirri.main_app import PauseData, app, get_pause, pause
+
+client = TestClient(app)
+
+
+class TestPause:
+    """Pause API Test Class"""
+
+    @pytest.mark.asyncio
+    async def test_pause_and_resume(self, mocker):
+        """
+        Test that programs are paused until a moment and resumed without one.
+        """
+        pause_programs = mocker.patch("raspirri.main_app.services.pause_programs", return_value="2999-01-01T00:00:00+00:00")
+        resume_programs = mocker.patch("raspirri.main_app.services.resume_programs")
+
+        response = await pause(PauseData(until="2999-01-01T00:00:00Z"))
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.body) == {"paused_until": "2999-01-01T00:00:00+00:00"}
+        pause_programs.assert_called_once_with("2999-01-01T00:00:00Z")
+
+        response = await pause(PauseData())
+        assert json.loads(response.body) == {"paused_until": None}
+        resume_programs.assert_called_once_with()
+
+    @pytest.mark.asyncio
+    async def test_pause_until_utc_designator(self):
+        """
+        Test that a moment ending with the Z UTC designator pauses the programs.
+        """
+        response = await pause(PauseData(until="2999-01-01T00:00:00Z"))
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.body) == {"paused_until": "2999-01-01T00:00:00+00:00"}
+
+        response = await pause(PauseData())
+        assert json.loads(response.body) == {"paused_until": None}
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("until", [4102444800, 4102444800.0, "4102444800"])
+    async def test_pause_until_timestamp(self, until):
+        """
+        Test that a UNIX timestamp pauses the programs.
+        """
+        response = await pause(PauseData(until=until))
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.body) == {"paused_until": "2100-01-01T00:00:00+00:00"}
+
+        response = await pause(PauseData())
+        assert json.loads(response.body) == {"paused_until": None}
+
+    @pytest.mark.parametrize("until", [4102444800, "4102444800"])
+    def test_post_pause_until_timestamp(self, until):
+        """
+        Test that the pause endpoint accepts a UNIX timestamp in the JSON body.
+        """
+        response = client.post("/api/pause", json={"until": until})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"paused_until": "2100-01-01T00:00:00+00:00"}
+        assert client.post("/api/pause", json={}).json() == {"paused_until": None}
+
+    @pytest.mark.asyncio
+    async def test_get_pause(self, mocker):
+        """
+        Test that the moment paused programs resume is returned.
+        """
+        mocker.patch("raspirri.main_app.services.get_paused_until", return_value=None)
+        response = await get_pause()
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.body) == {"paused_until": None}
+
+    @pytest.mark.asyncio
+    async def test_invalid_until(self, mocker):
+        """
+        Test that an invalid moment is rejected.
+        """
+        mocker.patch("raspirri.main_app.services.pause_programs", side_effect=ValueError("Invalid isoformat string"))
+        with pytest.raises(HTTPException) as exc:
+            await pause(PauseData(until="tomorrow"))
+        assert exc.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
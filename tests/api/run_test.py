@@ -0,0 +1,77 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import pytest
+from fastapi import HTTPException, status
+from raspirri.main_app import RunData, run
+
+
+class TestRun:
+    """Manual runs API Test Class"""
+
+    @pytest.mark.asyncio
+    async def test_run_valves_in_sequence(self, mocker):
+        """
+        Test that valves run in sequence for the same minutes.
+        """
+        runs = [{"out": 1, "start": "2024-01-01T10:06:00+00:00", "stop": "2024-01-01T10:11:00+00:00"}]
+        run_valves = mocker.patch("raspirri.main_app.services.run_valves", return_value=runs)
+        response = await run(RunData(out=[1, 2], min=5))
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.body) == runs
+        run_valves.assert_called_once_with({"runs": None, "out": [1, 2], "min": 5, "cancel": None})
+
+    @pytest.mark.asyncio
+    async def test_run_list(self, mocker):
+        """
+        Test that a list of runs is passed on.
+        """
+        run_valves = mocker.patch("raspirri.main_app.services.run_valves", return_value=[])
+        await run(RunData(runs=[{"out": 1, "min": 5}, {"out": "2", "min": 10}]))
+        run_valves.assert_called_once_with(
+            {"runs": [{"out": 1, "min": 5}, {"out": "2", "min": 10}], "out": None, "min": None, "cancel": None}
+        )
+
+    @pytest.mark.asyncio
+    async def test_invalid_minutes(self, mocker):
+        """
+        Test that runs without positive minutes are rejected.
+        """
+        mocker.patch("raspirri.main_app.services.run_valves", side_effect=ValueError("The minutes of valve 1 must be positive: 0"))
+        with pytest.raises(HTTPException) as exc:
+            await run(RunData(out=1, min=0))
+        assert exc.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("data", [RunData(out=9, min=1), RunData(), RunData(runs=[])])
+    async def test_invalid_runs(self, data):
+        """
+        Test that runs of valves outside the valve bank, and requests without runs, are rejected.
+        """
+        with pytest.raises(HTTPException) as exc:
+            await run(data)
+        assert exc.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
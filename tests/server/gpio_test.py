@@ -0,0 +1,79 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import pytest
+from raspirri.server.exceptions import PinMapValueException
+from raspirri.server.gpio import FakeGpioBackend, GpioBackend, parse_pin_map
+
+
+class TestGpio:
+    """
+    Gpio Test Class
+    """
+
+    @pytest.mark.parametrize(
+        "config, expected",
+        [
+            ('{"out2": 11}', {"out2": 11}),
+            ('{"1": 7, "out2": "11"}', {"out1": 7, "out2": 11}),
+            ({3: 13}, {"out3": 13}),
+            ("{}", {}),
+        ],
+    )
+    def test_parse_pin_map(self, config, expected):
+        """The pin map is read from JSON, with valves given by name or number."""
+        assert parse_pin_map(config) == expected
+
+    @pytest.mark.parametrize("config", ["[11]", '{"out1": "eleven"}', "{", '{"out1": 11, "out2": 11}'])
+    def test_parse_invalid_pin_map(self, config):
+        """A malformed pin map, or two valves on one pin, is rejected."""
+        with pytest.raises(PinMapValueException):
+            parse_pin_map(config)
+
+    def test_fake_backend_records_writes(self):
+        """The fake backend keeps the levels and every write."""
+        backend = FakeGpioBackend()
+        backend.setup([7, 11])
+        backend.write({7: True, 11: True})
+        backend.write({7: False})
+
+        assert backend.read(7) is False
+        assert backend.read(11) is True
+        assert list(backend.writes) == [{7: True, 11: True}, {7: False}]
+
+    def test_fake_backend_keeps_the_latest_writes(self):
+        """The recorded writes are bounded, the levels follow every write."""
+        backend = FakeGpioBackend(history=3)
+        for index in range(10):
+            backend.write({11: bool(index % 2)})
+
+        assert list(backend.writes) == [{11: True}, {11: False}, {11: True}]
+        assert backend.read(11) is True
+
+    def test_backend_interface_is_abstract(self):
+        """A backend must implement the GPIO operations."""
+        with pytest.raises(TypeError):
+            GpioBackend()
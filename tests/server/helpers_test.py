@@ -30,11 +30,14 @@ import unittest
 from unittest.mock import patch, MagicMock
 import os
 import signal
+import threading
 from datetime import datetime
 import pytest
 from raspirri.server.helpers import logger
 from raspirri.server.helpers import Helpers
-from raspirri.server.const import RPI_HW_ID, ARCH, STATUSES_FILE, NETWORKS_FILE
+from raspirri.server.gpio import FakeGpioBackend
+from raspirri.server.journal import StateJournal
+from raspirri.server.const import RPI_HW_ID, ARCH, STATUSES_FILE, STATUSES_JOURNAL, NETWORKS_FILE
 from raspirri.main_app import setup_gpio
 
 
@@ -42,10 +45,12 @@ from raspirri.main_app import setup_gpio
 def destroy():
     """
     A pytest fixture that is automatically used before and after each test function.
-    It is responsible for destroying an instance of the Helpers class.
+    It is responsible for destroying an instance of the Helpers class and deleting the journal of its statuses.
     """
     yield
     Helpers.destroy_instance()
+    if os.path.exists(STATUSES_JOURNAL):
+        os.remove(STATUSES_JOURNAL)
 
 
 class TestHelpers(unittest.TestCase):
@@ -244,6 +249,78 @@ class TestHelpers(unittest.TestCase):
         # Assert
         assert new_status != initial_status
 
+    def test_reload_keeps_a_toggle_waiting_for_the_flush_delay(self):
+        """a toggle not flushed yet is not undone by loading the statuses from the file"""
+        Helpers.destroy_instance()
+        with patch("raspirri.server.helpers.StateJournal", lambda *args, **kwargs: StateJournal(*args, **kwargs, flush_delay=60)):
+            helpers = Helpers()
+        helpers.toggle(1, "out1")
+        helpers.journal.flush()
+        helpers.toggle(0, "out1")
+
+        helpers.load_toggle_statuses_from_file()
+
+        assert helpers.toggle_statuses["out1"] == 0
+        assert not helpers.journal.dirty
+
+    def test_toggle_drives_the_mapped_pin(self):
+        """toggle writes the pin of the valve from the pin map"""
+        Helpers.destroy_instance()
+        with patch("raspirri.server.helpers.GPIO_PINS", '{"out1": 7, "out2": 11}'), patch(
+            "raspirri.server.helpers.create_gpio_backend", FakeGpioBackend
+        ):
+            helpers = Helpers()
+
+        helpers.toggle(1, "out2")
+        helpers.toggle(1, "out3")
+
+        assert list(helpers.gpio.writes) == [{11: True}]
+
+    def test_toggle_many_writes_and_stores_once(self):
+        """toggle_many applies several valve changes in one GPIO write and one journal write"""
+        Helpers.destroy_instance()
+        with patch("raspirri.server.helpers.GPIO_PINS", '{"out1": 7, "out2": 11}'), patch(
+            "raspirri.server.helpers.create_gpio_backend", FakeGpioBackend
+        ):
+            helpers = Helpers()
+        writes = helpers.journal.writes
+
+        helpers.toggle_many({"out1": 1, "out2": 1, "out3": 1})
+
+        assert list(helpers.gpio.writes) == [{7: True, 11: True}]
+        assert helpers.journal.writes == writes + 1
+        assert helpers.toggle_statuses["out3"] == 1
+
+    def test_concurrent_toggles_are_not_lost(self):
+        """toggles from many threads, with readers publishing meanwhile, all reach the statuses and the journal"""
+        Helpers.destroy_instance()
+        with patch("raspirri.server.helpers.create_gpio_backend", FakeGpioBackend):
+            helpers = Helpers()
+        errors = []
+
+        def toggle(valve):
+            for index in range(200):
+                helpers.toggle(index % 2, valve)
+            helpers.toggle(1, valve)
+
+        def read():
+            for _ in range(500):
+                statuses = helpers.get_statuses_snapshot()
+                if not set(statuses) >= {"valves", "out1", "out2", "out3", "out4"}:
+                    errors.append(statuses)
+
+        threads = [threading.Thread(target=toggle, args=(f"out{valve}",)) for valve in range(1, 5)]
+        threads += [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        assert helpers.valve_bank.mask == 0b1111
+        helpers.journal.flush()
+        assert helpers.journal.replay() == {"valves": [], "out1": 1, "out2": 1, "out3": 1, "out4": 1}
+
     def test_get_toggle_statuses_returns_toggle_statuses(self):
         """
         Test that the `get_toggle_statuses` method returns a dictionary with expected keys.
@@ -284,11 +361,23 @@ class TestHelpers(unittest.TestCase):
             None
         """
 
-        toggle_statuses = {"valves": [1, 2, 3, 4], "out1": 1, "out2": 0}
+        toggle_statuses = {"valves": [1, 2, 3, 4], "out1": 1, "out2": 0, "out3": 0, "out4": 0}
         self.helpers_instance.toggle_statuses = toggle_statuses
         stored_statuses = self.helpers_instance.store_toggle_statuses_to_file()
         assert stored_statuses == toggle_statuses
 
+    def test_toggle_statuses_survive_a_restart(self):
+        """The journaled toggle statuses are replayed by a new instance."""
+        self.helpers_instance.toggle_statuses = {"valves": [1, 2], "out1": 0, "out2": 0}
+        self.helpers_instance.store_toggle_statuses_to_file()
+        self.helpers_instance.toggle_statuses = {"valves": [1, 2], "out1": 1, "out2": 0}
+        self.helpers_instance.store_toggle_statuses_to_file()
+        Helpers.destroy_instance()
+
+        helpers = Helpers()
+        helpers.load_toggle_statuses_from_file()
+        assert helpers.toggle_statuses == {"valves": [1, 2], "out1": 1, "out2": 0, "out3": 0, "out4": 0}
+
     def test_store_wifi_networks_to_file(self):
         """
         Test that the `store_wifi_networks_to_file` method stores WiFi networks correctly.
@@ -310,8 +399,10 @@ class TestHelpers(unittest.TestCase):
             None
         """
 
-        toggle_statuses = {"valves": [1, 2, 3, 4], "out1": 1, "out2": 0}
+        toggle_statuses = {"valves": [1, 2, 3, 4], "out1": 1, "out2": 0, "out3": 0, "out4": 0}
         self.helpers_instance.store_object_to_file(STATUSES_FILE, toggle_statuses)
+        if os.path.exists(STATUSES_JOURNAL):
+            os.remove(STATUSES_JOURNAL)
         self.helpers_instance.load_toggle_statuses_from_file()
         assert self.helpers_instance.toggle_statuses == toggle_statuses
 
@@ -593,19 +684,6 @@ class TestHelpers(unittest.TestCase):
         timezone = self.helpers_instance.get_timezone()
         assert isinstance(timezone, str)
 
-    def test_check_empty_toggle_existing_toggle(self):
-        """
-        Test that the `check_empty_toggle` method handles an existing toggle correctly.
-
-        Returns:
-            None
-        """
-
-        valve = "out1"
-        self.helpers_instance.toggle_statuses[valve] = 1
-        self.helpers_instance.check_empty_toggle(valve)
-        assert self.helpers_instance.toggle_statuses[valve] == 1
-
     @patch("raspirri.server.helpers.logger")
     @patch("subprocess.Popen")
     def test_scan_rpi_wifi_networks_refresh_true(self, mock_popen, mock_logger):
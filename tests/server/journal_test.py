@@ -0,0 +1,141 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import pickle
+import time
+import pytest
+from raspirri.server.journal import StateJournal
+
+
+@pytest.fixture(name="journal")
+def fixture_journal(tmp_path):
+    """A journal compacted every four records, in a temporary directory."""
+    return StateJournal(str(tmp_path / "statuses.pkl"), str(tmp_path / "statuses.journal"), compact_after=4, volatile=("server_time",))
+
+
+class TestStateJournal:
+    """
+    StateJournal Test Class
+    """
+
+    def test_first_record_writes_the_snapshot(self, journal):
+        """Without a snapshot the first changes are compacted into it."""
+        assert journal.record({"out1": 0, "out2": 0, "server_time": "2024/06/01 10:00:00"}) == 2
+
+        with open(journal.snapshot, "rb") as snapshot_file:
+            assert pickle.load(snapshot_file) == {"out1": 0, "out2": 0}
+        assert os.path.getsize(journal.journal) == 0
+
+    def test_record_appends_only_changes(self, journal):
+        """Unchanged and volatile statuses are not written."""
+        journal.record({"out1": 0, "out2": 0})
+
+        assert journal.record({"out1": 1, "out2": 0, "server_time": "2024/06/01 10:00:10"}) == 1
+        assert journal.record({"out1": 1, "out2": 0, "server_time": "2024/06/01 10:00:20"}) == 0
+        with open(journal.journal, encoding="utf-8") as journal_file:
+            assert journal_file.read() == '["out1", 1]\n'
+        assert journal.records == 1
+
+    def test_replay_applies_the_journal_to_the_snapshot(self, journal):
+        """The replay returns the latest statuses."""
+        journal.record({"out1": 0, "out2": 0})
+        journal.record({"out1": 1, "out2": 0})
+        journal.record({"out1": 1, "out2": 1, "valves": [1, 2]})
+
+        replayed = StateJournal(journal.snapshot, journal.journal).replay()
+
+        assert replayed == {"out1": 1, "out2": 1, "valves": [1, 2]}
+
+    def test_unchanged_records_count_as_writes_avoided(self, journal):
+        """Recording the same statuses again does not write."""
+        journal.record({"out1": 0, "server_time": "2024/06/01 10:00:00"})
+        for second in range(10, 60, 10):
+            journal.record({"out1": 0, "server_time": f"2024/06/01 10:00:{second}"})
+
+        assert journal.writes == 1
+        assert journal.writes_avoided == 5
+
+    def test_changes_are_coalesced_until_flushed(self, tmp_path):
+        """A burst of changes within the flush delay is written once."""
+        journal = StateJournal(str(tmp_path / "statuses.pkl"), str(tmp_path / "statuses.journal"), flush_delay=60)
+        journal.record({"out1": 1})
+        journal.record({"out1": 0})
+        journal.record({"out1": 1, "out2": 1})
+
+        assert journal.dirty
+        assert not os.path.exists(journal.journal)
+        journal.flush()
+        assert not journal.dirty
+        assert journal.writes == 1
+        assert journal.writes_avoided == 2
+        assert StateJournal(journal.snapshot, journal.journal).replay() == {"out1": 1, "out2": 1}
+
+    def test_replay_flushes_dirty_changes(self, tmp_path):
+        """Changes still waiting out the flush delay are written before the replay."""
+        journal = StateJournal(str(tmp_path / "statuses.pkl"), str(tmp_path / "statuses.journal"), flush_delay=60)
+        journal.record({"out1": 1})
+        journal.flush()
+        journal.record({"out1": 0})
+
+        assert journal.replay() == {"out1": 0}
+        assert not journal.dirty
+        assert StateJournal(journal.snapshot, journal.journal).replay() == {"out1": 0}
+
+    def test_dirty_changes_are_flushed_after_the_delay(self, tmp_path):
+        """The flush timer writes the dirty changes."""
+        journal = StateJournal(str(tmp_path / "statuses.pkl"), str(tmp_path / "statuses.journal"), flush_delay=0.05)
+        journal.record({"out1": 1})
+
+        deadline = time.monotonic() + 5
+        while journal.dirty and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not journal.dirty
+        assert StateJournal(journal.snapshot, journal.journal).replay() == {"out1": 1}
+
+    def test_compaction(self, journal):
+        """The journal is emptied into the snapshot after enough records."""
+        journal.record({"out1": 0})
+        for status in (1, 0, 1, 0):
+            journal.record({"out1": status})
+
+        assert journal.records == 0
+        assert os.path.getsize(journal.journal) == 0
+        assert StateJournal(journal.snapshot, journal.journal).replay() == {"out1": 0}
+
+    def test_replay_stops_at_a_torn_record(self, journal):
+        """A record cut short by a power loss is ignored."""
+        journal.record({"out1": 0})
+        journal.record({"out1": 1})
+        with open(journal.journal, "a", encoding="utf-8") as journal_file:
+            journal_file.write('["out1", ')
+
+        assert journal.replay() == {"out1": 1}
+        assert journal.records == 1
+
+    def test_replay_without_files(self, journal):
+        """Nothing persisted replays to no statuses."""
+        assert not journal.replay()
@@ -0,0 +1,156 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+import pytest
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from raspirri.server.lite_scheduler import LiteScheduler
+from raspirri.server.scheduler import SchedulerRegistry, DISPATCHER_JOB_ID, create_scheduler
+from raspirri.server.schedule import ON, OFF, CompiledProgram
+
+INTERVAL = 0.02
+
+
+class OnceTrigger(BaseTrigger):
+    """A trigger firing once at a given time."""
+
+    def __init__(self, run_time):  # pylint: disable=super-init-not-called
+        self.run_time = run_time
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        return self.run_time if previous_fire_time is None else None
+
+
+@pytest.fixture
+def scheduler():
+    """A started LiteScheduler, shut down after the test."""
+    lite = LiteScheduler()
+    lite.start()
+    yield lite
+    lite.shutdown()
+
+
+def rss():
+    """Get the resident set size of the process in kB, where /proc is available."""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            return next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return 0
+
+
+def measure(new_scheduler):
+    """Measure the memory allocated to run an interval job, the RSS growth and the jitter of its wake-ups."""
+    wakeups = []
+    rss_before = rss()
+    tracemalloc.start()
+    started = new_scheduler()
+    started.start()
+    started.add_job(lambda: wakeups.append(time.perf_counter()), IntervalTrigger(seconds=INTERVAL), id="job")
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    time.sleep(25 * INTERVAL)
+    rss_growth = rss() - rss_before
+    started.shutdown(wait=True)
+    jitter = [abs(later - earlier - INTERVAL) for earlier, later in zip(wakeups, wakeups[1:])]
+    return memory, rss_growth, max(jitter, default=0)
+
+
+class TestLiteScheduler:
+    """LiteScheduler Test Class"""
+
+    def test_add_get_remove_jobs(self, scheduler):
+        """jobs are added, replaced and removed by id"""
+        run_time = datetime.now(timezone.utc) + timedelta(hours=1)
+        first = scheduler.add_job(print, OnceTrigger(run_time), id="job")
+        with pytest.raises(ValueError):
+            scheduler.add_job(print, OnceTrigger(run_time), id="job")
+        second = scheduler.add_job(print, OnceTrigger(run_time), id="job", replace_existing=True)
+        assert second is not first
+        assert scheduler.get_jobs() == [second]
+        assert scheduler.get_job("job").next_run_time == run_time
+        scheduler.remove_job("job")
+        assert scheduler.get_jobs() == []
+        with pytest.raises(JobLookupError):
+            scheduler.remove_job("job")
+
+    def test_runs_due_jobs(self, scheduler, mocker):
+        """a job runs at its fire time and is dropped when its trigger has no more fire times"""
+        func = mocker.Mock()
+        scheduler.add_job(func, OnceTrigger(datetime.now(timezone.utc) + timedelta(seconds=INTERVAL)), id="job")
+        time.sleep(10 * INTERVAL)
+        func.assert_called_once_with()
+        assert scheduler.get_jobs() == []
+
+    def test_skips_misfired_jobs(self, scheduler, mocker):
+        """a job missed by more than its grace time is not run"""
+        func = mocker.Mock()
+        scheduler.add_job(func, OnceTrigger(datetime.now(timezone.utc) - timedelta(seconds=5)), id="job", misfire_grace_time=1)
+        time.sleep(5 * INTERVAL)
+        func.assert_not_called()
+
+    def test_shutdown(self, scheduler):
+        """the scheduler thread stops on shutdown"""
+        assert scheduler.running is True
+        scheduler.shutdown()
+        assert scheduler.running is False
+
+    def test_registry_backend(self, mocker):
+        """the registry schedules its dispatcher on the lite backend"""
+        assert isinstance(create_scheduler("lite"), LiteScheduler)
+        assert isinstance(create_scheduler("apscheduler"), BackgroundScheduler)
+        mocker.patch("raspirri.server.scheduler.create_scheduler", return_value=LiteScheduler())
+        SchedulerRegistry.destroy_instance()
+        registry = SchedulerRegistry()
+        try:
+            registry.start()
+            registry.schedule_valve(1, CompiledProgram("digest", {"cycle": ((10, 1, ON), (20, 1, OFF))}), mocker.Mock(), mocker.Mock())
+            assert [job.id for job in registry.scheduler.get_jobs()] == [DISPATCHER_JOB_ID]
+            registry.unschedule_valve(1)
+            assert registry.scheduler.get_jobs() == []
+        finally:
+            SchedulerRegistry.destroy_instance()
+
+    def test_benchmark_against_apscheduler(self, benchmark):
+        """the lite backend allocates less memory than APScheduler to run the same job"""
+        lite_memory, lite_rss, lite_jitter = benchmark.pedantic(measure, args=(LiteScheduler,), rounds=1, iterations=1)
+        apscheduler_memory, apscheduler_rss, apscheduler_jitter = measure(BackgroundScheduler)
+        benchmark.extra_info.update(
+            {
+                "lite_memory": lite_memory,
+                "lite_rss_kb": lite_rss,
+                "lite_jitter": lite_jitter,
+                "apscheduler_memory": apscheduler_memory,
+                "apscheduler_rss_kb": apscheduler_rss,
+                "apscheduler_jitter": apscheduler_jitter,
+            }
+        )
+        assert lite_memory < apscheduler_memory
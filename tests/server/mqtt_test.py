@@ -24,6 +24,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import json
 import threading
 import os
 from raspirri.server.mqtt import Mqtt
@@ -33,7 +34,10 @@ from raspirri.server.const import (
     MQTT_STATUS_ERR,
     MQTT_LOST_CONNECTION,
     MQTT_END,
+    MQTT_STATUS_OK,
+    MQTT_OK,
     MQTT_TOPIC_CMD,
+    MQTT_TOPIC_CONFIG,
     MQTT_TOPIC_VALVES,
     MQTT_CLIENT_ID,
     MQTT_USER,
@@ -126,6 +130,14 @@ class TestMqtt:
         mqtt_instance.on_connect(client_mock, userdata_mock, flags_mock, return_code)
         client_mock.subscribe.assert_called_with(MQTT_TOPIC_VALVES)
 
+    def test_on_connect_keeps_statuses_in_memory(self, mocker):
+        """
+        Test that MQTT OnConnect method does not reload the statuses from the statuses file on reconnection.
+        """
+        load = mocker.patch.object(Helpers, "load_toggle_statuses_from_file")
+        Mqtt().on_connect(mocker.Mock(), mocker.Mock(), mocker.Mock(), 0)
+        load.assert_not_called()
+
     def test_on_connect_starts_periodic_updates_thread(self, mocker):
         """
         Test that MQTT OnConnect method starts periodic updates thread.
@@ -160,8 +172,8 @@ class TestMqtt:
         mocker.patch("raspirri.server.mqtt.logger")
         mock_mqtt = mocker.patch("raspirri.server.mqtt.mqtt.Client")
         mock_client = mock_mqtt.return_value
-        mock_services = mocker.patch("raspirri.server.mqtt.Services")
-        mock_services.return_value.load_program_cycles_if_exists.side_effect = [None, {"program": "data"}]
+        mock_program_store = mocker.patch("raspirri.server.mqtt.ProgramStore")
+        mock_program_store.return_value.config_payload.return_value = b'[{"program": "data"}]'
 
         # Create an instance of Mqtt and call the mqtt_init method
         mqtt_instance = Mqtt()
@@ -174,4 +186,118 @@ class TestMqtt:
             MQTT_TOPIC_STATUS, MQTT_STATUS_ERR + '"' + MQTT_LOST_CONNECTION + '"' + MQTT_END, qos=1, retain=True
         )
         mock_client.connect.assert_called_with(MQTT_HOST, int(MQTT_PORT), 5)
-        mock_services.return_value.load_program_cycles_if_exists.assert_called_with(3)
+        mock_client.publish.assert_any_call(MQTT_TOPIC_CONFIG, b'[{"program": "data"}]', qos=2, retain=True)
+
+    def test_handle_config_reports_conflicts(self, mocker):
+        """
+        Test that the status of an uploaded program reports the queued cycles.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mock_services = mocker.patch("raspirri.server.mqtt.Services")
+        program = '[{"days": "mon", "tz_offset": 0, "cycles": [{"start": "08:00", "min": "30"}], "out": 2}]'
+
+        mock_services.return_value.validate_programs.return_value = {"overlaps": [], "wraparounds": []}
+        mock_services.return_value.get_schedule_conflicts.return_value = []
+        Mqtt.handle_config("client", program)
+        mock_publish.assert_called_with("client", MQTT_TOPIC_STATUS, MQTT_STATUS_OK + MQTT_OK + MQTT_END)
+
+        mock_services.return_value.get_schedule_conflicts.return_value = [{"out": 2, "start": "mon 08:00", "delay": 15}]
+        Mqtt.handle_config("client", program)
+        mock_publish.assert_called_with(
+            "client", MQTT_TOPIC_STATUS, '{"sts": 0, "res": "OK", "conflicts": [{"out": 2, "start": "mon 08:00", "delay": 15}]}'
+        )
+
+    def test_handle_config_reports_overlaps(self, mocker):
+        """
+        Test that the status of uploaded programs reports all overlaps and wraparounds at once.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mocker.patch("raspirri.server.mqtt.Services.store_program_cycles")
+        mocker.patch("raspirri.server.mqtt.Services.get_schedule_conflicts", return_value=[])
+        programs = [
+            {"days": "mon", "tz_offset": 0, "cycles": [{"start": "23:30", "min": 60}, {"start": "23:50", "min": 5}], "out": 1},
+            {"days": "tue", "tz_offset": 0, "cycles": [{"start": "00:10", "min": 10}], "out": 1, "name": "deep soak"},
+        ]
+        Mqtt.handle_config("client", json.dumps(programs))
+
+        status = json.loads(mock_publish.call_args.args[2])
+        assert status["res"] == "OK"
+        assert [(overlap["start"], overlap["overlaps"]["start"]) for overlap in status["overlaps"]] == [
+            ("mon 23:50", "mon 23:30"),
+            ("tue 00:10", "mon 23:30"),
+        ]
+        assert status["overlaps"][1]["name"] == "deep soak"
+        assert status["wraparounds"] == [{"out": 1, "start": "mon 23:30", "min": 60, "until": "tue 00:30"}]
+
+    def test_send_program_publishes_cached_payload(self, mocker):
+        """
+        Test that SEND_PROGRAM publishes the cached JSON payload of the program.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mock_program_store = mocker.patch("raspirri.server.mqtt.ProgramStore")
+        mock_program_store.return_value.get_payload.return_value = b'{"out": 2}'
+
+        Mqtt.handle_command("client", '{"cmd": 2, "out": 2}')
+        mock_program_store.return_value.get_payload.assert_called_with("2")
+        mock_publish.assert_called_with("client", MQTT_TOPIC_STATUS, b'{"out": 2}')
+
+        Mqtt.handle_command("client", '{"cmd": 2, "out": 2, "name": "deep soak"}')
+        mock_program_store.return_value.get_payload.assert_called_with("2:deep soak")
+
+    def test_send_schedule(self, mocker):
+        """
+        Test that SEND_SCHEDULE publishes the upcoming events of the valves.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mock_services = mocker.patch("raspirri.server.mqtt.Services")
+        mock_services.return_value.get_schedule.return_value = {"1": [{"time": "2024-03-19T08:30:00+00:00", "action": "on"}]}
+
+        Mqtt.handle_command("client", '{"cmd": 7, "count": 1}')
+        mock_services.return_value.get_schedule.assert_called_with(1, None)
+        mock_publish.assert_called_with(
+            "client", MQTT_TOPIC_STATUS, '{"sts": 0, "res": {"1": [{"time": "2024-03-19T08:30:00+00:00", "action": "on"}]}}'
+        )
+
+    def test_pause_programs(self, mocker):
+        """
+        Test that PAUSE_PROGRAMS pauses the programs until a moment and resumes them without one.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mock_services = mocker.patch("raspirri.server.mqtt.Services")
+        mock_services.return_value.pause_programs.return_value = "2024-03-20T00:00:00+00:00"
+
+        Mqtt.handle_command("client", '{"cmd": 8, "until": "2024-03-20T00:00:00Z"}')
+        mock_services.return_value.pause_programs.assert_called_with("2024-03-20T00:00:00Z")
+        mock_publish.assert_called_with("client", MQTT_TOPIC_STATUS, '{"sts": 0, "res": {"paused_until": "2024-03-20T00:00:00+00:00"}}')
+
+        Mqtt.handle_command("client", '{"cmd": 8}')
+        mock_services.return_value.resume_programs.assert_called_once_with()
+        mock_publish.assert_called_with("client", MQTT_TOPIC_STATUS, '{"sts": 0, "res": {"paused_until": null}}')
+
+    def test_run_valves(self, mocker):
+        """
+        Test that RUN_VALVES schedules the manual runs and publishes them.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mock_services = mocker.patch("raspirri.server.mqtt.Services")
+        runs = [{"out": 1, "start": "2024-01-01T10:06:00+00:00", "stop": "2024-01-01T10:11:00+00:00"}]
+        mock_services.return_value.run_valves.return_value = runs
+
+        Mqtt.handle_command("client", '{"cmd": 9, "out": 1, "min": 5}')
+        mock_services.return_value.run_valves.assert_called_with({"cmd": 9, "out": 1, "min": 5})
+        mock_publish.assert_called_with("client", MQTT_TOPIC_STATUS, '{"sts": 0, "res": ' + json.dumps(runs) + "}")
+
+    def test_set_water_budget(self, mocker):
+        """
+        Test that SET_WATER_BUDGET sets the budget of the device or of a valve and publishes the budgets.
+        """
+        mock_publish = mocker.patch.object(Mqtt, "publish_to_topic")
+        mock_services = mocker.patch("raspirri.server.mqtt.Services")
+        mock_services.return_value.set_water_budget.return_value = {"": 80}
+
+        Mqtt.handle_command("client", '{"cmd": 10, "budget": 80}')
+        mock_services.return_value.set_water_budget.assert_called_with(80, None)
+        mock_publish.assert_called_with("client", MQTT_TOPIC_STATUS, '{"sts": 0, "res": {"budgets": {"": 80}}}')
+
+        Mqtt.handle_command("client", '{"cmd": 10, "out": 2, "budget": null}')
+        mock_services.return_value.set_water_budget.assert_called_with(None, 2)
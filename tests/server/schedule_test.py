@@ -0,0 +1,326 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import pickle
+from datetime import date, datetime, timezone
+from raspirri.server.schedule import (
+    ON,
+    OFF,
+    MINUTES_PER_WEEK,
+    EventTable,
+    EventTableTrigger,
+    ZoneTable,
+    RunCalendar,
+    CompiledProgram,
+    build_tables,
+    format_minute_of_week,
+    sequence_cycles,
+    union_cycles,
+    find_overlaps,
+    program_key,
+    program_valve,
+    minute_of_week,
+    datetime_to_minute_of_week,
+    datetime_to_epoch_minute,
+    epoch_minute_to_datetime,
+)
+
+
+class TestEventTable:
+    """EventTable Test Class"""
+
+    def test_events_are_sorted_with_off_first(self):
+        """events are sorted by minute and turning off comes before turning on"""
+        table = EventTable([(30, 1, ON), (10, 2, OFF), (30, 2, OFF), (10, 1, ON)])
+        assert list(table) == [(10, 2, OFF), (10, 1, ON), (30, 2, OFF), (30, 1, ON)]
+        assert table.valves == (2, 1)
+
+    def test_minute_of_week(self):
+        """minutes of the week start on Monday 00:00"""
+        assert minute_of_week(0, 0, 0) == 0
+        assert minute_of_week(6, 23, 59) == MINUTES_PER_WEEK - 1
+        assert minute_of_week(7, 0, 0) == 0
+        assert datetime_to_minute_of_week(datetime(2024, 3, 19, 8, 30)) == minute_of_week(1, 8, 30)
+
+    def test_next_minute(self):
+        """the next event is found with wrap around at the end of the week"""
+        table = EventTable([(100, 1, ON), (200, 1, OFF)])
+        assert table.next_minute(0) == 100
+        assert table.next_minute(100) == 0
+        assert table.next_minute(101) == 99
+        assert table.next_minute(201) == MINUTES_PER_WEEK - 101
+        assert EventTable().next_minute(0) is None
+
+    def test_events_at(self):
+        """all events of a minute are returned"""
+        table = EventTable([(100, 1, ON), (100, 2, ON), (200, 1, OFF)])
+        assert table.events_at(100) == [(1, ON), (2, ON)]
+        assert table.events_at(100 + MINUTES_PER_WEEK) == [(1, ON), (2, ON)]
+        assert table.events_at(150) == []
+
+    def test_merge(self):
+        """tables of several valves are merged into one"""
+        table = EventTable.merge([EventTable([(200, 1, OFF), (100, 1, ON)]), EventTable([(150, 2, ON)])])
+        assert list(table) == [(100, 1, ON), (150, 2, ON), (200, 1, OFF)]
+        assert table == EventTable([(100, 1, ON), (150, 2, ON), (200, 1, OFF)])
+
+    def test_last_events(self):
+        """the latest event of every valve is found with wrap around at the start of the week"""
+        table = EventTable([(100, 1, ON), (200, 1, OFF), (300, 2, ON)])
+        assert table.last_events(250) == {1: (50, OFF), 2: (MINUTES_PER_WEEK - 50, ON)}
+        assert table.last_events(100) == {1: (0, ON), 2: (MINUTES_PER_WEEK - 200, ON)}
+        assert EventTable().last_events(0) == {}
+
+    def test_state_at(self):
+        """the required state of a valve is the action of its latest event"""
+        table = EventTable([(minute_of_week(1, 8, 30), 1, ON), (minute_of_week(1, 9, 0), 1, OFF)])
+        # 2024-03-19 is a Tuesday
+        assert table.state_at(datetime(2024, 3, 19, 8, 45, tzinfo=timezone.utc)) == {1: ON}
+        assert table.state_at(datetime(2024, 3, 19, 9, 0, tzinfo=timezone.utc)) == {1: OFF}
+
+
+class TestEventTableTrigger:
+    """EventTableTrigger Test Class"""
+
+    def test_get_next_fire_time(self):
+        """the trigger fires at the minutes of the table in UTC"""
+        trigger = EventTableTrigger(EventTable([(minute_of_week(1, 8, 30), 1, ON), (minute_of_week(1, 9, 0), 1, OFF)]))
+        # 2024-03-19 is a Tuesday
+        now = datetime(2024, 3, 19, 8, 0, 15, tzinfo=timezone.utc)
+        assert trigger.get_next_fire_time(None, now) == datetime(2024, 3, 19, 8, 30, tzinfo=timezone.utc)
+        now = datetime(2024, 3, 19, 8, 30, tzinfo=timezone.utc)
+        assert trigger.get_next_fire_time(None, now) == datetime(2024, 3, 19, 8, 30, tzinfo=timezone.utc)
+        assert trigger.get_next_fire_time(now, now) == datetime(2024, 3, 19, 9, 0, tzinfo=timezone.utc)
+        now = datetime(2024, 3, 19, 9, 0, 1, tzinfo=timezone.utc)
+        assert trigger.get_next_fire_time(None, now) == datetime(2024, 3, 26, 8, 30, tzinfo=timezone.utc)
+
+    def test_empty_table_never_fires(self):
+        """an empty table has no fire time"""
+        assert EventTableTrigger(EventTable()).get_next_fire_time(None, datetime.now(timezone.utc)) is None
+
+
+class TestZoneTable:
+    """ZoneTable Test Class"""
+
+    def test_keeps_local_start_across_dst(self):
+        """cycles keep their local start time before and after a daylight saving time change"""
+        # mon 06:00 local for 30 minutes
+        table = ZoneTable("Europe/Athens", [((minute_of_week(0, 6, 0), 1, ON), (minute_of_week(0, 6, 30), 1, OFF))])
+        trigger = EventTableTrigger(table)
+
+        # 2024-03-25 is the Monday before the change to EEST, in EET (UTC+2)
+        assert trigger.get_next_fire_time(None, datetime(2024, 3, 24, 7, 0, tzinfo=timezone.utc)) == datetime(
+            2024, 3, 25, 4, 0, tzinfo=timezone.utc
+        )
+        # 2024-04-01 is the Monday after the change to EEST (UTC+3)
+        assert trigger.get_next_fire_time(None, datetime(2024, 3, 25, 7, 0, tzinfo=timezone.utc)) == datetime(
+            2024, 4, 1, 3, 0, tzinfo=timezone.utc
+        )
+        assert table.events_on(datetime(2024, 4, 1, 3, 30, tzinfo=timezone.utc)) == [(1, OFF)]
+
+    def test_half_hour_zone(self):
+        """cycles can run in zones with half hour offsets"""
+        table = ZoneTable("Asia/Kolkata", [((minute_of_week(2, 6, 0), 2, ON), (minute_of_week(2, 7, 0), 2, OFF))])
+        # 2024-03-20 is a Wednesday, 06:00 IST is 00:30 UTC
+        assert table.events_on(datetime(2024, 3, 20, 0, 30, tzinfo=timezone.utc)) == [(2, ON)]
+        assert table.events_on(datetime(2024, 3, 20, 1, 30, tzinfo=timezone.utc)) == [(2, OFF)]
+
+    def test_cycles_stop_after_new_year(self):
+        """a cycle starting on new year's eve stops on new year's day"""
+        # 2024-12-31 is a Tuesday
+        table = ZoneTable("UTC", [((minute_of_week(1, 23, 30), 1, ON), (minute_of_week(2, 0, 30), 1, OFF))])
+        now = datetime(2024, 12, 31, 23, 45, tzinfo=timezone.utc)
+        assert table.minutes_until(now) == 45
+        assert table.events_on(datetime(2025, 1, 1, 0, 30, tzinfo=timezone.utc)) == [(1, OFF)]
+
+    def test_state_at_across_new_year(self):
+        """a cycle started on new year's eve is still running on new year's day"""
+        table = ZoneTable("UTC", [((minute_of_week(1, 23, 30), 1, ON), (minute_of_week(2, 0, 30), 1, OFF))])
+        assert table.state_at(datetime(2025, 1, 1, 0, 15, tzinfo=timezone.utc)) == {1: ON}
+        assert table.state_at(datetime(2025, 1, 1, 0, 30, tzinfo=timezone.utc)) == {1: OFF}
+
+    def test_transitions_are_compiled_once_per_year(self):
+        """the transitions of a year are expanded once"""
+        table = ZoneTable("Europe/Athens", [((minute_of_week(0, 6, 0), 1, ON), (minute_of_week(0, 6, 30), 1, OFF))])
+        first = table.transitions(2024)
+        assert table.transitions(2024) is first
+        assert len(first) == 2 * 53
+
+    def test_runs_only_on_calendar_dates(self):
+        """a table with a calendar expands its cycles only on the dates of the calendar"""
+        calendar = RunCalendar(every=3, first=date(2024, 3, 1))
+        daily = [((minute_of_week(day, 6, 0), 1, ON), (minute_of_week(day, 6, 30), 1, OFF)) for day in range(7)]
+        table = ZoneTable("UTC", daily, calendar)
+
+        assert table.events_on(datetime(2024, 3, 4, 6, 0, tzinfo=timezone.utc)) == [(1, ON)]
+        assert table.events_on(datetime(2024, 3, 5, 6, 0, tzinfo=timezone.utc)) == []
+        assert table.minutes_until(datetime(2024, 3, 4, 7, 0, tzinfo=timezone.utc)) == 3 * 24 * 60 - 60
+        assert len(table.transitions(2024)) == 2 * len([day for day in range(1, 307) if (day - 1) % 3 == 0])
+
+    def test_epoch_event_table_datetimes(self):
+        """tables without a period look up datetimes by epoch minute"""
+        minute = datetime_to_epoch_minute(datetime(2024, 3, 19, 8, 30, tzinfo=timezone.utc))
+        table = EventTable([(minute, 1, ON), (minute + 10, 1, OFF)], period=None)
+        assert epoch_minute_to_datetime(minute) == datetime(2024, 3, 19, 8, 30, tzinfo=timezone.utc)
+        assert table.events_on(datetime(2024, 3, 19, 8, 30, tzinfo=timezone.utc)) == [(1, ON)]
+        assert table.events_on(datetime(2024, 3, 26, 8, 30, tzinfo=timezone.utc)) == []
+        assert table.minutes_until(datetime(2024, 3, 19, 8, 35, tzinfo=timezone.utc)) == 5
+        assert table.state_at(datetime(2024, 3, 19, 8, 35, tzinfo=timezone.utc)) == {1: ON}
+        assert table.state_at(datetime(2024, 3, 19, 8, 0, tzinfo=timezone.utc)) == {}
+
+    def test_epoch_event_table_does_not_repeat(self):
+        """tables without a period hold epoch minutes and end after their last event"""
+        table = EventTable([(30_000_000, 1, ON), (30_000_010, 1, OFF)], period=None)
+        assert table.next_minute(29_999_990) == 10
+        assert table.next_minute(30_000_011) is None
+        assert table.events_at(30_000_010) == [(1, OFF)]
+
+
+class TestRunCalendar:
+    """RunCalendar Test Class"""
+
+    def test_every_n_days(self):
+        """the program runs every N days from the anchor date, across years"""
+        calendar = RunCalendar(every=3, first=date(2024, 12, 30))
+        assert [calendar.runs_on(date(2024, 12, 30 + day)) for day in range(2)] == [True, False]
+        assert calendar.runs_on(date(2025, 1, 2)) is True
+        assert calendar.runs_on(date(2024, 12, 27)) is False
+
+    def test_odd_and_even_dates(self):
+        """the program runs on odd or even dates of the month"""
+        odd, even = RunCalendar(parity="odd"), RunCalendar(parity="even")
+        assert odd.runs_on(date(2024, 1, 31)) and odd.runs_on(date(2024, 2, 1))
+        assert even.runs_on(date(2024, 2, 2)) and not even.runs_on(date(2024, 1, 31))
+
+    def test_date_range_and_blackout(self):
+        """the program runs within its date range and not on its blackout dates"""
+        calendar = RunCalendar(first=date(2024, 5, 1), last=date(2024, 9, 30), blackout=[date(2024, 8, 15)])
+        assert calendar.runs_on(date(2024, 5, 1)) and calendar.runs_on(date(2024, 9, 30))
+        assert not calendar.runs_on(date(2024, 4, 30)) and not calendar.runs_on(date(2024, 10, 1))
+        assert not calendar.runs_on(date(2024, 8, 15))
+
+    def test_year_is_a_bitset_compiled_once(self):
+        """the run dates of a year are a bitset of 46 bytes, compiled once"""
+        calendar = RunCalendar(parity="odd")
+        bits = calendar.year(2024)
+        assert len(bits) == 46
+        assert calendar.year(2024) is bits
+
+    def test_pickle_keeps_rules_only(self):
+        """a pickled calendar equals the original without its compiled years"""
+        calendar = RunCalendar(every=2, first=date(2024, 1, 1), blackout=[date(2024, 1, 3)])
+        calendar.year(2024)
+        restored = pickle.loads(pickle.dumps(calendar))
+        assert restored == calendar and hash(restored) == hash(calendar)
+        assert not restored.runs_on(date(2024, 1, 3)) and restored.runs_on(date(2024, 1, 5))
+
+
+def program(valve, *cycles, priority=None):
+    """Compile a weekly program of a valve from (start, minutes) cycles."""
+    return CompiledProgram(
+        str((valve, cycles)),
+        {start: ((start, valve, ON), ((start + minutes) % MINUTES_PER_WEEK, valve, OFF)) for start, minutes in cycles},
+        priority=priority,
+    )
+
+
+class TestSequenceCycles:
+    """sequence_cycles Test Class"""
+
+    def test_queues_overlapping_cycles(self):
+        """overlapping cycles wait for a free slot"""
+        table, conflicts = sequence_cycles([program(1, (100, 30)), program(2, (110, 30)), program(3, (120, 10))], 1)
+        assert list(table) == [(100, 1, ON), (130, 1, OFF), (130, 2, ON), (160, 2, OFF), (160, 3, ON), (170, 3, OFF)]
+        assert conflicts == [
+            {"out": 2, "start": "mon 01:50", "timezone": "UTC", "delay": 20},
+            {"out": 3, "start": "mon 02:00", "timezone": "UTC", "delay": 40},
+        ]
+
+    def test_queued_cycles_run_in_priority_order(self):
+        """a queued cycle of higher priority runs first even if requested later"""
+        table, conflicts = sequence_cycles([program(1, (100, 30)), program(2, (110, 30)), program(3, (120, 10), priority=0)], 1)
+        assert list(table) == [(100, 1, ON), (130, 1, OFF), (130, 3, ON), (140, 3, OFF), (140, 2, ON), (170, 2, OFF)]
+        assert [conflict["out"] for conflict in conflicts] == [2, 3]
+
+    def test_concurrent_slots(self):
+        """cycles run in parallel up to the maximum number of valves"""
+        table, conflicts = sequence_cycles([program(1, (100, 30)), program(2, (100, 30)), program(3, (100, 30))], 2)
+        assert table.events_at(100) == [(1, ON), (2, ON)]
+        assert table.events_at(130) == [(1, OFF), (2, OFF), (3, ON)]
+        assert conflicts == [{"out": 3, "start": "mon 01:40", "timezone": "UTC", "delay": 30}]
+
+    def test_cycles_running_over_the_end_of_the_week(self):
+        """a cycle running past the end of the week delays the cycles at the start of the next week"""
+        table, conflicts = sequence_cycles([program(1, (MINUTES_PER_WEEK - 10, 30)), program(2, (5, 10))], 1)
+        assert list(table) == [(20, 1, OFF), (20, 2, ON), (30, 2, OFF), (MINUTES_PER_WEEK - 10, 1, ON)]
+        assert conflicts == [{"out": 2, "start": "mon 00:05", "timezone": "UTC", "delay": 15}]
+
+    def test_build_tables_without_limit(self):
+        """programs are only merged when there is no limit"""
+        programs = [program(1, (100, 30)), program(2, (110, 30))]
+        tables, conflicts = build_tables(programs)
+        assert list(tables[0]) == [(100, 1, ON), (110, 2, ON), (130, 1, OFF), (140, 2, OFF)]
+        assert conflicts == []
+        assert build_tables(programs, 1)[1] == [{"out": 2, "start": "mon 01:50", "timezone": "UTC", "delay": 20}]
+
+    def test_union_cycles(self):
+        """overlapping and touching cycles of a valve are unioned, across the end of the week too"""
+        cycles = [(100, 30), (120, 30), (150, 10), (MINUTES_PER_WEEK - 10, 20), (5, 10), (300, 10)]
+        assert union_cycles((start, minutes, 1) for start, minutes in cycles) == [
+            (100, 60, 1),
+            (300, 10, 1),
+            (MINUTES_PER_WEEK - 10, 25, 1),
+        ]
+        assert union_cycles([(100, 30, 1), (110, 30, 2)]) == [(100, 30, 1), (110, 30, 2)]
+
+    def test_build_tables_merges_programs_of_a_valve(self):
+        """the named programs of a valve are merged without redundant toggles"""
+        tables, _ = build_tables([program(1, (100, 30), (200, 10)), program(1, (110, 60)), program(2, (120, 10))])
+        assert list(tables[0]) == [(100, 1, ON), (120, 2, ON), (130, 2, OFF), (170, 1, OFF), (200, 1, ON), (210, 1, OFF)]
+
+        table, conflicts = sequence_cycles([program(1, (100, 30)), program(1, (110, 30)), program(2, (100, 10))], 1)
+        assert list(table) == [(100, 1, ON), (140, 1, OFF), (140, 2, ON), (150, 2, OFF)]
+        assert conflicts == [{"out": 2, "start": "mon 01:40", "timezone": "UTC", "delay": 40}]
+
+    def test_find_overlaps(self):
+        """overlaps of a valve and cycles past midnight are found in one sweep, across the end of the week too"""
+        late = (MINUTES_PER_WEEK - 30, 60, 1)
+        cycles = [(10, 30, 1), (20, 5, 1), (15, 10, 2), (1430, 20, 2), late]
+        overlaps, wraparounds = find_overlaps(cycles)
+        assert overlaps == [((10, 30, 1), (20, 5, 1)), (late, (10, 30, 1)), (late, (20, 5, 1))]
+        assert wraparounds == [(1430, 20, 2), late]
+        assert find_overlaps([(10, 30, 1), (40, 10, 1)]) == ([], [])
+
+    def test_program_key(self):
+        """named programs are keyed by valve and name"""
+        assert program_key(1) == "1"
+        assert program_key(1, "morning lawn") == "1:morning lawn"
+        assert program_valve("1:morning lawn") == program_valve("1") == "1"
+
+    def test_format_minute_of_week(self):
+        """minutes of the week are formatted as day and time"""
+        assert format_minute_of_week(minute_of_week(6, 23, 5)) == "sun 23:05"
+        assert format_minute_of_week(MINUTES_PER_WEEK) == "mon 00:00"
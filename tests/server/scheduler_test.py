@@ -0,0 +1,422 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from raspirri.server.scheduler import SchedulerRegistry, DISPATCHER_JOB_ID
+from raspirri.server.schedule import (
+    ON,
+    OFF,
+    CompiledProgram,
+    EventTableTrigger,
+    RunCalendar,
+    datetime_to_epoch_minute,
+    datetime_to_minute_of_week,
+)
+from raspirri.server.services import Services
+from raspirri.server.store import ScheduleStore
+from raspirri.server.const import SCHEDULE_DB
+
+
+@pytest.fixture(autouse=True)
+def destroy():
+    """
+    A pytest fixture that is automatically used before and after each test function.
+    It is responsible for destroying the instance of the SchedulerRegistry class and its schedule database.
+    """
+    SchedulerRegistry.destroy_instance()
+    if os.path.exists(SCHEDULE_DB):
+        os.remove(SCHEDULE_DB)
+    yield
+    SchedulerRegistry.destroy_instance()
+    if os.path.exists(SCHEDULE_DB):
+        os.remove(SCHEDULE_DB)
+
+
+def compiled(*events):
+    """Compile a program of a single cycle with the given events."""
+    return CompiledProgram(str(events), {"cycle": events})
+
+
+class TestSchedulerRegistry:
+    """SchedulerRegistry Test Class"""
+
+    def test_returns_single_instance(self):
+        """a single instance of SchedulerRegistry class"""
+        assert SchedulerRegistry() is SchedulerRegistry()
+        assert SchedulerRegistry().scheduler is SchedulerRegistry().scheduler
+
+    def test_services_share_scheduler(self):
+        """every Services object uses the same scheduler"""
+        assert Services().scheduler is Services().scheduler
+
+    def test_schedule_valve_replaces_events(self, mocker):
+        """rescheduling a valve replaces its events instead of adding new ones"""
+        registry = SchedulerRegistry()
+        registry.start()
+        for minute in range(10):
+            registry.schedule_valve(1, compiled((minute, 1, ON), (minute + 30, 1, OFF)), mocker.Mock(), mocker.Mock())
+        assert [job.id for job in registry.scheduler.get_jobs()] == [DISPATCHER_JOB_ID]
+        assert list(registry.table) == [(9, 1, ON), (39, 1, OFF)]
+        assert list(registry.program(1).table) == [(9, 1, ON), (39, 1, OFF)]
+
+    def test_unschedule_valve(self, mocker):
+        """unscheduling a valve removes only its events"""
+        registry = SchedulerRegistry()
+        registry.start()
+        registry.schedule_valve(1, compiled((10, 1, ON), (20, 1, OFF)), mocker.Mock(), mocker.Mock())
+        registry.schedule_valve(2, compiled((10, 2, ON), (20, 2, OFF)), mocker.Mock(), mocker.Mock())
+
+        assert registry.unschedule_valve(1) is True
+        assert registry.unschedule_valve(1) is False
+        assert list(registry.table) == [(10, 2, ON), (20, 2, OFF)]
+        assert registry.unschedule_valve("2") is True
+        assert registry.scheduler.get_jobs() == []
+
+    def test_dispatch_calls_handlers_of_current_minute(self, mocker):
+        """the dispatcher runs the handlers of every event due now"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        minute = datetime_to_minute_of_week(now)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((minute, 1, ON), (minute + 5, 1, OFF)), turn_on, turn_off)
+        registry.schedule_valve(2, compiled((minute - 5, 2, ON), (minute, 2, OFF)), turn_on, turn_off)
+
+        events = registry.dispatch(now)
+
+        assert events == [(2, OFF), (1, ON)]
+        turn_on.assert_called_once_with(1)
+        turn_off.assert_called_once_with(2)
+
+    def test_start_is_idempotent(self):
+        """starting the registry twice starts the scheduler once"""
+        registry = SchedulerRegistry()
+        registry.start()
+        registry.start()
+        assert registry.scheduler_started is True
+        assert registry.scheduler.running is True
+
+    def test_schedule_valve_persists_program(self, mocker):
+        """scheduling and unscheduling a valve updates the schedule store"""
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((10, 1, ON), (20, 1, OFF)), mocker.Mock(), mocker.Mock())
+        assert list(ScheduleStore().load_programs()["1"].table) == [(10, 1, ON), (20, 1, OFF)]
+        registry.unschedule_valve(1)
+        assert ScheduleStore().load_programs() == {}
+
+    def test_restore_reconciles_valves(self, mocker):
+        """restoring the stored programs turns on the valves that should be running now"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        SchedulerRegistry().schedule_valve(1, compiled((start - 5, 1, ON), (start + 25, 1, OFF)), mocker.Mock(), mocker.Mock())
+        SchedulerRegistry().schedule_valve(2, compiled((start - 50, 2, ON), (start - 20, 2, OFF)), mocker.Mock(), mocker.Mock())
+        SchedulerRegistry.destroy_instance()
+
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        mocker.patch("raspirri.server.scheduler.datetime", wraps=datetime, now=mocker.Mock(return_value=now))
+        assert sorted(registry.restore(turn_on, turn_off)) == ["1", "2"]
+
+        turn_on.assert_called_once_with(1)
+        turn_off.assert_called_once_with(2)
+        assert registry.last_dispatch == now
+        assert list(registry.table) == [(start - 50, 2, ON), (start - 20, 2, OFF), (start - 5, 1, ON), (start + 25, 1, OFF)]
+
+    def test_restore_named_programs(self, mocker):
+        """the named programs of a valve are restored side by side and unscheduled one by one"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        SchedulerRegistry().schedule_valve(1, compiled((start - 5, 1, ON), (start + 25, 1, OFF)), mocker.Mock(), mocker.Mock(), "lawn")
+        SchedulerRegistry().schedule_valve(1, compiled((start + 20, 1, ON), (start + 40, 1, OFF)), mocker.Mock(), mocker.Mock(), "soak")
+        SchedulerRegistry.destroy_instance()
+
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        mocker.patch("raspirri.server.scheduler.datetime", wraps=datetime, now=mocker.Mock(return_value=now))
+        assert sorted(registry.restore(turn_on, turn_off)) == ["1:lawn", "1:soak"]
+        turn_on.assert_called_once_with(1)
+        assert list(registry.table) == [(start - 5, 1, ON), (start + 40, 1, OFF)]
+
+        assert registry.unschedule_valve(1, "lawn") is True
+        assert registry.program(1, "lawn") is None
+        assert list(registry.table) == [(start + 20, 1, ON), (start + 40, 1, OFF)]
+
+    def test_dispatch_catches_up_missed_events(self, mocker):
+        """events missed within the grace time are run, once per valve when coalescing"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start - 4, 1, ON), (start - 2, 1, OFF)), turn_on, turn_off)
+        registry.schedule_valve(2, compiled((start - 3, 2, ON), (start + 5, 2, OFF)), turn_on, turn_off)
+        registry.schedule_valve(3, compiled((start - 60, 3, ON), (start + 5, 3, OFF)), turn_on, turn_off)
+        registry.reconcile(now - timedelta(minutes=5))
+        turn_on.reset_mock()
+        turn_off.reset_mock()
+
+        assert registry.dispatch(now) == [(2, ON), (1, OFF)]
+        turn_off.assert_called_once_with(1)
+        turn_on.assert_called_once_with(2)
+        assert registry.dispatch(now) == []
+
+    def test_dispatch_combines_weekly_and_zone_programs(self, mocker):
+        """a valve of a weekly and a zone program stays on while either keeps it on"""
+        now = datetime(2024, 1, 1, 6, 0, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start, 1, ON), (start + 60, 1, OFF)), turn_on, turn_off, "lawn")
+        events = ((start + 30, 1, ON), (start + 90, 1, OFF))
+        registry.schedule_valve(1, CompiledProgram(str(events), {"cycle": events}, zone="UTC"), turn_on, turn_off, "soak")
+        registry.reconcile(now - timedelta(minutes=1))
+        turn_off.reset_mock()
+
+        dispatched = {minutes: registry.dispatch(now + timedelta(minutes=minutes)) for minutes in range(0, 91)}
+        assert {minutes: events for minutes, events in dispatched.items() if events} == {0: [(1, ON)], 90: [(1, OFF)]}
+        turn_on.assert_called_once_with(1)
+        turn_off.assert_called_once_with(1)
+        assert registry.upcoming(2, now=now - timedelta(minutes=1)) == {
+            "1": [{"time": "2024-01-01T06:00:00+00:00", "action": "on"}, {"time": "2024-01-01T07:30:00+00:00", "action": "off"}]
+        }
+
+    def test_dispatch_applies_events_in_one_batch(self, mocker):
+        """the valve actions of one dispatch run inside a single batch"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        calls = []
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start, 1, ON), (start + 5, 1, OFF)), lambda valve: calls.append(("on", valve)), mocker.Mock())
+        registry.schedule_valve(2, compiled((start, 2, ON), (start + 5, 2, OFF)), lambda valve: calls.append(("on", valve)), mocker.Mock())
+        registry.reconcile(now - timedelta(minutes=1))
+        batch = mocker.MagicMock()
+        batch.return_value.__enter__.side_effect = lambda: calls.append("enter")
+        batch.return_value.__exit__.side_effect = lambda *args: calls.append("exit")
+        registry.batch = batch
+
+        registry.dispatch(now)
+
+        assert calls == ["enter", ("on", 1), ("on", 2), "exit"]
+
+    def test_dispatch_skips_events_older_than_grace_time(self, mocker):
+        """events missed longer than the grace time ago are not run"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start - 30, 1, ON), (start + 30, 1, OFF)), turn_on, turn_off)
+        registry.reconcile(now - timedelta(hours=1))
+
+        assert registry.dispatch(now) == []
+        turn_on.assert_not_called()
+
+    def test_last_dispatch_survives_restart(self):
+        """the last dispatched minute is read back from the store"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        SchedulerRegistry().reconcile(now)
+        SchedulerRegistry.destroy_instance()
+        assert SchedulerRegistry().last_dispatch == now
+
+    def test_schedule_valve_reports_conflicts(self, mocker):
+        """overlapping cycles are queued when the number of open valves is limited"""
+        mocker.patch("raspirri.server.scheduler.MAX_CONCURRENT_VALVES", 1)
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((100, 1, ON), (130, 1, OFF)), mocker.Mock(), mocker.Mock())
+        assert registry.conflicts == []
+        registry.schedule_valve(2, compiled((110, 2, ON), (140, 2, OFF)), mocker.Mock(), mocker.Mock())
+        assert registry.conflicts == [{"out": 2, "start": "mon 01:50", "timezone": "UTC", "delay": 20}]
+        assert list(registry.table) == [(100, 1, ON), (130, 1, OFF), (130, 2, ON), (160, 2, OFF)]
+
+    def test_upcoming_events(self, mocker):
+        """the next events of every valve are read from the compiled tables"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start + 5, 1, ON), (start + 35, 1, OFF)), mocker.Mock(), mocker.Mock())
+        registry.schedule_valve(2, compiled((start - 5, 2, ON), (start + 10, 2, OFF)), mocker.Mock(), mocker.Mock())
+
+        assert registry.upcoming(3, now=now) == {
+            "1": [
+                {"time": "2024-01-01T10:10:00+00:00", "action": "on"},
+                {"time": "2024-01-01T10:40:00+00:00", "action": "off"},
+                {"time": "2024-01-08T10:10:00+00:00", "action": "on"},
+            ],
+            "2": [
+                {"time": "2024-01-01T10:15:00+00:00", "action": "off"},
+                {"time": "2024-01-08T10:00:00+00:00", "action": "on"},
+                {"time": "2024-01-08T10:15:00+00:00", "action": "off"},
+            ],
+        }
+        assert registry.upcoming(1, valve=2, now=now) == {"2": [{"time": "2024-01-01T10:15:00+00:00", "action": "off"}]}
+        assert registry.upcoming(1, valve=3, now=now) == {}
+        assert registry.upcoming(0, now=now) == {"1": [], "2": []}
+
+    def test_upcoming_events_of_named_programs(self, mocker):
+        """the events of the named programs of a valve are returned under the valve"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start + 5, 1, ON), (start + 10, 1, OFF)), mocker.Mock(), mocker.Mock(), "morning")
+        registry.schedule_valve(1, compiled((start + 60, 1, ON), (start + 65, 1, OFF)), mocker.Mock(), mocker.Mock(), "evening")
+
+        expected = {
+            "1": [
+                {"time": "2024-01-01T10:10:00+00:00", "action": "on"},
+                {"time": "2024-01-01T10:15:00+00:00", "action": "off"},
+                {"time": "2024-01-01T11:05:00+00:00", "action": "on"},
+            ]
+        }
+        assert registry.upcoming(3, now=now) == expected
+        assert registry.upcoming(3, valve=1, now=now) == expected
+
+    def test_upcoming_events_of_recurring_programs(self, mocker):
+        """the events of programs running less often than weekly are found months ahead"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        events = ((start + 5, 1, ON), (start + 10, 1, OFF))
+        calendar = RunCalendar(every=30, first=date(2024, 1, 1))
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, CompiledProgram(str(events), {"cycle": events}, calendar=calendar), mocker.Mock(), mocker.Mock())
+
+        # the Monday cycle runs on the Mondays 30 days apart, every 210 days
+        assert registry.upcoming(3, now=now) == {
+            "1": [
+                {"time": "2024-01-01T10:10:00+00:00", "action": "on"},
+                {"time": "2024-01-01T10:15:00+00:00", "action": "off"},
+                {"time": "2024-07-29T10:10:00+00:00", "action": "on"},
+            ]
+        }
+
+    def test_upcoming_events_stop_at_the_end_of_calendars(self, mocker):
+        """the search stops at the last date of the calendars, skips valves without events and caps the count"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        events = ((start + 5, 1, ON), (start + 10, 1, OFF))
+        calendar = RunCalendar(first=date(2024, 1, 1), last=date(2024, 1, 8))
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, CompiledProgram(str(events), {"cycle": events}, calendar=calendar), mocker.Mock(), mocker.Mock())
+        registry.schedule_valve(2, CompiledProgram("empty", {}), mocker.Mock(), mocker.Mock())
+        mocker.patch("raspirri.server.scheduler.MAX_UPCOMING_EVENTS", 3)
+        trigger = mocker.spy(EventTableTrigger, "get_next_fire_time")
+
+        assert registry.upcoming(10, now=now) == {
+            "1": [
+                {"time": "2024-01-01T10:10:00+00:00", "action": "on"},
+                {"time": "2024-01-01T10:15:00+00:00", "action": "off"},
+                {"time": "2024-01-08T10:10:00+00:00", "action": "on"},
+            ]
+        }
+        assert registry.upcoming(10, now=datetime(2024, 1, 9, 1, 0, tzinfo=timezone.utc)) == {}
+        # one lookup per event found and one per search, instead of years of events
+        assert trigger.call_count == 5
+
+    def test_pause_and_resume(self, mocker):
+        """pausing turns off the valves open now, survives a restart and resumes at its moment"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start - 5, 1, ON), (start + 25, 1, OFF)), turn_on, turn_off)
+        registry.schedule_valve(2, compiled((start + 5, 2, ON), (start + 25, 2, OFF)), turn_on, turn_off)
+        assert registry.is_paused(now) is False
+
+        until = now + timedelta(hours=2)
+        assert registry.pause(until, now) == until
+        turn_off.assert_called_once_with(1)
+        assert registry.is_paused(now) is True
+        assert registry.is_paused(until) is False
+
+        SchedulerRegistry.destroy_instance()
+        registry = SchedulerRegistry()
+        assert registry.paused_until == until
+        registry.resume()
+        assert registry.is_paused(now) is False
+        SchedulerRegistry.destroy_instance()
+        assert SchedulerRegistry().paused_until is None
+
+    def test_manual_runs(self, mocker):
+        """manual runs turn their valves on in sequence and off automatically"""
+        now = datetime(2024, 1, 1, 10, 5, 30, tzinfo=timezone.utc)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.start()
+        registry.reconcile(now)
+
+        registry.run([(1, 5), (2, 5)], turn_on, turn_off, now)
+        turn_on.assert_called_once_with(1)
+        assert registry.upcoming_runs() == [
+            {"out": 1, "start": "2024-01-01T10:05:00+00:00", "stop": "2024-01-01T10:11:00+00:00"},
+            {"out": 2, "start": "2024-01-01T10:11:00+00:00", "stop": "2024-01-01T10:16:00+00:00"},
+        ]
+        assert [job.id for job in registry.scheduler.get_jobs()] == [DISPATCHER_JOB_ID]
+
+        assert registry.dispatch(datetime(2024, 1, 1, 10, 11, tzinfo=timezone.utc)) == [(1, OFF), (2, ON)]
+        assert len(registry.runs) == 1
+        assert registry.dispatch(datetime(2024, 1, 1, 10, 16, tzinfo=timezone.utc)) == [(2, OFF)]
+        assert registry.runs == []
+        assert registry.scheduler.get_jobs() == []
+
+    def test_manual_runs_survive_restart(self, mocker):
+        """pending manual runs are restored and their valves reconciled after a restart"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        SchedulerRegistry().run([(1, 5), (2, 5)], mocker.Mock(), mocker.Mock(), now)
+        SchedulerRegistry.destroy_instance()
+
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        minute = datetime_to_epoch_minute(now)
+        assert registry.runs == [(1, minute, minute + 5), (2, minute + 5, minute + 10)]
+        mocker.patch("raspirri.server.scheduler.datetime", wraps=datetime, now=mocker.Mock(return_value=now + timedelta(minutes=7)))
+        registry.restore(turn_on, turn_off)
+        turn_off.assert_called_once_with(1)
+        turn_on.assert_called_once_with(2)
+
+    def test_manual_runs_use_their_own_handlers(self, mocker):
+        """the events of manual runs go to the manual run handlers, also for valves with programs"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        start = datetime_to_minute_of_week(now)
+        program_on, program_off, run_on, run_off = mocker.Mock(), mocker.Mock(), mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.schedule_valve(1, compiled((start + 60, 1, ON), (start + 70, 1, OFF)), program_on, program_off)
+        registry.run([(1, 5)], run_on, run_off, now)
+        run_on.assert_called_once_with(1)
+
+        assert registry.dispatch(now + timedelta(minutes=5)) == [(1, OFF)]
+        run_off.assert_called_once_with(1)
+        program_off.assert_not_called()
+
+    def test_manual_runs_replace_pending_runs(self, mocker):
+        """a new request cancels the pending manual runs and turns off their open valves"""
+        now = datetime(2024, 1, 1, 10, 5, tzinfo=timezone.utc)
+        turn_on, turn_off = mocker.Mock(), mocker.Mock()
+        registry = SchedulerRegistry()
+        registry.run([(1, 5)], turn_on, turn_off, now)
+        registry.run([(2, 5)], turn_on, turn_off, now + timedelta(minutes=1))
+        turn_off.assert_called_once_with(1)
+        turn_on.assert_called_with(2)
+        registry.run([], turn_on, turn_off, now + timedelta(minutes=2))
+        turn_off.assert_called_with(2)
+        assert registry.runs == []
@@ -28,11 +28,27 @@ import os
 import subprocess
 import json
 import unittest
+from datetime import date, datetime, timedelta, timezone
 from unittest.mock import MagicMock
 import pytest
 from loguru import logger
 from raspirri.server.services import Services
-from raspirri.server.const import RPI_HW_ID, MQTT_HOST, MQTT_PORT, MQTT_USER, MQTT_PASS, PROGRAM, ARCH, MAX_NUM_OF_BYTES_CHUNK
+from raspirri.server.scheduler import SchedulerRegistry, REFRESH_JOB_ID
+from raspirri.server.store import ProgramStore, ScheduleStore
+from raspirri.server.exceptions import DayValueException, LocationValueException, TimezoneValueException
+from raspirri.server.schedule import ON, OFF, minute_of_week
+from raspirri.server.const import (
+    DAYS,
+    SCHEDULE_DB,
+    RPI_HW_ID,
+    MQTT_HOST,
+    MQTT_PORT,
+    MQTT_USER,
+    MQTT_PASS,
+    PROGRAM,
+    ARCH,
+    MAX_NUM_OF_BYTES_CHUNK,
+)
 
 
 if ARCH == "arm":
@@ -65,8 +81,12 @@ else:
 def setup():
     """
     A pytest fixture that is automatically used before and after each test function.
-    It is responsible for deleting all programs json files.
+    It is responsible for deleting all programs json files and destroying the shared scheduler.
     """
+    SchedulerRegistry.destroy_instance()
+    ProgramStore.destroy_instance()
+    if os.path.exists(SCHEDULE_DB):
+        os.remove(SCHEDULE_DB)
     # delete all json files first
     # List all files in the directory
     files = os.listdir(".")
@@ -136,6 +156,29 @@ class TestServices:
 
         assert result == program_data
 
+    def test_bootstrap_schedule_without_broker(self, mocker):
+        """stored program files are migrated and scheduled from local storage without connecting to the MQTT broker"""
+        mock_client = mocker.patch("raspirri.server.mqtt.mqtt.Client")
+        program_data = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "08:00", "min": "30"}], "out": 2}
+        with open(PROGRAM + "2.json", "w", encoding="utf-8") as outfile:
+            json.dump(program_data, outfile)
+
+        services = Services()
+        assert services.bootstrap_schedule() == ["2"]
+        assert services.scheduler_started is True
+        assert [job.id for job in services.scheduler.get_jobs()] == ["program_dispatcher"]
+        mock_client.assert_not_called()
+
+        assert not os.path.exists(PROGRAM + "2.json")
+        assert ProgramStore().get(2) == program_data
+
+        # after a restart the programs are restored from the schedule store
+        SchedulerRegistry.destroy_instance()
+        ProgramStore.destroy_instance()
+        services = Services()
+        assert services.bootstrap_schedule() == ["2"]
+        assert list(services.compile_program_cycles(program_data)) == list(SchedulerRegistry().table)
+
     def test_invalid_cycle_in_store_program_cycles(self):
         """invalid cycle in store program cycles"""
 
@@ -340,13 +383,18 @@ class TestServices:
             "out": "output_device",
         }
         services.store_program_cycles(json_data, store=False)
-        assert services.scheduler.add_job.call_count == 2
+        assert services.scheduler.add_job.call_count == 1
 
-        # Test case 2: Valid data, store=True
-        services.store_program_cycles(json_data, store=True)
-        assert services.scheduler.add_job.call_count == 4
+        # Test case 2: Unchanged data, store=True
+        assert services.store_program_cycles(json_data, store=True) is False
+        assert services.scheduler.add_job.call_count == 1
+
+        # Test case 3: Changed data, store=True
+        json_data["cycles"].append({"min": 10, "start": "18:00"})
+        assert services.store_program_cycles(json_data, store=True) is True
+        assert services.scheduler.add_job.call_count == 2
 
-        # Test case 3: Exception handling
+        # Test case 4: Exception handling
         json_data_exception = {
             "days": "mon1,tue",
             "cycles": [{"min": 30, "start": "12:00"}, {"min": 45, "start": "15:30"}],
@@ -507,7 +555,7 @@ class TestServices:
         services.store_program_cycles(json_data, store=False)
 
         assert services.scheduler_started is True
-        assert len(services.scheduler.get_jobs()) == 2
+        assert len(services.scheduler.get_jobs()) == 1
 
     def test_store_program_cycles_ignore_invalid_cycles(self):
         """Ignore cycles with min <= 0 and do not add them to the scheduler."""
@@ -522,7 +570,25 @@ class TestServices:
         services.store_program_cycles(json_data, store=True)
 
         assert services.scheduler_started is True
-        assert len(services.scheduler.get_jobs()) == 2
+        assert len(services.scheduler.get_jobs()) == 0
+
+    def test_store_program_cycles_replaces_valve_jobs(self):
+        """Re-uploading a program replaces the jobs of the valve and delete removes them."""
+        json_data = {
+            "days": "mon,tue,wed",
+            "tz_offset": 2,
+            "cycles": [{"start": "08:00", "min": 30}, {"start": "12:00", "min": 45}],
+            "out": 1,
+        }
+
+        services = Services()
+        for _ in range(5):
+            Services().store_program_cycles(json_data, store=True)
+
+        assert len(services.scheduler.get_jobs()) == 1
+        assert len(SchedulerRegistry().table) == 12
+        assert services.delete_program(1) is True
+        assert len(services.scheduler.get_jobs()) == 0
 
     def test_store_program_cycles_success(self):
         """Successfully store program cycles and schedule them using the scheduler."""
@@ -537,7 +603,288 @@ class TestServices:
         services.store_program_cycles(json_data, store=True)
 
         assert services.scheduler_started is True
-        assert len(services.scheduler.get_jobs()) == 2
+        assert len(services.scheduler.get_jobs()) == 1
+
+    def test_store_program_cycles_compiles_only_changed_cycles(self, mocker):
+        """An updated program only compiles its new cycles and an unchanged program is not rewritten."""
+        json_data = {
+            "days": "mon,tue",
+            "tz_offset": 2,
+            "cycles": [{"start": "08:00", "min": 30}, {"start": "12:00", "min": 45}],
+            "out": 1,
+        }
+
+        services = Services()
+        assert services.store_program_cycles(json_data, store=True) is True
+
+        compile_cycle = mocker.spy(services, "compile_cycle")
+        save_program_data = mocker.spy(ScheduleStore, "save_program_data")
+        assert services.store_program_cycles(dict(reversed(list(json_data.items()))), store=True) is False
+        assert compile_cycle.call_count == 0
+        assert save_program_data.call_count == 0
+
+        json_data = dict(json_data, cycles=[{"start": "08:00", "min": 30}, {"start": "18:00", "min": 5}])
+        assert services.store_program_cycles(json_data, store=True) is True
+        assert compile_cycle.call_count == 2
+        assert SchedulerRegistry().table == services.compile_program_cycles(json_data)
+        assert save_program_data.call_count == 1
+        assert ScheduleStore().load_program_data() == {"1": json_data}
+
+    def test_store_named_programs_of_a_valve(self):
+        """Named programs of a valve are kept side by side and merged into one table without redundant toggles."""
+        morning = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 30}], "out": 1, "name": "morning lawn"}
+        soak = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:15", "min": 60}], "out": 1, "name": "deep soak"}
+
+        services = Services()
+        services.store_program_cycles(morning, store=True)
+        services.store_program_cycles(soak, store=True)
+        services.store_program_cycles(morning, store=True)
+
+        assert ProgramStore().keys_of(1) == ["1:deep soak", "1:morning lawn"]
+        assert list(SchedulerRegistry().table) == [(minute_of_week(0, 6, 0), 1, ON), (minute_of_week(0, 7, 15), 1, OFF)]
+
+        assert services.delete_program(1, "deep soak") is True
+        assert list(SchedulerRegistry().table) == [(minute_of_week(0, 6, 0), 1, ON), (minute_of_week(0, 6, 30), 1, OFF)]
+        assert services.delete_program(1) is True
+        assert ProgramStore().keys_of(1) == []
+        assert len(SchedulerRegistry().table) == 0
+        assert services.delete_program(1) is False
+
+    def test_store_recurring_program(self):
+        """Programs recurring every N days run on the local dates of their calendar."""
+        json_data = {"tz_offset": 2, "cycles": [{"start": "06:00", "min": 30}], "out": 1, "every": 3, "start_date": "2024-03-01"}
+
+        Services().store_program_cycles(json_data)
+
+        table = SchedulerRegistry().zone_tables[0]
+        assert table.zone == "Etc/GMT-2"
+        # 2024-03-04 06:00 local is 04:00 UTC
+        assert table.events_on(datetime(2024, 3, 4, 4, 0, tzinfo=timezone.utc)) == [(1, ON)]
+        assert table.events_on(datetime(2024, 3, 5, 4, 0, tzinfo=timezone.utc)) == []
+
+    def test_validate_recurring_programs(self):
+        """Recurring programs are left out of the weekly overlap check, but not of the check for cycles past midnight."""
+        programs = [
+            {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 30}], "out": 1},
+            {"dates": "odd", "tz_offset": 0, "cycles": [{"start": "06:10", "min": 30}], "out": 1, "name": "odd"},
+            {"dates": "even", "tz_offset": 0, "cycles": [{"start": "06:20", "min": 30}], "out": 1, "name": "even"},
+            {"every": 2, "start_date": "2024-03-01", "days": "sun", "tz_offset": 0, "cycles": [{"start": "23:50", "min": 20}], "out": 2},
+        ]
+
+        assert Services().validate_programs(programs) == {
+            "overlaps": [],
+            "wraparounds": [{"out": 2, "start": "sun 23:50", "min": 20, "until": "mon 00:10"}],
+        }
+
+    def test_compile_calendar(self):
+        """Recurrence fields compile to a calendar, weekly programs have none."""
+        services = Services()
+        json_data = {"days": "mon,tue", "dates": "odd", "end_date": "2024-09-30", "blackout": ["2024-08-13"], "tz_offset": 0}
+        calendar = services.compile_calendar(json_data)
+
+        assert services.get_program_days(json_data) == ["mon", "tue"]
+        assert services.get_program_days({"dates": "even"}) == DAYS
+        assert calendar.runs_on(date(2024, 8, 5)) and not calendar.runs_on(date(2024, 8, 6))
+        assert not calendar.runs_on(date(2024, 8, 13)) and not calendar.runs_on(date(2024, 10, 1))
+        assert services.compile_calendar({"days": "mon", "tz_offset": 0}) is None
+
+    @pytest.mark.parametrize(
+        "recurrence, exception",
+        [
+            ({"every": 3}, DayValueException),
+            ({"every": 0, "start_date": "2024-03-01"}, TypeError),
+            ({"dates": "prime"}, DayValueException),
+            ({"blackout": ["15/08/2024"]}, DayValueException),
+        ],
+    )
+    def test_compile_calendar_invalid(self, recurrence, exception):
+        """Raise an exception for invalid recurrence fields."""
+        with pytest.raises(exception):
+            Services().compile_calendar(recurrence)
+
+    def test_set_water_budget_recomputes_stop_events(self, mocker):
+        """A water budget scales the cycle durations, recomputing only the stop events of the affected valves."""
+        services = Services()
+        services.store_program_cycles({"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 20}], "out": 1}, store=True)
+        services.store_program_cycles({"days": "mon", "tz_offset": 0, "cycles": [{"start": "07:00", "min": 10}], "out": 2}, store=True)
+        compile_cycle = mocker.spy(services, "compile_cycle")
+
+        assert services.set_water_budget(150, 1) == {"1": 150}
+        assert compile_cycle.call_count == 0
+        assert SchedulerRegistry().table.events_at(minute_of_week(0, 6, 30)) == [(1, OFF)]
+        assert SchedulerRegistry().table.events_at(minute_of_week(0, 7, 10)) == [(2, OFF)]
+
+        services.set_water_budget(50)
+        assert SchedulerRegistry().table.events_at(minute_of_week(0, 7, 5)) == [(2, OFF)]
+        assert SchedulerRegistry().table.events_at(minute_of_week(0, 6, 30)) == [(1, OFF)]
+
+        services.set_water_budget(None, 1)
+        assert SchedulerRegistry().table.events_at(minute_of_week(0, 6, 10)) == [(1, OFF)]
+        assert compile_cycle.call_count == 0
+
+    def test_monthly_water_budget(self):
+        """Monthly budgets scale the cycles by the percentage of the month, and a zero budget skips them."""
+        services = Services()
+        ProgramStore().set_budget(None, [0] * 6 + [200] * 6)
+        json_data = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 20}], "out": 1}
+
+        assert len(services.compile_program(json_data, now=datetime(2024, 3, 1, tzinfo=timezone.utc)).table) == 0
+        assert list(services.compile_program(json_data, now=datetime(2024, 8, 1, tzinfo=timezone.utc)).table) == [
+            (minute_of_week(0, 6, 0), 1, ON),
+            (minute_of_week(0, 6, 40), 1, OFF),
+        ]
+        assert services.scale_minutes(3, 10) == 1
+
+    @pytest.mark.parametrize("budget", [-1, 1000, "80", [100] * 11])
+    def test_set_water_budget_invalid(self, budget):
+        """Raise ValueError for budgets that are not percentages or 12 monthly percentages."""
+        with pytest.raises(ValueError):
+            Services().set_water_budget(budget)
+
+    def test_compile_program_cycles(self):
+        """Compile program cycles into UTC minute of week events."""
+        json_data = {
+            "days": "mon,sun",
+            "tz_offset": 2,
+            "cycles": [{"start": "01:00", "min": 30}, {"start": "11:30 pm", "min": 90}],
+            "out": 1,
+        }
+
+        table = Services().compile_program_cycles(json_data)
+
+        assert list(table) == [
+            (minute_of_week(0, 21, 30), 1, ON),
+            (minute_of_week(0, 23, 0), 1, OFF),
+            (minute_of_week(5, 23, 0), 1, ON),
+            (minute_of_week(5, 23, 30), 1, OFF),
+            (minute_of_week(6, 21, 30), 1, ON),
+            (minute_of_week(6, 23, 0), 1, OFF),
+            (minute_of_week(6, 23, 0), 1, ON),
+            (minute_of_week(6, 23, 30), 1, OFF),
+        ]
+
+    def test_compile_program_cycles_with_cycle_and_soak(self):
+        """Cycles longer than max_run are split into run segments separated by soak minutes."""
+        json_data = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 25}], "out": 1, "max_run": 10, "soak": 20}
+
+        table = Services().compile_program_cycles(json_data)
+
+        assert list(table) == [
+            (minute_of_week(0, 6, 0), 1, ON),
+            (minute_of_week(0, 6, 10), 1, OFF),
+            (minute_of_week(0, 6, 30), 1, ON),
+            (minute_of_week(0, 6, 40), 1, OFF),
+            (minute_of_week(0, 7, 0), 1, ON),
+            (minute_of_week(0, 7, 5), 1, OFF),
+        ]
+
+    def test_store_program_cycles_with_cycle_and_soak(self):
+        """The max_run and soak arguments are stored with the program and short cycles are not split."""
+        json_data = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 10}, {"start": "20:00", "min": 30}], "out": 1}
+
+        services = Services()
+        services.store_program_cycles(json_data, store=True, max_run=15, soak=30)
+
+        assert len(SchedulerRegistry().table) == 6
+        assert ProgramStore().get(1) == dict(json_data, max_run=15, soak=30)
+        assert services.split_cycle(10, 15, 30) == [(0, 10)]
+        assert services.split_cycle(30, 15, 30) == [(0, 15), (45, 15)]
+        assert services.split_cycle(30, 0, 30) == [(0, 30)]
+
+    def test_store_program_cycles_invalid_cycle_and_soak(self):
+        """Raise TypeError if max_run or soak is not a non-negative integer."""
+        json_data = {"days": "mon", "tz_offset": 0, "cycles": [{"start": "06:00", "min": 10}], "out": 1}
+
+        with pytest.raises(TypeError):
+            Services().store_program_cycles(json_data, max_run=-1)
+        with pytest.raises(TypeError):
+            Services().store_program_cycles(json_data, soak="5")
+
+    def test_compile_program_with_solar_starts(self, monkeypatch):
+        """Cycles relative to sunrise or sunset start at the local sun times of the next date of their day."""
+        monkeypatch.setattr("raspirri.server.compiler.LATITUDE", "37.98")
+        monkeypatch.setattr("raspirri.server.compiler.LONGITUDE", "23.73")
+        json_data = {"days": "fri", "timezone": "Europe/Athens", "cycles": [{"start": "sunrise-30min", "min": 20}], "out": 1}
+
+        services = Services()
+        # Friday 2024-06-21, sunrise at 06:02 EEST
+        starts = services.resolve_solar_starts(json_data, "Europe/Athens", datetime(2024, 6, 18, tzinfo=timezone.utc))
+        assert starts == {("fri", "sunrise-30min"): "05:32"}
+
+        program = services.compile_program(json_data, now=datetime(2024, 6, 18, tzinfo=timezone.utc))
+        assert list(program.cycles) == [(1, "fri", "05:32", 20, "Europe/Athens")]
+
+    def test_compile_program_solar_refresh_is_incremental(self, mocker, monkeypatch):
+        """Only the solar cycles are compiled again when the sun times move."""
+        monkeypatch.setattr("raspirri.server.compiler.LATITUDE", "37.98")
+        monkeypatch.setattr("raspirri.server.compiler.LONGITUDE", "23.73")
+        json_data = {
+            "days": "mon",
+            "tz_offset": 2,
+            "cycles": [{"start": "06:00", "min": 10}, {"start": "sunset", "min": 15}],
+            "out": 1,
+        }
+
+        services = Services()
+        program = services.compile_program(json_data, now=datetime(2024, 3, 1, tzinfo=timezone.utc))
+        assert services.compile_program(json_data, program, now=datetime(2024, 3, 2, tzinfo=timezone.utc)) is program
+
+        compile_cycle = mocker.spy(services, "compile_cycle")
+        refreshed = services.compile_program(json_data, program, now=datetime(2024, 3, 5, tzinfo=timezone.utc))
+        assert refreshed is not program
+        assert compile_cycle.call_count == 1
+        assert refreshed.cycles[(1, "mon", "06:00", 10, 2)] is program.cycles[(1, "mon", "06:00", 10, 2)]
+
+    def test_store_program_cycles_with_solar_starts(self, monkeypatch):
+        """Programs following the sun are refreshed by an hourly job."""
+        monkeypatch.setattr("raspirri.server.compiler.LATITUDE", "37.98")
+        monkeypatch.setattr("raspirri.server.compiler.LONGITUDE", "23.73")
+        json_data = {"days": "mon,thu", "tz_offset": 2, "cycles": [{"start": "sunrise+10min", "min": 10}], "out": 1}
+
+        services = Services()
+        assert services.store_program_cycles(json_data, store=True) is True
+        assert services.scheduler.get_job(REFRESH_JOB_ID) is not None
+        assert len(SchedulerRegistry().table) == 4
+        assert services.refresh_programs() == []
+
+    def test_store_program_cycles_solar_starts_without_location(self, monkeypatch):
+        """Raise LocationValueException if a cycle follows the sun and the device location is unknown."""
+        monkeypatch.setattr("raspirri.server.compiler.LATITUDE", "")
+        json_data = {"days": "mon", "tz_offset": 2, "cycles": [{"start": "sunset", "min": 10}], "out": 1}
+
+        with pytest.raises(LocationValueException):
+            Services().store_program_cycles(json_data)
+
+    def test_compile_program_cycles_with_timezone(self):
+        """Programs with an IANA timezone are compiled in local time and do not need tz_offset."""
+        json_data = {"days": "mon", "timezone": "Europe/Athens", "cycles": [{"start": "06:00", "min": 30}], "out": 2}
+
+        services = Services()
+        services.store_program_cycles(json_data)
+
+        assert SchedulerRegistry().zone_tables[0].zone == "Europe/Athens"
+        assert len(services.scheduler.get_jobs()) == 1
+        # 2024-04-01 06:00 EEST
+        job = services.scheduler.get_jobs()[0]
+        assert job.trigger.get_next_fire_time(None, datetime(2024, 3, 31, tzinfo=timezone.utc)) == datetime(
+            2024, 4, 1, 3, 0, tzinfo=timezone.utc
+        )
+
+    def test_store_program_cycles_invalid_timezone(self):
+        """Raise TimezoneValueException if the timezone is not an IANA timezone."""
+        json_data = {"days": "mon", "timezone": "Mars/Olympus", "cycles": [{"start": "06:00", "min": 30}], "out": 2}
+
+        with pytest.raises(TimezoneValueException):
+            Services().store_program_cycles(json_data)
+
+    def test_same_day_start_hour_equal_to_tz_offset(self):
+        """Returns the same day at midnight if start_hour is equal to tz_offset."""
+        services = Services()
+
+        adjusted_day, adjusted_start_hour = services.get_start_day_hour("mon", 2, 2)
+
+        assert adjusted_day == "mon"
+        assert adjusted_start_hour == 0
 
     def test_store_program_cycles_exception_due_to_tz_offset_does_not_exist(self):
         """Store program cycles Keyerror due to lack of tz_offset."""
@@ -563,3 +910,74 @@ class TestServices:
         """Should convert a 12-hour time string with 'am' to a 24-hour time string"""
         result = Services().convert_12h_to_24h(time_12h)
         assert result == time_24h
+
+    def test_pause_programs(self, mocker):
+        """Paused programs do not turn on valves until they resume."""
+        toggle = mocker.patch("raspirri.server.services.Helpers.toggle", return_value="OK")
+        services = Services()
+        assert services.get_paused_until() is None
+
+        until = services.pause_programs("2999-01-01T00:00:00")
+        assert until == "2999-01-01T00:00:00+00:00"
+        assert services.get_paused_until() == until
+        assert services.turn_on_from_program(1) == "PAUSED"
+        toggle.assert_not_called()
+        assert services.turn_off_from_program(1) == "OK"
+
+        assert services.pause_programs(datetime(2999, 1, 1, 2, 0, tzinfo=timezone(timedelta(hours=2)))) == until
+        assert services.pause_programs(0) is None
+        assert services.get_paused_until() is None
+        assert services.turn_on_from_program(1) == "OK"
+        toggle.assert_called_with(2, "out1")
+
+        services.pause_programs(32503680000)
+        services.resume_programs()
+        assert services.get_paused_until() is None
+
+    def test_pause_programs_until_utc_designator(self):
+        """An ISO 8601 string ending with the Z UTC designator is accepted."""
+        assert Services().pause_programs("2999-01-01T00:00:00Z") == "2999-01-01T00:00:00+00:00"
+
+    def test_pause_programs_invalid_until(self):
+        """Pausing needs a datetime, an ISO 8601 string or a timestamp."""
+        with pytest.raises(TypeError):
+            Services().pause_programs([2024])
+        with pytest.raises(ValueError):
+            Services().pause_programs("tomorrow")
+
+    def test_get_runs(self):
+        """Manual runs are a list of runs or valves running for the same minutes."""
+        services = Services()
+        assert services.get_runs({"runs": [{"out": 1, "min": "5"}, {"out": 3, "min": 10}]}) == [(1, 5), (3, 10)]
+        assert services.get_runs({"out": [1, 2, 3], "min": 5}) == [(1, 5), (2, 5), (3, 5)]
+        assert services.get_runs({"out": 2, "min": 5}) == [(2, 5)]
+        with pytest.raises(ValueError):
+            services.get_runs({"out": 2, "min": 0})
+        with pytest.raises(KeyError):
+            services.run_valves({"out": 2})
+        with pytest.raises(KeyError):
+            services.run_valves({})
+        with pytest.raises(ValueError):
+            services.get_runs({"out": 9, "min": 1})
+        with pytest.raises(ValueError):
+            services.get_runs({"runs": []})
+
+    def test_run_valves(self, mocker):
+        """A manual run turns on its valve now and schedules its turn off."""
+        toggle = mocker.patch("raspirri.server.services.Helpers.toggle", return_value="OK")
+        runs = Services().run_valves({"out": 1, "min": 5})
+        toggle.assert_called_once_with(2, "out1")
+        assert [run["out"] for run in runs] == [1]
+        assert Services().run_valves({"cancel": True}) == []
+        toggle.assert_called_with(0, "out1")
+
+    def test_run_valves_while_paused(self, mocker):
+        """A manual run turns on its valve while the programs are paused."""
+        toggle = mocker.patch("raspirri.server.services.Helpers.toggle", return_value="OK")
+        services = Services()
+        services.pause_programs(datetime.now(timezone.utc) + timedelta(hours=5))
+
+        runs = services.run_valves({"out": 3, "min": 5})
+
+        toggle.assert_called_once_with(2, "out3")
+        assert [run["out"] for run in runs] == [3]
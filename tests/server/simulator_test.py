@@ -0,0 +1,101 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+from datetime import datetime, timezone
+import pytest
+from raspirri.server.scheduler import SchedulerRegistry
+from raspirri.server.simulator import ScheduleSimulator
+from raspirri.server.store import ProgramStore, ScheduleStore
+from raspirri.main_app import simulate
+
+# 2024-03-18 is a Monday
+START = datetime(2024, 3, 18, tzinfo=timezone.utc)
+
+PROGRAMS = [
+    {
+        "days": "mon,wed",
+        "tz_offset": 2,
+        "cycles": [{"start": "08:00", "min": 30}, {"start": "20:00", "min": 90}],
+        "out": 1,
+    },
+    {"days": "sun", "timezone": "Europe/Athens", "cycles": [{"start": "06:00", "min": 15}], "out": 2},
+]
+
+
+class TestScheduleSimulator:
+    """ScheduleSimulator Test Class"""
+
+    def test_run_timeline_and_totals(self):
+        """the simulator returns the on/off timeline and totals of every valve"""
+        result = ScheduleSimulator(PROGRAMS).run(START, weeks=2)
+
+        assert result["timeline"]["1"][:2] == [
+            ("2024-03-18T06:00:00+00:00", "2024-03-18T06:30:00+00:00"),
+            ("2024-03-18T18:00:00+00:00", "2024-03-18T19:30:00+00:00"),
+        ]
+        assert result["totals"]["1"] == {"runs": 8, "min": 8 * 60}
+        # the daylight saving time change of 2024-03-31 moves the UTC start time one hour earlier
+        assert result["timeline"]["2"] == [
+            ("2024-03-24T04:00:00+00:00", "2024-03-24T04:15:00+00:00"),
+            ("2024-03-31T03:00:00+00:00", "2024-03-31T03:15:00+00:00"),
+        ]
+        assert result["totals"]["2"] == {"runs": 2, "min": 30}
+
+    def test_run_does_not_touch_scheduler_or_stores(self, mocker):
+        """simulating programs neither schedules them nor opens the schedule and program stores"""
+        SchedulerRegistry.destroy_instance()
+        registry = mocker.spy(SchedulerRegistry, "__new__")
+        stores = [mocker.spy(ScheduleStore, "__init__"), mocker.spy(ProgramStore, "__new__")]
+        ScheduleSimulator(PROGRAMS).run(START)
+        registry.assert_not_called()
+        for store in stores:
+            store.assert_not_called()
+
+    def test_run_closes_open_runs_at_the_end(self):
+        """a valve still open at the end of the simulation is closed at the end"""
+        program = {"days": "sun", "tz_offset": 0, "cycles": [{"start": "23:00", "min": 120}], "out": 3}
+        result = ScheduleSimulator([program]).run(START, weeks=1)
+        assert result["timeline"]["3"] == [("2024-03-24T23:00:00+00:00", "2024-03-25T00:00:00+00:00")]
+
+    def test_simulate_command(self, tmp_path, capsys):
+        """the simulate command reads programs from a JSON file"""
+        programs_file = tmp_path / "programs.json"
+        programs_file.write_text(json.dumps(PROGRAMS[0]))
+
+        result = simulate(str(programs_file), 4)
+
+        assert result["totals"]["1"]["runs"] == 16
+        assert result["weeks_per_second"] > 0
+        assert json.loads(capsys.readouterr().out)["totals"] == result["totals"]
+
+    @pytest.mark.benchmark(group="simulator")
+    def test_benchmark_simulated_weeks_per_second(self, benchmark):
+        """benchmark a year of simulated irrigation"""
+        simulator = ScheduleSimulator(PROGRAMS)
+        result = benchmark(simulator.run, START, 52)
+        assert result["totals"]["1"]["runs"] == 52 * 4
+        assert simulator.benchmark(52, START) > 52
@@ -0,0 +1,82 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from datetime import date
+import pytest
+from raspirri.server.solar import SUNRISE, SUNSET, SolarTable, parse_solar_start, solar_table
+
+# Athens, Greece
+LATITUDE = 37.98
+LONGITUDE = 23.73
+
+
+class TestSolar:
+    """
+    Solar Test Class
+    """
+
+    @pytest.mark.parametrize(
+        "start, expected",
+        [
+            ("sunrise", (SUNRISE, 0)),
+            ("Sunrise-30min", (SUNRISE, -30)),
+            ("sunset + 15", (SUNSET, 15)),
+            ("06:00", None),
+            ("sunrise*2", None),
+        ],
+    )
+    def test_parse_solar_start(self, start, expected):
+        """Parse the cycle starts relative to sunrise or sunset."""
+        assert parse_solar_start(start) == expected
+
+    def test_solar_table_matches_published_times(self):
+        """The table matches the published sun times of Athens within two minutes."""
+        table = SolarTable(LATITUDE, LONGITUDE, 2024)
+
+        assert len(table) == 366
+        # 06:02 and 20:51 EEST on the summer solstice, 07:37 and 17:09 EET on the winter solstice
+        assert abs(table.event(SUNRISE, date(2024, 6, 21)) - (3 * 60 + 2)) <= 2
+        assert abs(table.event(SUNSET, date(2024, 6, 21)) - (17 * 60 + 51)) <= 2
+        assert abs(table.event(SUNRISE, date(2024, 12, 21)) - (5 * 60 + 37)) <= 2
+        assert abs(table.event(SUNSET, date(2024, 12, 21)) - (15 * 60 + 9)) <= 2
+
+    def test_solar_table_polar_day_and_night(self):
+        """Where the sun does not rise or set, sunrise and sunset still fall within the day."""
+        table = SolarTable(78.0, 15.0, 2023)
+
+        assert len(table) == 365
+        for day in (date(2023, 6, 21), date(2023, 12, 21)):
+            assert 0 <= table.event(SUNRISE, day) < 1440
+            assert 0 <= table.event(SUNSET, day) < 1440
+
+    def test_solar_table_is_built_once(self):
+        """The table of a location and year is built once."""
+        assert solar_table(LATITUDE, LONGITUDE, 2024) is solar_table(LATITUDE, LONGITUDE, 2024)
+
+    def test_solar_table_invalid_location(self):
+        """Raise ValueError for a location outside the globe."""
+        with pytest.raises(ValueError):
+            SolarTable(91.0, 0.0, 2024)
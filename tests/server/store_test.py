@@ -0,0 +1,179 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import date
+import pytest
+from raspirri.server.store import ProgramStore, ScheduleStore
+from raspirri.server.const import SCHEDULE_DB, PROGRAM
+from raspirri.server.schedule import ON, OFF, CompiledProgram, RunCalendar, minute_of_week
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A schedule store in a temporary directory."""
+    return ScheduleStore(str(tmp_path / "schedule.db"))
+
+
+@pytest.fixture
+def program_store():
+    """A ProgramStore on an empty schedule database."""
+    ProgramStore.destroy_instance()
+    if os.path.exists(SCHEDULE_DB):
+        os.remove(SCHEDULE_DB)
+    yield ProgramStore()
+    ProgramStore.destroy_instance()
+    if os.path.exists(SCHEDULE_DB):
+        os.remove(SCHEDULE_DB)
+
+
+class TestScheduleStore:
+    """ScheduleStore Test Class"""
+
+    def test_save_and_load_recurring_program(self, store):
+        """a recurring program is loaded back with its calendar"""
+        cycles = {("1", "mon", "08:00", 10, "UTC"): ((minute_of_week(0, 8, 0), 1, ON), (minute_of_week(0, 8, 10), 1, OFF))}
+        calendar = RunCalendar(every=2, first=date(2024, 1, 1))
+        store.save_program(1, CompiledProgram("digest", cycles, "UTC", calendar=calendar))
+
+        assert store.load_programs()["1"].calendar == calendar
+
+    def test_adds_calendar_to_older_databases(self, tmp_path):
+        """databases created before recurring programs get the calendar column"""
+        filename = str(tmp_path / "old.db")
+        connection = sqlite3.connect(filename)
+        connection.execute("CREATE TABLE programs (valve TEXT PRIMARY KEY, digest TEXT, zone TEXT, priority INTEGER, cycles BLOB)")
+        connection.close()
+
+        store = ScheduleStore(filename)
+        store.save_program(1, CompiledProgram("digest", {}))
+        assert store.load_programs()["1"].calendar is None
+
+    def test_save_and_load_program(self, store):
+        """a compiled program is loaded back with its digest, cycles and events"""
+        cycles = {("1", "mon", "08:00", 10, 0): ((minute_of_week(0, 8, 0), 1, ON), (minute_of_week(0, 8, 10), 1, OFF))}
+        store.save_program(1, CompiledProgram("digest", cycles))
+
+        program = store.load_programs()["1"]
+        assert program.digest == "digest"
+        assert program.cycles == cycles
+        assert list(program.table) == [(minute_of_week(0, 8, 0), 1, ON), (minute_of_week(0, 8, 10), 1, OFF)]
+
+    def test_save_program_replaces_previous(self, store):
+        """saving a program of a valve replaces the previous one"""
+        store.save_program(1, CompiledProgram("first", {}))
+        store.save_program(1, CompiledProgram("second", {}, "Europe/Athens"))
+        programs = store.load_programs()
+        assert list(programs) == ["1"]
+        assert programs["1"].digest == "second"
+        assert programs["1"].zone == "Europe/Athens"
+
+    def test_delete_program(self, store):
+        """a deleted program is not loaded"""
+        store.save_program(1, CompiledProgram("digest", {}))
+        store.delete_program(1)
+        assert store.load_programs() == {}
+
+    def test_program_data(self, store):
+        """program JSON data is stored, replaced and deleted"""
+        store.save_program_data(1, {"out": 1, "days": "mon"})
+        store.save_program_data(1, {"out": 1, "days": "tue"})
+        store.save_program_data(2, {"out": 2, "days": "wed"})
+        assert store.load_program_data() == {"1": {"out": 1, "days": "tue"}, "2": {"out": 2, "days": "wed"}}
+        store.delete_program_data(1)
+        assert list(store.load_program_data()) == ["2"]
+
+    def test_values(self, store):
+        """settings are stored and read back"""
+        assert store.load_value("last_dispatch") is None
+        assert store.load_value("last_dispatch", "default") == "default"
+        store.save_value("last_dispatch", "2024-01-01T10:05:00+00:00")
+        assert ScheduleStore(store.filename).load_value("last_dispatch") == "2024-01-01T10:05:00+00:00"
+
+
+class TestProgramStore:
+    """ProgramStore Test Class"""
+
+    def test_returns_single_instance(self, program_store):
+        """a single instance of ProgramStore class"""
+        assert ProgramStore() is program_store
+
+    def test_save_get_delete(self, program_store):
+        """programs are kept in the index and in the database"""
+        assert program_store.get(1) is None
+        program_store.save(1, {"out": 1})
+        program_store.save("10", {"out": 10})
+        program_store.save(2, {"out": 2})
+        assert program_store.get("1") == {"out": 1}
+        assert program_store.valves == ["1", "2", "10"]
+
+        ProgramStore.destroy_instance()
+        assert ProgramStore().get(10) == {"out": 10}
+        assert ProgramStore().delete(10) is True
+        assert ProgramStore().delete(10) is False
+        assert ScheduleStore().load_program_data() == {"1": {"out": 1}, "2": {"out": 2}}
+
+    def test_migrate_program_files(self, program_store, tmp_path):
+        """legacy program files are moved into the store"""
+        (tmp_path / f"{PROGRAM}3.json").write_text(json.dumps({"out": 3}), encoding="utf-8")
+        (tmp_path / f"{PROGRAM}4.json").write_text("not json", encoding="utf-8")
+        (tmp_path / "other.json").write_text("{}", encoding="utf-8")
+
+        assert program_store.migrate_program_files(str(tmp_path)) == ["3"]
+        assert program_store.get(3) == {"out": 3}
+        assert sorted(os.listdir(tmp_path)) == sorted([f"{PROGRAM}4.json", "other.json"])
+
+    def test_payloads_are_cached_until_programs_change(self, program_store, mocker):
+        """program payloads are serialized once and again after a change"""
+        program_store.save(2, {"out": 2, "enabled": True})
+        program_store.save(1, {"out": 1})
+        dumps = mocker.spy(json, "dumps")
+
+        assert program_store.get_payload(2) == b'{"out": 2, "enabled": true}'
+        assert program_store.get_payload(2) is program_store.get_payload(2)
+        assert program_store.get_payload(3) is None
+        assert program_store.config_payload() == b'[{"out": 1}, {"out": 2, "enabled": true}]'
+        assert program_store.config_payload() is program_store.config_payload()
+        assert dumps.call_count == 2
+
+        program_store.delete(2)
+        assert program_store.get_payload(2) is None
+        assert program_store.config_payload() == b'[{"out": 1}]'
+
+    def test_water_budgets(self, program_store):
+        """water budgets of valves fall back to the budget of the device and survive a restart"""
+        assert program_store.budget_percent(1, 7) == 100
+        program_store.set_budget(None, [50] * 6 + [120] * 6)
+        program_store.set_budget(2, 80)
+        ProgramStore.destroy_instance()
+
+        assert ProgramStore().budgets == {"": [50] * 6 + [120] * 6, "2": 80}
+        assert ProgramStore().budget_percent(1, 7) == 120
+        assert ProgramStore().budget_percent(2, 7) == 80
+        ProgramStore().set_budget(2, None)
+        assert ProgramStore().budget_percent(2, 1) == 50
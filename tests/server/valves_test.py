@@ -0,0 +1,121 @@
+"""MIT License
+
+Copyright (c) 2023, Marios Karagiannopoulos
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+**Attribution Requirement:**
+When using or distributing the software, an attribution to Marios Karagiannopoulos must be included.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import threading
+import pytest
+from raspirri.server.exceptions import ValveValueException
+from raspirri.server.valves import ValveBank, ValveStateStore
+
+
+class TestValveBank:
+    """
+    ValveBank Test Class
+    """
+
+    def test_set_and_get(self):
+        """Valves are addressed by name or number."""
+        bank = ValveBank(4).with_statuses({"out2": 1, 4: 1}).with_statuses({"4": 0})
+
+        assert bank.mask == 0b10
+        assert bank.get(2) == 1
+        assert bank.get("out1") == 0
+
+    def test_to_dict_matches_the_statuses_shape(self):
+        """The bank converts to the statuses dict of the MQTT and HTTP APIs."""
+        bank = ValveBank(4, mask=0b1001, valves=[1, 4])
+
+        assert bank.to_dict() == {"valves": [1, 4], "out1": 1, "out2": 0, "out3": 0, "out4": 1}
+
+    def test_from_dict_round_trip(self):
+        """A statuses dict converts back to the same bank, ignoring the other keys."""
+        bank = ValveBank(32, mask=1 << 31 | 1, valves=list(range(1, 33)))
+        statuses = bank.to_dict()
+        statuses["server_time"] = "2024/06/01 10:00:00"
+
+        assert ValveBank.from_dict(statuses, 32) == bank
+        assert ValveBank.from_dict({"out1": 1}, 4).to_dict() == {"valves": [], "out1": 1, "out2": 0, "out3": 0, "out4": 0}
+
+    def test_configurable_count(self):
+        """The valve count sets the reported valves."""
+        bank = ValveBank(16).with_statuses({"out16": 1})
+
+        assert len(bank) == 16
+        assert bank.names[-1] == "out16"
+        assert bank.to_dict()["out16"] == 1
+
+    @pytest.mark.parametrize("valve", ["out5", 0, 5, None])
+    def test_unknown_valve(self, valve):
+        """A valve outside the bank is rejected."""
+        with pytest.raises(ValveValueException):
+            ValveBank(4).with_statuses({valve: 1})
+
+    def test_slots(self):
+        """The bank has no per-instance dict."""
+        with pytest.raises(AttributeError):
+            ValveBank(4).extra = 1
+
+    def test_banks_are_immutable_snapshots(self):
+        """Changes return a new bank and leave the snapshot as it was."""
+        bank = ValveBank(4, valves=[1, 2])
+        changed = bank.with_statuses({"out1": 1}).with_valves([1])
+
+        assert bank.to_dict() == {"valves": [1, 2], "out1": 0, "out2": 0, "out3": 0, "out4": 0}
+        assert changed.to_dict() == {"valves": [1], "out1": 1, "out2": 0, "out3": 0, "out4": 0}
+        bank.to_dict()["valves"].append(3)
+        assert bank.valves == [1, 2]
+
+
+class TestValveStateStore:
+    """
+    ValveStateStore Test Class
+    """
+
+    def test_stress_concurrent_writers_and_readers(self):
+        """Thousands of concurrent toggles are not lost, and readers never see a half applied change."""
+        store = ValveStateStore(ValveBank(32))
+        torn = []
+
+        def write(valve):
+            # every change turns a valve and its pair 16 valves up on or off together
+            for index in range(2000):
+                store.update({valve: index % 2, valve + 16: index % 2})
+            store.update({valve: 1, valve + 16: 1})
+
+        def read():
+            for _ in range(5000):
+                mask = store.snapshot.mask
+                if mask & 0xFFFF != mask >> 16:
+                    torn.append(mask)
+
+        threads = [threading.Thread(target=write, args=(valve,)) for valve in range(1, 17)]
+        threads += [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not torn
+        assert store.snapshot.mask == 0xFFFFFFFF